@@ -0,0 +1,180 @@
+"""
+Модуль онлайн резервного копирования SQLite
+
+Снимок базы делается через SQLite online backup API прямо из процесса бота:
+- копирование идет шагами по BACKUP_PAGES страниц с паузой между шагами,
+  в режиме WAL копирующее соединение только читает и не блокирует писателей
+- снимок пишется во временный файл, проверяется PRAGMA integrity_check
+  и только потом переименовывается в butler_backup_YYYYmmdd_HHMMSS.db
+- хранятся последние BACKUP_KEEP снимков, более старые удаляются
+
+Запись в базу из другого соединения перезапускает пошаговое копирование
+с начала. После BACKUP_MAX_RESTARTS перезапусков снимок делается одним шагом
+(это одна читающая транзакция, писатели в WAL по-прежнему не ждут).
+
+Запуск вручную:
+    python backup.py create                   # сделать снимок
+    python backup.py list                     # список снимков
+    python backup.py restore <снимок>         # восстановить (бот должен быть остановлен)
+"""
+import argparse
+import datetime
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import List
+
+from metrics import metrics
+
+# Константы
+BACKUP_PAGES = 64  # страниц за шаг
+BACKUP_STEP_SLEEP = 0.02  # секунды между шагами
+BACKUP_MAX_RESTARTS = 3
+BACKUP_KEEP = 7
+BACKUP_PREFIX = 'butler_backup_'
+
+logger = logging.getLogger(__name__)
+
+
+class BackupAborted(Exception):
+    """Пошаговое копирование прервано (слишком много перезапусков)"""
+
+
+def check_integrity(path: str) -> bool:
+    """Проверяет файл базы через PRAGMA integrity_check"""
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchall()
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+    return result == [('ok',)]
+
+
+class BackupManager:
+    def __init__(self, db_path: str, backup_dir: str = None, keep: int = BACKUP_KEEP,
+                 pages: int = BACKUP_PAGES):
+        if keep < 1:
+            raise ValueError(f"Нужно хранить хотя бы один снимок, keep={keep}")
+        self.db_path = db_path
+        self.backup_dir = backup_dir or os.path.join(
+            os.path.dirname(os.path.abspath(db_path)), 'backups'
+        )
+        self.keep = keep
+        self.pages = pages
+
+    def list_backups(self) -> List[str]:
+        """Возвращает пути снимков от старых к новым"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return [
+            os.path.join(self.backup_dir, name)
+            for name in sorted(os.listdir(self.backup_dir))
+            if name.startswith(BACKUP_PREFIX) and name.endswith('.db')
+        ]
+
+    def _copy(self, source: sqlite3.Connection, target: sqlite3.Connection):
+        state = {'remaining': None, 'restarts': 0}
+
+        def progress(status, remaining, total):
+            # Рост оставшегося числа страниц означает перезапуск копирования
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > BACKUP_MAX_RESTARTS:
+                    raise BackupAborted(f"{state['restarts']} перезапусков")
+            state['remaining'] = remaining
+            # sqlite3 сам делает паузу только при SQLITE_BUSY, поэтому шаги разносим здесь
+            if remaining:
+                time.sleep(BACKUP_STEP_SLEEP)
+
+        try:
+            source.backup(target, pages=self.pages, progress=progress)
+        except BackupAborted as e:
+            logger.warning("Пошаговое копирование прервано (%s), копирую одним шагом", e)
+            metrics.increment('backup.single_step_fallbacks')
+            source.backup(target)
+
+    def create_backup(self) -> str:
+        """Делает проверенный снимок базы и удаляет лишние старые снимки"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        started = time.monotonic()
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.backup_dir, f"{BACKUP_PREFIX}{timestamp}.db")
+        part_path = path + '.part'
+
+        try:
+            with closing(sqlite3.connect(self.db_path)) as source, \
+                    closing(sqlite3.connect(part_path)) as target:
+                self._copy(source, target)
+        except Exception:
+            # Недописанный снимок удаляется, иначе .part копились бы в backup_dir
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            metrics.increment('backup.failures')
+            raise
+
+        if not check_integrity(part_path):
+            os.remove(part_path)
+            metrics.increment('backup.failures')
+            raise sqlite3.DatabaseError(f"Снимок {path} не прошел integrity_check")
+
+        os.replace(part_path, path)
+        self.rotate()
+
+        metrics.increment('backup.snapshots')
+        metrics.set_gauge('backup.last_duration_ms', int((time.monotonic() - started) * 1000))
+        metrics.set_gauge('backup.last_snapshot_at', datetime.datetime.now().isoformat())
+        return path
+
+    def rotate(self):
+        """Оставляет только последние keep снимков"""
+        backups = self.list_backups()
+        for path in backups[:max(len(backups) - self.keep, 0)]:
+            os.remove(path)
+
+    def restore(self, backup_path: str):
+        """Восстанавливает базу из снимка (бот должен быть остановлен)"""
+        if not check_integrity(backup_path):
+            raise sqlite3.DatabaseError(f"Снимок {backup_path} поврежден, восстановление отменено")
+
+        source = sqlite3.connect(backup_path)
+        target = sqlite3.connect(self.db_path)
+        try:
+            # Копирование в существующую базу корректно обновляет и ее WAL
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Резервное копирование базы Butler Bot")
+    parser.add_argument('--db', help="путь к базе (по умолчанию как у бота)")
+    parser.add_argument('--dir', help="каталог снимков (по умолчанию backups рядом с базой)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('create', help="сделать снимок")
+    subparsers.add_parser('list', help="список снимков")
+    restore_parser = subparsers.add_parser('restore', help="восстановить базу из снимка")
+    restore_parser.add_argument('backup', help="путь к снимку")
+    args = parser.parse_args()
+
+    db_path = args.db or Database.get_default_path()
+    manager = BackupManager(db_path, args.dir or os.environ.get('BACKUP_DIR'))
+
+    if args.command == 'create':
+        print(f"✅ Снимок создан: {manager.create_backup()}")
+    elif args.command == 'list':
+        for path in manager.list_backups():
+            print(path)
+    elif args.command == 'restore':
+        manager.restore(args.backup)
+        print(f"✅ База {db_path} восстановлена из {args.backup}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Микробенчмарк и fuzz-проверка парсера даты и времени
+
+- Сравнивает скорость ReminderManager.parse_datetime_input с прежней
+  реализацией (перебор шести форматов strptime)
+- Прогоняет мутации корпуса benchmarks/data/datetime_corpus.txt: парсер
+  не должен падать, а на вводе в прежних форматах должен давать тот же
+  результат, что и прежняя реализация
+
+Запуск: python benchmarks/bench_datetime_parser.py [число мутаций]
+"""
+import datetime
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reminders import ReminderManager
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'datetime_corpus.txt')
+NOW = datetime.datetime(2025, 10, 17, 10, 15, 40)
+ALPHABET = "0123456789.:/-, вчерзатпнсдьмиу"
+
+LEGACY_DATE_FORMATS = ["%d.%m.%Y", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%y", "%d/%m/%y", "%d-%m-%y"]
+
+
+def legacy_parse_time_input(time_input):
+    """Прежний parse_time_input"""
+    try:
+        time_input = time_input.strip().replace(".", ":")
+        if ":" in time_input:
+            parts = time_input.split(":")
+            if len(parts) != 2:
+                return None
+            hour, minute = int(parts[0]), int(parts[1])
+        else:
+            hour, minute = int(time_input), 0
+        if 0 <= hour <= 23 and 0 <= minute <= 59:
+            return f"{hour:02d}:{minute:02d}"
+        return None
+    except (ValueError, IndexError):
+        return None
+
+
+def legacy_parse_datetime_input(date_input, time_input, now):
+    """Прежний parse_datetime_input (с явным now)"""
+    time_str = legacy_parse_time_input(time_input)
+    if not time_str:
+        return None
+    hour, minute = map(int, time_str.split(":"))
+
+    target_date = None
+    for date_format in LEGACY_DATE_FORMATS:
+        try:
+            target_date = datetime.datetime.strptime(date_input.strip(), date_format).date()
+            break
+        except ValueError:
+            continue
+    if not target_date:
+        return None
+
+    target_datetime = datetime.datetime.combine(target_date, datetime.time(hour, minute))
+    return target_datetime if target_datetime > now else None
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding='utf-8') as corpus_file:
+        return [line.rstrip('\n') for line in corpus_file if line.strip() and not line.startswith('#')]
+
+
+def mutate(rng, text):
+    """Случайная вставка, удаление или замена символа"""
+    chars = list(text)
+    for _ in range(rng.randint(1, 3)):
+        position = rng.randint(0, len(chars))
+        operation = rng.random()
+        if operation < 0.4 or not chars:
+            chars.insert(position, rng.choice(ALPHABET))
+        elif operation < 0.7:
+            del chars[min(position, len(chars) - 1)]
+        else:
+            chars[min(position, len(chars) - 1)] = rng.choice(ALPHABET)
+    return ''.join(chars)
+
+
+def is_legacy_format(date_input, time_input):
+    """Ввод, который прежний парсер понимал по определению формата"""
+    return (legacy_parse_time_input(time_input) is not None
+            and all(char.isdigit() or char in ".:/- " for char in date_input + time_input)
+            and '-' not in time_input
+            and date_input.strip().count(' ') == 0)
+
+
+def check(manager, date_input, time_input):
+    """Проверяет один ввод; возвращает описание расхождения или None"""
+    result = manager.parse_datetime_input(date_input, time_input, NOW)
+    if result is not None and result <= NOW:
+        return f"время в прошлом: {date_input!r} {time_input!r} -> {result}"
+
+    if is_legacy_format(date_input, time_input):
+        expected = legacy_parse_datetime_input(date_input, time_input, NOW)
+        # Новый парсер дополнительно понимает дату без года
+        if expected is not None and result != expected:
+            return f"расхождение: {date_input!r} {time_input!r} -> {result}, ожидалось {expected}"
+
+    manager.parse_datetime_text(f"{date_input} {time_input}", NOW)
+    manager.parse_date_input(date_input, NOW)
+    return None
+
+
+def main():
+    mutations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    manager = ReminderManager()
+    corpus = [line.split('|') if '|' in line else [line, ''] for line in load_corpus()]
+
+    # Микробенчмарк на вводе в прежних форматах
+    legacy_inputs = [(date_input, time_input) for date_input, time_input in corpus
+                     if is_legacy_format(date_input, time_input)]
+    number = 2000
+    new_time = timeit.timeit(
+        lambda: [manager.parse_datetime_input(d, t, NOW) for d, t in legacy_inputs], number=number
+    )
+    old_time = timeit.timeit(
+        lambda: [legacy_parse_datetime_input(d, t, NOW) for d, t in legacy_inputs], number=number
+    )
+    calls = number * len(legacy_inputs)
+    print(f"strptime (прежний): {old_time / calls * 1e6:7.2f} мкс/ввод")
+    print(f"regex (новый):      {new_time / calls * 1e6:7.2f} мкс/ввод")
+
+    # Fuzz: мутации корпуса
+    rng = random.Random(42)
+    failures = []
+    for date_input, time_input in corpus:
+        failure = check(manager, date_input, time_input)
+        if failure:
+            failures.append(failure)
+
+    for _ in range(mutations):
+        date_input, time_input = rng.choice(corpus)
+        if rng.random() < 0.5:
+            date_input = mutate(rng, date_input)
+        else:
+            time_input = mutate(rng, time_input)
+        try:
+            failure = check(manager, date_input, time_input)
+        except Exception as e:
+            failure = f"исключение {e!r}: {date_input!r} {time_input!r}"
+        if failure:
+            failures.append(failure)
+
+    print(f"fuzz: {mutations} мутаций, ошибок: {len(failures)}")
+    for failure in failures[:20]:
+        print(f"  {failure}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
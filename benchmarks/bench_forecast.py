@@ -0,0 +1,81 @@
+"""
+Бенчмарк сводки прогноза на день
+
+Замеряет analyze_forecast и format_weather_message на заглушках ответа
+WeatherAPI (без сетевых вызовов) и проверяет, что на одно сообщение
+приходится ровно один запрос к API.
+
+Запуск: python benchmarks/bench_forecast.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from weather import WeatherService, analyze_forecast
+
+DAY_START_EPOCH = 1760821200  # 00:00 по Москве
+CONDITIONS = ["Ясно", "Переменная облачность", "Небольшой дождь", "Пасмурно"]
+
+
+def make_stub_payload(seed: int, current_hour: int = 8):
+    """Собирает ответ forecast.json на один день с 24 часами прогноза"""
+    rng = random.Random(seed)
+    hours = []
+    for hour in range(24):
+        temp_c = round(10 + 8 * rng.random() - abs(hour - 14) * 0.5, 1)
+        hours.append({
+            'time_epoch': DAY_START_EPOCH + hour * 3600,
+            'time': f"2025-10-19 {hour:02d}:00",
+            'temp_c': temp_c,
+            'feelslike_c': round(temp_c - 2 * rng.random(), 1),
+            'wind_kph': round(25 * rng.random(), 1),
+            'gust_kph': round(35 * rng.random(), 1),
+            'chance_of_rain': rng.choice([0, 0, 10, 40, 60, 85]),
+            'condition': {'text': rng.choice(CONDITIONS)}
+        })
+
+    current = dict(hours[current_hour])
+    current.update({
+        'last_updated_epoch': DAY_START_EPOCH + current_hour * 3600 + 900,
+        'wind_dir': 'NW'
+    })
+
+    return {
+        'location': {'name': 'Нижний Новгород'},
+        'current': current,
+        'forecast': {'forecastday': [{'hour': hours}]}
+    }
+
+
+def main():
+    payloads = [make_stub_payload(seed) for seed in range(100)]
+    calls = {'count': 0}
+
+    # Без кэша: каждое сообщение запрашивает данные
+    service = WeatherService(refresh_interval=0)
+
+    def stub_get_weather_data():
+        calls['count'] += 1
+        return payloads[calls['count'] % len(payloads)]
+
+    service.get_weather_data = stub_get_weather_data
+
+    number = 20000
+    analyze_time = timeit.timeit(
+        lambda: analyze_forecast(payloads[0]), number=number
+    )
+    calls['count'] = 0
+    format_time = timeit.timeit(service.format_weather_message, number=number)
+
+    print(f"analyze_forecast:       {analyze_time / number * 1e6:8.2f} мкс/вызов")
+    print(f"format_weather_message: {format_time / number * 1e6:8.2f} мкс/вызов")
+    print(f"запросов к API на сообщение: {calls['count'] / number:.1f}")
+    print()
+    print(service.format_weather_message())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Бенчмарк поиска задач /find на полнотекстовом индексе FTS5
+
+Засевает временную базу SQLite задачами (по умолчанию 1 000 000: половина
+ежедневных, половина разовых) от обычных пользователей и нескольких
+"тяжелых" с тысячами задач. Задачи вставляются обычным INSERT, так что
+индекс tasks_fts заполняют триггеры - замеряется и их стоимость.
+
+Затем сравнивает Database.search_tasks с прежним способом найти задачу -
+выгрузить все задачи пользователя (get_user_daily_tasks и
+get_user_one_time_tasks) и отфильтровать их в Python.
+
+Запуск:
+    python benchmarks/bench_search.py
+    python benchmarks/bench_search.py --tasks 100000 --users 2000
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from storage import get_search_terms
+
+DEFAULT_TASKS = 1_000_000
+DEFAULT_USERS = 20_000
+HEAVY_USERS = 5
+HEAVY_USER_TASKS = 5_000
+QUERIES = 200
+SCAN_QUERIES = 20  # прежний путь медленный, хватает меньшей выборки
+INSERT_BATCH = 10_000
+
+VERBS = ["Позвонить", "Купить", "Оплатить", "Записаться", "Проверить", "Отправить",
+         "Забрать", "Полить", "Почистить", "Выпить", "Прочитать", "Написать"]
+OBJECTS = ["маме", "молоко", "интернет", "к врачу", "почту", "посылку", "цветы",
+           "зубы", "таблетки", "книгу", "отчет", "в фитнес зал", "квартплату",
+           "машину", "ёлку", "документы", "бабушке", "хлеб", "кота", "лекарства"]
+DETAILS = ["", "", "", "срочно", "вечером", "до обеда", "не забыть", "в субботу",
+           "по дороге домой", "на работе"]
+
+
+def make_task_name(rng: random.Random) -> str:
+    return " ".join(part for part in (
+        rng.choice(VERBS), rng.choice(OBJECTS), rng.choice(DETAILS)
+    ) if part)
+
+
+def seed(db: Database, tasks: int, users: int, rng: random.Random) -> float:
+    """Вставляет задачи (индекс строят триггеры), возвращает время в секундах"""
+    heavy_total = HEAVY_USERS * HEAVY_USER_TASKS
+    owners = [user_id for user_id in range(1, HEAVY_USERS + 1)
+              for _ in range(HEAVY_USER_TASKS)]
+    owners += [rng.randint(HEAVY_USERS + 1, users) for _ in range(max(tasks - heavy_total, 0))]
+    rng.shuffle(owners)
+
+    start = datetime.datetime(2025, 1, 6)
+    started = time.perf_counter()
+    with sqlite3.connect(db.db_path) as conn:
+        conn.executemany("INSERT INTO users (user_id, first_name) VALUES (?, ?)",
+                         [(user_id, f"User {user_id}") for user_id in range(1, users + 1)])
+        for offset in range(0, len(owners), INSERT_BATCH):
+            batch = owners[offset:offset + INSERT_BATCH]
+            daily = [(user_id, make_task_name(rng), f"{rng.randrange(24):02d}:{rng.randrange(60):02d}")
+                     for user_id in batch[::2]]
+            one_time = [(user_id, make_task_name(rng),
+                         (start + datetime.timedelta(minutes=rng.randrange(525600))).isoformat())
+                        for user_id in batch[1::2]]
+            conn.executemany(
+                "INSERT INTO daily_tasks (user_id, task_name, time) VALUES (?, ?, ?)", daily
+            )
+            conn.executemany(
+                "INSERT INTO one_time_tasks (user_id, task_name, scheduled_datetime) VALUES (?, ?, ?)",
+                one_time
+            )
+            conn.commit()
+    return time.perf_counter() - started
+
+
+def scan_tasks(db: Database, user_id: int, query: str) -> list:
+    """Прежний путь: все задачи пользователя и фильтр в Python"""
+    terms = get_search_terms(query)
+    tasks = db.get_user_daily_tasks(user_id) + db.get_user_one_time_tasks(user_id)
+    return [
+        task for task in tasks
+        if all(any(word.startswith(term) for word in get_search_terms(task['task_name']))
+               for term in terms)
+    ]
+
+
+def measure(func, cases) -> dict:
+    durations = []
+    for args in cases:
+        started = time.perf_counter()
+        func(*args)
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return {
+        'mean': statistics.mean(durations),
+        'p50': durations[len(durations) // 2],
+        'p95': durations[int(len(durations) * 0.95)],
+        'max': durations[-1],
+    }
+
+
+def print_row(name: str, stats: dict):
+    print(f"{name:<38} среднее {stats['mean']:7.2f} мс  p50 {stats['p50']:7.2f}  "
+          f"p95 {stats['p95']:7.2f}  максимум {stats['max']:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска задач /find")
+    parser.add_argument('--tasks', type=int, default=DEFAULT_TASKS)
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'bench_search.db'))
+        seconds = seed(db, args.tasks, args.users, rng)
+        size_mb = os.path.getsize(db.db_path) / 1024 / 1024
+        print(f"📥 {args.tasks} задач, {args.users} пользователей: вставка с индексом "
+              f"{seconds:.1f} с ({args.tasks / seconds:,.0f} задач/с), база {size_mb:.0f} МБ")
+
+        words = [get_search_terms(word)[0] for word in VERBS + OBJECTS]
+        queries = [rng.choice(words)[:rng.randint(3, 6)] for _ in range(QUERIES)]
+        two_words = [f"{rng.choice(VERBS)} {rng.choice(OBJECTS)}" for _ in range(QUERIES)]
+        regular = [rng.randint(HEAVY_USERS + 1, args.users) for _ in range(QUERIES)]
+        heavy = [rng.randint(1, HEAVY_USERS) for _ in range(QUERIES)]
+
+        print()
+        print_row("FTS5, обычный пользователь", measure(
+            db.search_tasks, list(zip(regular, queries))))
+        print_row("FTS5, обычный, два слова", measure(
+            db.search_tasks, list(zip(regular, two_words))))
+        print_row(f"FTS5, {HEAVY_USER_TASKS} задач у пользователя", measure(
+            db.search_tasks, list(zip(heavy, queries))))
+        print_row("Выгрузка всех задач, обычный", measure(
+            scan_tasks, [(db, user_id, query)
+                         for user_id, query in zip(regular[:SCAN_QUERIES], queries)]))
+        print_row(f"Выгрузка всех задач, {HEAVY_USER_TASKS} задач", measure(
+            scan_tasks, [(db, user_id, query)
+                         for user_id, query in zip(heavy[:SCAN_QUERIES], queries)]))
+
+        user_id, query = heavy[0], queries[0]
+        print()
+        print(f"🔎 Пользователь {user_id}, запрос «{query}»:")
+        for task in db.search_tasks(user_id, query, 5):
+            print(f"   {task['task_type']:<8} {task['id']:>8}  {task['task_name']}")
+
+
+if __name__ == '__main__':
+    main()
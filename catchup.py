@@ -0,0 +1,124 @@
+"""
+Модуль догоняющей обработки пропущенных тиков планировщика
+
+Задачи планировщика раньше выбирали только то, что приходится ровно
+на текущую минуту HH:MM, поэтому всё, что выпало на время простоя бота
+или на пропущенный из-за перегрузки тик, терялось. Теперь для каждой
+задачи (weather, daily, one_time) и каждой партиции хранится последний
+полностью обработанный тик, а каждый запуск обрабатывает окно
+(последний тик, текущая минута] одним запросом по диапазону.
+
+Элементы окна, приходящиеся на текущую минуту, обрабатываются как обычно,
+а пропущенные - по политике своего вида:
+- skip - не доставлять
+- late - доставить с пометкой об опоздании
+- merged - собрать пропущенное одним сообщением на пользователя
+Если пропущенное старше max_age политики, оно пропускается.
+Окно догонки ограничено CATCHUP_MAX_GAP.
+"""
+import datetime
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Политики пропущенных элементов
+CATCHUP_SKIP = 'skip'
+CATCHUP_LATE = 'late'
+CATCHUP_MERGED = 'merged'
+
+CATCHUP_MAX_GAP = datetime.timedelta(hours=24)
+
+# Вид задачи -> (политика, максимальный возраст пропущенного)
+CATCHUP_POLICIES = {
+    'weather': (CATCHUP_LATE, datetime.timedelta(hours=1)),
+    'daily': (CATCHUP_MERGED, datetime.timedelta(hours=12)),
+    'one_time': (CATCHUP_LATE, CATCHUP_MAX_GAP),
+}
+
+TICK_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def get_current_tick(now: datetime.datetime) -> datetime.datetime:
+    """Возвращает тик (начало минуты) без часового пояса"""
+    return now.replace(second=0, microsecond=0, tzinfo=None)
+
+
+def get_tick_window(last_tick: Optional[str],
+                    current_tick: datetime.datetime) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Возвращает окно (after, until] тиков, которые еще не обработаны"""
+    if last_tick is None:
+        # Первый запуск: догонять нечего, обрабатываем только текущую минуту
+        return current_tick - datetime.timedelta(minutes=1), current_tick
+    after = datetime.datetime.strptime(last_tick, TICK_FORMAT)
+    return max(after, current_tick - CATCHUP_MAX_GAP), current_tick
+
+
+def group_partitions_by_tick(ticks: Dict[int, Optional[str]]) -> Dict[Optional[str], List[int]]:
+    """Группирует партиции по последнему обработанному тику"""
+    groups = defaultdict(list)
+    for partition_id, last_tick in sorted(ticks.items()):
+        groups[last_tick].append(partition_id)
+    return dict(groups)
+
+
+def get_time_of_day_bounds(after: datetime.datetime,
+                           until: datetime.datetime) -> Optional[Tuple[str, str]]:
+    """
+    Возвращает границы HH:MM окна (after, until] для ежедневного расписания
+
+    None означает, что окно покрывает целые сутки. Если первая граница
+    больше второй, окно переходит через полночь.
+    """
+    if until - after >= datetime.timedelta(days=1):
+        return None
+    return after.strftime("%H:%M"), until.strftime("%H:%M")
+
+
+def time_in_bounds(time_str: str, bounds: Optional[Tuple[str, str]]) -> bool:
+    """Проверяет, что время HH:MM попадает в окно get_time_of_day_bounds"""
+    if bounds is None:
+        return True
+    start, end = bounds
+    if start < end:
+        return start < time_str <= end
+    return time_str > start or time_str <= end
+
+
+def get_occurrence(time_str: str, until: datetime.datetime) -> datetime.datetime:
+    """Возвращает последнее наступление ежедневного времени HH:MM не позже until"""
+    hour, minute = map(int, time_str.split(':'))
+    occurrence = until.replace(hour=hour, minute=minute)
+    if occurrence > until:
+        occurrence -= datetime.timedelta(days=1)
+    return occurrence
+
+
+def get_policy(kind: str, due_at: datetime.datetime,
+               current_tick: datetime.datetime) -> Optional[str]:
+    """Возвращает политику для элемента (None - элемент не пропущен)"""
+    if due_at >= current_tick:
+        return None
+    policy, max_age = CATCHUP_POLICIES[kind]
+    if current_tick - due_at > max_age:
+        return CATCHUP_SKIP
+    return policy
+
+
+def split_by_policy(kind: str, items: Sequence[Dict], due_at_key,
+                    current_tick: datetime.datetime) -> Dict[Optional[str], List[Dict]]:
+    """Раскладывает элементы по политикам: None - вовремя, остальные - пропущенные"""
+    result = defaultdict(list)
+    for item in items:
+        result[get_policy(kind, due_at_key(item), current_tick)].append(item)
+    return result
+
+
+def format_late_note(due_at: datetime.datetime) -> str:
+    """Пометка об опоздании для сообщения, доставленного после простоя"""
+    return f"🕓 _Запланировано на {due_at.strftime('%d.%m %H:%M')}, доставлено с опозданием_"
+
+
+def format_merged_message(lines: Sequence[str]) -> str:
+    """Одно сообщение со всеми пропущенными напоминаниями пользователя"""
+    return "📋 *Пока я был недоступен, пропущены напоминания:*\n\n" + "\n".join(
+        f"• {line}" for line in lines
+    )
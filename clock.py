@@ -0,0 +1,73 @@
+"""
+Модуль часов бота
+
+Планировщик, хранилища и менеджер напоминаний берут текущее время только
+через clock.now() / clock.time(), а не напрямую из datetime и time.
+По умолчанию это системные часы; симуляция (simulate.py) подменяет их
+на SimulatedClock и прогоняет сутки расписания за секунды.
+
+Измерения длительности (time.monotonic, time.perf_counter в метриках
+и трассах) остаются на реальных часах.
+"""
+import datetime
+import time as _time
+
+
+class SystemClock:
+    """Реальные часы"""
+
+    def now(self, tz: datetime.tzinfo = None) -> datetime.datetime:
+        return datetime.datetime.now(tz)
+
+    def time(self) -> float:
+        return _time.time()
+
+
+class SimulatedClock:
+    """Виртуальные часы: время двигается только через set/advance"""
+
+    def __init__(self, start: datetime.datetime):
+        # Наивное локальное время, как у datetime.datetime.now()
+        self.current = start
+
+    def now(self, tz: datetime.tzinfo = None) -> datetime.datetime:
+        if tz is None:
+            return self.current
+        return self.current.astimezone(tz)
+
+    def time(self) -> float:
+        return self.current.timestamp()
+
+    def set(self, value: datetime.datetime):
+        self.current = value
+
+    def advance(self, delta: datetime.timedelta):
+        self.current += delta
+
+
+_clock = SystemClock()
+
+
+def now(tz: datetime.tzinfo = None) -> datetime.datetime:
+    """Текущее время (наивное локальное или в часовом поясе tz)"""
+    return _clock.now(tz)
+
+
+def utcnow() -> datetime.datetime:
+    """Текущее время UTC без часового пояса"""
+    return _clock.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def time() -> float:
+    """Текущее время в секундах эпохи"""
+    return _clock.time()
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(clock):
+    """Подменяет часы всех модулей (например, на SimulatedClock)"""
+    global _clock
+    _clock = clock
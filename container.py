@@ -0,0 +1,92 @@
+"""
+Модуль контейнера сервисов бота
+
+Раньше импорт main сразу создавал WeatherService, Database (соединения,
+DDL и миграции) и остальные сервисы, поэтому любой инструмент, которому
+нужен один обработчик, платил за запуск бота и трогал файл базы.
+Теперь сервисы собраны в Services и создаются при первом обращении.
+Обработчики берут их из main.services, а инструменты (simulate.py)
+подменяют сервис присваиванием (services.weather_service = ...) или весь
+контейнер целиком.
+
+StartupTimer замеряет фазы запуска; время создания сервисов попадает
+в него автоматически, а итог пишется одной записью лога и в метрики startup.*.
+"""
+import time
+from contextlib import contextmanager
+from functools import cached_property
+from typing import Dict
+
+from flood import FloodGuard
+from metrics import metrics
+from outbox import OutboxWorker
+from quota import WeatherQuota
+from reminders import ReminderManager
+from render import RenderCache
+from storage import create_storage
+from weather import WeatherService
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Фаза -> длительность в миллисекундах, в порядке выполнения
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замеряет фазу запуска"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.phases[name] = duration_ms
+            metrics.set_gauge(f"startup.{name}_ms", duration_ms)
+
+    def report(self) -> Dict[str, float]:
+        """Длительности фаз и общее время с создания таймера"""
+        total_ms = round((time.perf_counter() - self.started) * 1000, 1)
+        metrics.set_gauge('startup.total_ms', total_ms)
+        return {**self.phases, 'total': total_ms}
+
+
+class Services:
+    def __init__(self, storage_backend: str = 'sqlite', timer: StartupTimer = None):
+        self.storage_backend = storage_backend
+        self.timer = timer or StartupTimer()
+
+    def warm_up(self):
+        """
+        Создает хранилище заранее, а не в первом обработчике
+
+        DDL и миграции (если версия схемы устарела) выполняются при запуске,
+        до приема обновлений; время попадает в фазу storage.
+        """
+        return self.db
+
+    @cached_property
+    def db(self):
+        with self.timer.phase('storage'):
+            return create_storage(self.storage_backend)
+
+    @cached_property
+    def weather_service(self) -> WeatherService:
+        with self.timer.phase('weather_service'):
+            return WeatherService(WeatherQuota(self.db))
+
+    @cached_property
+    def reminder_manager(self) -> ReminderManager:
+        return ReminderManager()
+
+    @cached_property
+    def render_cache(self) -> RenderCache:
+        return RenderCache()
+
+    @cached_property
+    def flood_guard(self) -> FloodGuard:
+        return FloodGuard()
+
+    @cached_property
+    def outbox_worker(self) -> OutboxWorker:
+        return OutboxWorker(self.db)
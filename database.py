@@ -3,26 +3,328 @@
 """
 import sqlite3
 import datetime
+import logging
 import os
-from typing import List, Dict
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Optional, Sequence, Tuple
 
-class Database:
-    def __init__(self, db_path=None):
-        if db_path is None:
-            # Проверяем, запущены ли мы в Docker
-            if os.path.exists('/app/data'):
-                self.db_path = "/app/data/butler_bot.db"
+import clock
+from catchup import TICK_FORMAT, get_time_of_day_bounds
+from metrics import metrics
+from storage import (
+    Storage, PARTITION_COUNT, SEARCH_LIMIT, check_task_type, get_search_terms, new_invite_token
+)
+from tracing import trace_methods
+
+logger = logging.getLogger(__name__)
+
+# Максимум пар/значений в одном SQL-запросе с IN (...)
+SQL_BATCH_SIZE = 400
+# Group commit: сколько ждать соседние записи и сколько операций в одной транзакции
+GROUP_COMMIT_WINDOW = 0.005  # секунды
+GROUP_COMMIT_IDLE_GAP = 0.0005  # секунды без новых записей, после которых пачка закрывается
+GROUP_COMMIT_MAX_OPS = 256
+# Версия схемы в PRAGMA user_version: увеличивается при каждом изменении DDL и миграций
+SCHEMA_VERSION = 6
+# Полнотекстовый поиск /find: таблица задач -> (остаток rowid в tasks_fts,
+# условие попадания строки в индекс, колонки, от которых оно зависит)
+SEARCH_SOURCES = {
+    'daily_tasks': (0, "{row}.is_active = 1", ('task_name', 'user_id', 'is_active')),
+    'one_time_tasks': (1, "{row}.is_active = 1 AND {row}.is_completed = 0",
+                       ('task_name', 'user_id', 'is_active', 'is_completed')),
+}
+# Текст названия для индекса: ё -> е, как в storage.get_search_terms
+SEARCH_TEXT_SQL = "replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+# Счетчики сводки /admin_stats: таблица -> (колонки, от которых они зависят,
+# {счетчик: вклад строки}); {row} заменяется на NEW или OLD в триггерах
+STATS_COUNTERS = {
+    'users': (('is_reachable', 'weather_notifications'), {
+        'users': "1",
+        'users_unreachable': "{row}.is_reachable = 0",
+        'weather_subscribers': "{row}.weather_notifications = 1",
+    }),
+    'daily_tasks': (('is_active',), {
+        'daily_tasks_active': "{row}.is_active = 1",
+    }),
+    'one_time_tasks': (('is_active', 'is_completed'), {
+        'one_time_tasks_active': "{row}.is_active = 1 AND {row}.is_completed = 0",
+    }),
+    'reminder_history': (('is_completed',), {
+        'reminder_chains': "1",
+        'reminder_chains_completed': "{row}.is_completed = 1",
+    }),
+    'outbox': (('status',), {
+        'outbox_pending': "{row}.status = 'pending'",
+    }),
+}
+
+def _time_window_filter(column: str, after: datetime.datetime, until: datetime.datetime):
+    """Возвращает SQL-условие и параметры для времени HH:MM в окне тиков (after, until]"""
+    bounds = get_time_of_day_bounds(after, until)
+    if bounds is None:
+        return "", ()
+    start, end = bounds
+    if start < end:
+        return f" AND {column} > ? AND {column} <= ?", bounds
+    # Окно переходит через полночь
+    return f" AND ({column} > ? OR {column} <= ?)", bounds
+
+def _stats_delta_sql(counters: Dict[str, str], sign: str, row: str) -> str:
+    """UPSERT, прибавляющий (sign='+') или вычитающий вклад строки row в счетчики"""
+    values = ", ".join(
+        f"('{name}', {sign}COALESCE(({expression.format(row=row)}), 0))"
+        for name, expression in counters.items()
+    )
+    return f"""
+        INSERT INTO stats_counters (name, value) VALUES {values}
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    """
+
+def _stats_triggers() -> List[str]:
+    """Триггеры, поддерживающие stats_counters и stats_daily при любых записях"""
+    statements = []
+    for table, (columns, counters) in STATS_COUNTERS.items():
+        key = 'user_id' if table == 'users' else 'id'
+        # INSERT OR REPLACE удаляет старую строку без DELETE-триггеров
+        # (recursive_triggers выключен), поэтому ее вклад вычитается заранее
+        existing = f"SELECT * FROM {table} WHERE {key} = NEW.{key}"
+        replaced = {
+            name: f"SELECT {expression.format(row='old_row')} FROM ({existing}) AS old_row"
+            for name, expression in counters.items()
+        }
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS stats_{table}_replace BEFORE INSERT ON {table}
+            WHEN NEW.{key} IS NOT NULL AND EXISTS ({existing}) BEGIN
+                {_stats_delta_sql(replaced, '-', 'NEW')}
+            END
+        """)
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS stats_{table}_insert AFTER INSERT ON {table} BEGIN
+                {_stats_delta_sql(counters, '+', 'NEW')}
+            END
+        """)
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS stats_{table}_update
+            AFTER UPDATE OF {', '.join(columns)} ON {table} BEGIN
+                {_stats_delta_sql(counters, '-', 'OLD')}
+                {_stats_delta_sql(counters, '+', 'NEW')}
+            END
+        """)
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS stats_{table}_delete AFTER DELETE ON {table} BEGIN
+                {_stats_delta_sql(counters, '-', 'OLD')}
+            END
+        """)
+    
+    # Счетчики по дням: отправки и цепочки напоминаний (по дню начала цепочки)
+    statements.append("""
+        CREATE TRIGGER IF NOT EXISTS stats_daily_sends AFTER UPDATE OF status ON outbox
+        WHEN NEW.status = 'sent' AND OLD.status != 'sent' BEGIN
+            INSERT INTO stats_daily (day, name, value)
+            VALUES (substr(NEW.sent_at, 1, 10), 'sends', 1)
+            ON CONFLICT (day, name) DO UPDATE SET value = value + 1;
+        END
+    """)
+    statements.append("""
+        CREATE TRIGGER IF NOT EXISTS stats_daily_chains AFTER INSERT ON reminder_history BEGIN
+            INSERT INTO stats_daily (day, name, value)
+            VALUES (substr(NEW.reminder_time, 1, 10), 'reminder_chains', 1)
+            ON CONFLICT (day, name) DO UPDATE SET value = value + 1;
+        END
+    """)
+    statements.append("""
+        CREATE TRIGGER IF NOT EXISTS stats_daily_completed AFTER UPDATE OF is_completed ON reminder_history
+        WHEN NEW.is_completed = 1 AND OLD.is_completed = 0 BEGIN
+            INSERT INTO stats_daily (day, name, value)
+            VALUES (substr(NEW.reminder_time, 1, 10), 'reminder_chains_completed', 1)
+            ON CONFLICT (day, name) DO UPDATE SET value = value + 1;
+        END
+    """)
+    return statements
+
+def _search_triggers() -> List[str]:
+    """Триггеры, синхронизирующие tasks_fts с таблицами задач"""
+    statements = []
+    for table, (kind, condition, columns) in SEARCH_SOURCES.items():
+        index_new = f"""
+            INSERT INTO tasks_fts (rowid, task_name, owner)
+            SELECT NEW.id * 2 + {kind}, {SEARCH_TEXT_SQL.format(column='NEW.task_name')},
+                   'u' || NEW.user_id
+            WHERE {condition.format(row='NEW')};
+        """
+        delete_old = f"DELETE FROM tasks_fts WHERE rowid = OLD.id * 2 + {kind};"
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS search_{table}_insert AFTER INSERT ON {table} BEGIN
+                DELETE FROM tasks_fts WHERE rowid = NEW.id * 2 + {kind};
+                {index_new}
+            END
+        """)
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS search_{table}_update
+            AFTER UPDATE OF {', '.join(columns)} ON {table} BEGIN
+                {delete_old}
+                {index_new}
+            END
+        """)
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS search_{table}_delete AFTER DELETE ON {table} BEGIN
+                {delete_old}
+            END
+        """)
+    return statements
+
+def _search_match(user_id: int, terms: Sequence[str]) -> str:
+    """Запрос FTS5: задачи пользователя, содержащие слова с префиксами terms"""
+    words = " AND ".join(f'"{term}"*' for term in terms)
+    return f'owner : "u{user_id}" AND task_name : ({words})'
+
+def _members_join(task_type: str, alias: str) -> str:
+    """
+    Разворачивает задачи в получателей одним JOIN: участники общей задачи
+    или, если участников нет, сам владелец (партиция - по владельцу задачи)
+    """
+    return f"""
+        LEFT JOIN task_members tm ON tm.task_type = '{task_type}' AND tm.task_id = {alias}.id
+        JOIN users u ON u.user_id = COALESCE(tm.user_id, {alias}.user_id)
+    """
+
+def _partition_filter(column: str, partitions: Optional[Sequence[int]]):
+    """Возвращает SQL-условие и параметры для фильтра по партициям"""
+    if partitions is None:
+        return "", ()
+    placeholders = ", ".join("?" * len(partitions)) or "NULL"
+    return f" AND (abs({column}) % {PARTITION_COUNT}) IN ({placeholders})", tuple(partitions)
+
+class GroupCommitWriter:
+    """
+    Поток-писатель с group commit
+    
+    Операции записи (функции work(conn)) ставятся в очередь и выполняются
+    одним потоком по порядку поступления, поэтому порядок записей каждого
+    пользователя сохраняется. Поток собирает операции, пока они поступают,
+    но не дольше window секунд и не больше max_ops штук, и коммитит их одной
+    транзакцией - один fsync на пачку. Каждая операция выполняется в своем SAVEPOINT: ошибка одной
+    операции откатывает только ее. Future операции получает результат
+    только после COMMIT, так что дождавшийся результата вызывающий код
+    может считать запись сохраненной.
+    """
+    
+    def __init__(self, db_path: str, window: float = GROUP_COMMIT_WINDOW,
+                 max_ops: int = GROUP_COMMIT_MAX_OPS):
+        self.db_path = db_path
+        self.window = window
+        self.max_ops = max_ops
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="butler-group-commit", daemon=True)
+        self.thread.start()
+    
+    def submit(self, work: Callable) -> Future:
+        """Ставит операцию в очередь, результат work(conn) придет в Future"""
+        future = Future()
+        self.queue.put((work, future))
+        return future
+    
+    def close(self):
+        """Дописывает поставленные операции и останавливает поток"""
+        self.queue.put(None)
+        self.thread.join()
+    
+    def _collect(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        # Ждем, пока записи продолжают поступать: одиночная запись и пачка
+        # от заблокированных в ожидании коммита вызывающих коммитятся сразу
+        while batch[-1] is not None and len(batch) < self.max_ops:
+            timeout = min(GROUP_COMMIT_IDLE_GAP, deadline - time.monotonic())
+            try:
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        # Транзакциями управляем сами: BEGIN / SAVEPOINT / COMMIT
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            while True:
+                batch = self._collect()
+                stop = batch[-1] is None
+                if stop:
+                    batch.pop()
+                if batch:
+                    self._commit(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+    
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for work, future in batch:
+                conn.execute("SAVEPOINT group_commit_op")
+                try:
+                    result = work(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO group_commit_op")
+                    results.append((future, None, e))
+                else:
+                    results.append((future, result, None))
+                conn.execute("RELEASE group_commit_op")
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
             else:
-                self.db_path = "butler_bot.db"
+                future.set_result(result)
+        
+        metrics.increment('db.group_commit.batches')
+        metrics.increment('db.group_commit.operations', len(batch))
+        metrics.set_gauge('db.group_commit.last_batch_size', len(batch))
+
+@trace_methods('db', exclude=('transaction', 'submit_write'))
+class Database(Storage):
+    def __init__(self, db_path=None):
+        self.db_path = db_path or self.get_default_path()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        if self._get_schema_version() == SCHEMA_VERSION:
+            # Быстрый запуск: схема уже актуальна, DDL и миграции не нужны
+            metrics.increment('db.schema_fast_path')
         else:
-            self.db_path = db_path
-        self.init_database()
+            self.init_database()
+    
+    @staticmethod
+    def get_default_path() -> str:
+        """Путь к базе по умолчанию"""
+        # Проверяем, запущены ли мы в Docker
+        if os.path.exists('/app/data'):
+            return "/app/data/butler_bot.db"
+        return "butler_bot.db"
     
     def init_database(self):
         """Инициализация базы данных"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
+            # WAL позволяет нескольким процессам планировщика читать во время записи
+            cursor.execute("PRAGMA journal_mode=WAL")
+            
             # Таблица пользователей
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -31,6 +333,7 @@ class Database:
                     first_name TEXT,
                     weather_notifications BOOLEAN DEFAULT 1,
                     weather_time TEXT DEFAULT '08:30',
+                    is_reachable BOOLEAN DEFAULT 1, -- 0, если бот заблокирован пользователем
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
@@ -73,15 +376,111 @@ class Database:
                     is_completed BOOLEAN DEFAULT 0,
                     next_reminder TIMESTAMP,
                     reminder_count INTEGER DEFAULT 0,
+                    superseded_at TIMESTAMP, -- цепочка закрыта более новой цепочкой той же задачи
                     FOREIGN KEY (user_id) REFERENCES users (user_id)
                 )
             """)
             
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_reminder_history_task
+                ON reminder_history (task_type, task_id, is_completed)
+            """)
+            
+            # Очередь исходящих сообщений (transactional outbox)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    parse_mode TEXT,
+                    reply_markup TEXT, -- JSON InlineKeyboardMarkup
+                    label TEXT, -- подпись кнопок при объединении в сводку
+                    status TEXT DEFAULT 'pending', -- 'pending', 'sent' или 'dead'
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at TIMESTAMP NOT NULL,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    sent_at TIMESTAMP
+                )
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_outbox_due
+                ON outbox (status, next_attempt_at)
+            """)
+            
+            # Распределение партиций между воркерами планировщика
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS scheduler_partitions (
+                    partition_id INTEGER PRIMARY KEY,
+                    worker_id INTEGER,
+                    assigned_at TIMESTAMP
+                )
+            """)
+            
+            # Аренды для выбора лидера между репликами
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL -- unix time
+                )
+            """)
+            
+            # Последний обработанный тик задач планировщика по партициям
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS scheduler_state (
+                    job TEXT NOT NULL, -- 'weather', 'daily' или 'one_time'
+                    partition_id INTEGER NOT NULL,
+                    last_tick TEXT NOT NULL, -- 'YYYY-MM-DD HH:MM'
+                    PRIMARY KEY (job, partition_id)
+                )
+            """)
+            
+            # Участники общих задач: у личной задачи строк нет, у общей есть и строка владельца
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS task_members (
+                    task_type TEXT NOT NULL, -- 'daily' или 'one_time'
+                    task_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (task_type, task_id, user_id)
+                ) WITHOUT ROWID
+            """)
+            
+            # Приглашения в общие задачи: случайный токен вместо подбираемого id задачи
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS task_invites (
+                    token TEXT PRIMARY KEY,
+                    task_type TEXT NOT NULL, -- 'daily' или 'one_time'
+                    task_id INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (task_type, task_id)
+                )
+            """)
+            
+            # Запросы к внешним API по периодам (сутки 'YYYY-MM-DD' и месяц 'YYYY-MM')
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS api_usage (
+                    api TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (api, period)
+                ) WITHOUT ROWID
+            """)
+            
             conn.commit()
             
             # Миграция: добавляем колонку weather_time если её нет
             self._migrate_database()
     
+    def _get_schema_version(self) -> int:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+    
     def _migrate_database(self):
         """Выполняет миграции базы данных"""
         with sqlite3.connect(self.db_path) as conn:
@@ -93,8 +492,166 @@ class Database:
             
             if 'weather_time' not in columns:
                 cursor.execute("ALTER TABLE users ADD COLUMN weather_time TEXT DEFAULT '08:30'")
-                print("✅ Миграция: добавлена колонка weather_time")
+                logger.info("Миграция: добавлена колонка weather_time")
+                conn.commit()
+            
+            # Проверяем наличие колонки superseded_at
+            cursor.execute("PRAGMA table_info(reminder_history)")
+            columns = [column[1] for column in cursor.fetchall()]
+            
+            if 'superseded_at' not in columns:
+                cursor.execute("ALTER TABLE reminder_history ADD COLUMN superseded_at TIMESTAMP")
+                logger.info("Миграция: добавлена колонка superseded_at")
                 conn.commit()
+            
+            # Проверяем наличие колонки is_reachable
+            cursor.execute("PRAGMA table_info(users)")
+            columns = [column[1] for column in cursor.fetchall()]
+            
+            if 'is_reachable' not in columns:
+                cursor.execute("ALTER TABLE users ADD COLUMN is_reachable BOOLEAN DEFAULT 1")
+                logger.info("Миграция: добавлена колонка is_reachable")
+                conn.commit()
+            
+            # Проверяем наличие колонки label в outbox
+            cursor.execute("PRAGMA table_info(outbox)")
+            outbox_columns = [column[1] for column in cursor.fetchall()]
+            
+            if 'label' not in outbox_columns:
+                cursor.execute("ALTER TABLE outbox ADD COLUMN label TEXT")
+                logger.info("Миграция: добавлена колонка outbox.label")
+                conn.commit()
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_reachable
+                ON users (is_reachable, weather_time)
+            """)
+            
+            # Индексы для выборок планировщика по диапазону времени
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_daily_tasks_time
+                ON daily_tasks (time)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_one_time_tasks_scheduled
+                ON one_time_tasks (scheduled_datetime)
+            """)
+            
+            # Сводка для /admin_stats: счетчики поддерживаются триггерами,
+            # поэтому чтение не зависит от размера таблиц
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats_counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats_daily (
+                    day TEXT NOT NULL, -- 'YYYY-MM-DD'
+                    name TEXT NOT NULL,
+                    value INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, name)
+                )
+            """)
+            cursor.execute("SELECT COUNT(*) FROM stats_counters")
+            backfill = cursor.fetchone()[0] == 0
+            for statement in _stats_triggers():
+                cursor.execute(statement)
+            if backfill:
+                self._backfill_stats(cursor)
+                logger.info("Миграция: заполнены счетчики статистики")
+            
+            # Полнотекстовый индекс названий активных задач для /find.
+            # rowid = id * 2 + вид задачи, owner = 'u<user_id>' ограничивает
+            # поиск задачами пользователя без просмотра чужих совпадений
+            cursor.execute("""
+                SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'
+            """)
+            search_exists = cursor.fetchone() is not None
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+                    task_name, owner,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
+                )
+            """)
+            for statement in _search_triggers():
+                cursor.execute(statement)
+            if not search_exists:
+                for table, (kind, condition, _) in SEARCH_SOURCES.items():
+                    cursor.execute(f"""
+                        INSERT INTO tasks_fts (rowid, task_name, owner)
+                        SELECT id * 2 + {kind}, {SEARCH_TEXT_SQL.format(column='task_name')},
+                               'u' || user_id
+                        FROM {table} WHERE {condition.format(row=table)}
+                    """)
+                logger.info("Миграция: построен поисковый индекс задач")
+            
+            # Схема актуальна: следующие запуски пропускают DDL и миграции
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+    
+    def _backfill_stats(self, cursor):
+        """Один раз пересчитывает счетчики статистики по существующим данным"""
+        for table, (_, counters) in STATS_COUNTERS.items():
+            sums = ", ".join(
+                f"COALESCE(SUM({expression.format(row=table)}), 0)"
+                for expression in counters.values()
+            )
+            cursor.execute(f"SELECT {sums} FROM {table}")
+            cursor.executemany("""
+                INSERT INTO stats_counters (name, value) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value
+            """, zip(counters, cursor.fetchone()))
+        
+        cursor.execute("DELETE FROM stats_daily")
+        cursor.execute("""
+            INSERT INTO stats_daily (day, name, value)
+            SELECT substr(sent_at, 1, 10), 'sends', COUNT(*)
+            FROM outbox WHERE status = 'sent' AND sent_at IS NOT NULL
+            GROUP BY 1
+        """)
+        cursor.execute("""
+            INSERT INTO stats_daily (day, name, value)
+            SELECT substr(reminder_time, 1, 10), 'reminder_chains', COUNT(*)
+            FROM reminder_history GROUP BY 1
+        """)
+        cursor.execute("""
+            INSERT INTO stats_daily (day, name, value)
+            SELECT substr(reminder_time, 1, 10), 'reminder_chains_completed', COUNT(*)
+            FROM reminder_history WHERE is_completed = 1 GROUP BY 1
+        """)
+    
+    @contextmanager
+    def transaction(self):
+        """Открывает транзакцию: коммит при успехе, откат при исключении"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def submit_write(self, work: Callable) -> Future:
+        """Выполняет work(conn) в общей транзакции group commit, результат - в Future"""
+        # Поток-писатель создается лениво: в каждом процессе (воркеры шардинга) свой
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = GroupCommitWriter(self.db_path)
+        return self._writer.submit(work)
+    
+    def _write(self, method: Callable, *args, **kwargs):
+        """Выполняет метод через group commit и дожидается коммита"""
+        return self.submit_write(lambda conn: method(*args, conn=conn, **kwargs)).result()
+    
+    @contextmanager
+    def _connection(self, conn=None):
+        """Использует переданное соединение или открывает собственную транзакцию"""
+        if conn is not None:
+            yield conn
+        else:
+            with self.transaction() as own_conn:
+                yield own_conn
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None):
         """Добавляет пользователя в базу данных"""
@@ -106,6 +663,31 @@ class Database:
             """, (user_id, username, first_name))
             conn.commit()
     
+    def mark_user_unreachable(self, user_id: int, error: str = None):
+        """Помечает чат недоступным и снимает его сообщения из outbox"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE users SET is_reachable = 0 WHERE user_id = ?
+            """, (user_id,))
+            cursor.execute("""
+                UPDATE outbox
+                SET status = 'dead', last_error = ?
+                WHERE chat_id = ? AND status = 'pending'
+            """, (error or 'chat unreachable', user_id))
+            conn.commit()
+    
+    def mark_user_reachable(self, user_id: int) -> bool:
+        """Снова включает чат после входящего обновления, True - если он был недоступен"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE users SET is_reachable = 1
+                WHERE user_id = ? AND is_reachable = 0
+            """, (user_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+    
     def get_user_weather_settings(self, user_id: int) -> Dict:
         """Получает настройки погоды пользователя"""
         with sqlite3.connect(self.db_path) as conn:
@@ -155,15 +737,18 @@ class Database:
             conn.commit()
             return new_state
     
-    def get_users_for_weather_time(self, time_str: str) -> List[Dict]:
-        """Получает всех пользователей для определенного времени погоды"""
+    def get_users_for_weather_window(self, after: datetime.datetime, until: datetime.datetime,
+                                     partitions: Sequence[int] = None) -> List[Dict]:
+        """Получает пользователей, чье время погоды попадает в окно тиков (after, until]"""
+        window_sql, window_params = _time_window_filter('weather_time', after, until)
+        partition_sql, partition_params = _partition_filter('user_id', partitions)
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT user_id, first_name, weather_time
                 FROM users
-                WHERE weather_notifications = 1 AND weather_time = ?
-            """, (time_str,))
+                WHERE is_reachable = 1 AND weather_notifications = 1
+            """ + window_sql + partition_sql, window_params + partition_params)
             
             rows = cursor.fetchall()
             return [
@@ -175,6 +760,18 @@ class Database:
                 for row in rows
             ]
     
+    def ensure_user(self, user_id: int, username: str = None, first_name: str = None):
+        """Добавляет пользователя, если его еще нет (настройки существующего не сбрасываются)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            # Не INSERT OR IGNORE: BEFORE INSERT триггер статистики сработал бы и для пропущенной строки
+            cursor.execute("""
+                INSERT INTO users (user_id, username, first_name)
+                SELECT ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM users WHERE user_id = ?)
+            """, (user_id, username, first_name, user_id))
+            conn.commit()
+    
     def add_daily_task(self, user_id: int, task_name: str, time: str) -> int:
         """Добавляет ежедневную задачу"""
         with sqlite3.connect(self.db_path) as conn:
@@ -241,16 +838,15 @@ class Database:
                 for row in rows
             ]
     
-    def complete_one_time_task(self, task_id: int):
+    def complete_one_time_task(self, task_id: int, conn=None):
         """Отмечает одноразовую задачу как выполненную"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection(conn) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE one_time_tasks
                 SET is_completed = 1
                 WHERE id = ?
             """, (task_id,))
-            conn.commit()
     
     def delete_daily_task(self, task_id: int):
         """Удаляет ежедневную задачу"""
@@ -274,10 +870,163 @@ class Database:
             """, (task_id,))
             conn.commit()
     
+    def search_tasks(self, user_id: int, query: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
+        """Ищет активные задачи пользователя по словам названия, лучшие совпадения первыми"""
+        terms = get_search_terms(query)
+        if not terms:
+            return []
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            # Вес колонки owner - 0: она совпадает у всех задач пользователя
+            cursor.execute("""
+                SELECT rowid FROM tasks_fts
+                WHERE tasks_fts MATCH ?
+                ORDER BY bm25(tasks_fts, 1.0, 0.0)
+                LIMIT ?
+            """, (_search_match(user_id, terms), limit))
+            rowids = [row[0] for row in cursor.fetchall()]
+            
+            found = {}
+            daily_ids = [rowid // 2 for rowid in rowids if rowid % 2 == 0]
+            one_time_ids = [rowid // 2 for rowid in rowids if rowid % 2 == 1]
+            if daily_ids:
+                cursor.execute(f"""
+                    SELECT id, task_name, time FROM daily_tasks
+                    WHERE id IN ({", ".join("?" * len(daily_ids))})
+                """, daily_ids)
+                for task_id, task_name, time_str in cursor.fetchall():
+                    found[task_id * 2] = {
+                        'task_type': 'daily', 'id': task_id,
+                        'task_name': task_name, 'time': time_str
+                    }
+            if one_time_ids:
+                cursor.execute(f"""
+                    SELECT id, task_name, scheduled_datetime FROM one_time_tasks
+                    WHERE id IN ({", ".join("?" * len(one_time_ids))})
+                """, one_time_ids)
+                for task_id, task_name, scheduled_datetime in cursor.fetchall():
+                    found[task_id * 2 + 1] = {
+                        'task_type': 'one_time', 'id': task_id,
+                        'task_name': task_name, 'scheduled_datetime': scheduled_datetime
+                    }
+        return [found[rowid] for rowid in rowids if rowid in found]
+    
+    def get_task(self, task_type: str, task_id: int) -> Optional[Dict]:
+        """Получает активную задачу по типу и id (с владельцем)"""
+        check_task_type(task_type)
+        when_column = 'time' if task_type == 'daily' else 'scheduled_datetime'
+        table = 'daily_tasks' if task_type == 'daily' else 'one_time_tasks'
+        completed_sql = "" if task_type == 'daily' else " AND is_completed = 0"
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, user_id, task_name, {when_column}
+                FROM {table}
+                WHERE id = ? AND is_active = 1
+            """ + completed_sql, (task_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return {
+                'task_type': task_type,
+                'id': row[0],
+                'user_id': row[1],
+                'task_name': row[2],
+                when_column: row[3]
+            }
+    
+    def add_task_member(self, task_type: str, task_id: int, user_id: int) -> bool:
+        """Добавляет участника общей задачи, True - если он присоединился сейчас"""
+        check_task_type(task_type)
+        table = 'daily_tasks' if task_type == 'daily' else 'one_time_tasks'
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            # Первый участник делает задачу общей: владелец тоже становится участником
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO task_members (task_type, task_id, user_id)
+                SELECT ?, id, user_id FROM {table} WHERE id = ?
+            """, (task_type, task_id))
+            cursor.execute("""
+                INSERT OR IGNORE INTO task_members (task_type, task_id, user_id)
+                VALUES (?, ?, ?)
+            """, (task_type, task_id, user_id))
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    def remove_task_member(self, task_type: str, task_id: int, user_id: int) -> bool:
+        """
+        Убирает участника общей задачи и закрывает его открытые цепочки напоминаний;
+        True - если он был участником
+        """
+        check_task_type(task_type)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM task_members
+                WHERE task_type = ? AND task_id = ? AND user_id = ?
+            """, (task_type, task_id, user_id))
+            removed = cursor.rowcount > 0
+            if removed:
+                # Вышедший участник больше не получает повторы
+                cursor.execute("""
+                    UPDATE reminder_history
+                    SET next_reminder = NULL, superseded_at = ?
+                    WHERE task_type = ? AND task_id = ? AND user_id = ?
+                    AND is_completed = 0 AND next_reminder IS NOT NULL
+                """, (clock.now().isoformat(), task_type, task_id, user_id))
+            # Остался один владелец - задача снова личная
+            cursor.execute("""
+                DELETE FROM task_members
+                WHERE task_type = ? AND task_id = ?
+                AND (SELECT COUNT(*) FROM task_members WHERE task_type = ? AND task_id = ?) = 1
+            """, (task_type, task_id, task_type, task_id))
+            conn.commit()
+            return removed
+    
+    def get_task_members(self, task_type: str, task_id: int) -> List[int]:
+        """Получает участников общей задачи (пусто - задача личная)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT user_id FROM task_members
+                WHERE task_type = ? AND task_id = ?
+                ORDER BY joined_at, user_id
+            """, (task_type, task_id))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_invite_token(self, task_type: str, task_id: int) -> str:
+        """Получает токен приглашения в задачу (создается при первом запросе)"""
+        check_task_type(task_type)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR IGNORE INTO task_invites (token, task_type, task_id)
+                VALUES (?, ?, ?)
+            """, (new_invite_token(), task_type, task_id))
+            cursor.execute("""
+                SELECT token FROM task_invites WHERE task_type = ? AND task_id = ?
+            """, (task_type, task_id))
+            conn.commit()
+            return cursor.fetchone()[0]
+    
+    def get_task_by_invite(self, token: str) -> Optional[Dict]:
+        """Получает активную задачу по токену приглашения (как get_task)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT task_type, task_id FROM task_invites WHERE token = ?
+            """, (token,))
+            invite = cursor.fetchone()
+        return self.get_task(*invite) if invite else None
+    
     def add_reminder_history(self, user_id: int, task_type: str, task_id: int, 
-                           reminder_time: datetime.datetime, next_reminder: datetime.datetime = None):
+                           reminder_time: datetime.datetime, next_reminder: datetime.datetime = None,
+                           conn=None):
         """Добавляет запись в историю напоминаний"""
-        with sqlite3.connect(self.db_path) as conn:
+        if conn is None:
+            return self._write(self.add_reminder_history, user_id, task_type, task_id,
+                               reminder_time, next_reminder)
+        with self._connection(conn) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO reminder_history 
@@ -285,12 +1034,14 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, 1)
             """, (user_id, task_type, task_id, reminder_time.isoformat(), 
                   next_reminder.isoformat() if next_reminder else None))
-            conn.commit()
             return cursor.lastrowid
     
-    def update_reminder_history(self, reminder_id: int, next_reminder: datetime.datetime = None):
+    def update_reminder_history(self, reminder_id: int, next_reminder: datetime.datetime = None,
+                                conn=None):
         """Обновляет историю напоминаний"""
-        with sqlite3.connect(self.db_path) as conn:
+        if conn is None:
+            return self._write(self.update_reminder_history, reminder_id, next_reminder)
+        with self._connection(conn) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE reminder_history
@@ -298,31 +1049,92 @@ class Database:
                     next_reminder = ?
                 WHERE id = ?
             """, (next_reminder.isoformat() if next_reminder else None, reminder_id))
-            conn.commit()
     
-    def complete_reminder(self, reminder_id: int):
-        """Отмечает напоминание как выполненное"""
-        with sqlite3.connect(self.db_path) as conn:
+    def complete_reminder(self, reminder_id: int, conn=None) -> int:
+        """
+        Отмечает напоминание и открытые цепочки той же задачи у того же участника
+        как выполненные; возвращает число живых цепочек остальных текущих участников
+        (у личной задачи - 0)
+        """
+        if conn is None:
+            return self._write(self.complete_reminder, reminder_id)
+        with self._connection(conn) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE reminder_history
                 SET is_completed = 1, next_reminder = NULL
                 WHERE id = ?
+                OR (is_completed = 0 AND (task_type, task_id, user_id) = (
+                    SELECT task_type, task_id, user_id FROM reminder_history WHERE id = ?
+                ))
+            """, (reminder_id, reminder_id))
+            cursor.execute("""
+                SELECT COUNT(*) FROM reminder_history rh
+                JOIN task_members tm
+                ON tm.task_type = rh.task_type AND tm.task_id = rh.task_id
+                AND tm.user_id = rh.user_id
+                WHERE rh.is_completed = 0 AND rh.next_reminder IS NOT NULL
+                AND (rh.task_type, rh.task_id) = (
+                    SELECT task_type, task_id FROM reminder_history WHERE id = ?
+                )
             """, (reminder_id,))
-            conn.commit()
+            return cursor.fetchone()[0]
+    
+    def supersede_reminder_chains(self, task_keys: Sequence, max_reminders: int,
+                                  conn=None) -> Tuple[int, int]:
+        """
+        Закрывает незавершенные цепочки напоминаний (task_type, task_id, user_id)
+        
+        Возвращает (число закрытых цепочек, число подавленных повторов).
+        """
+        task_keys = list(dict.fromkeys(task_keys))
+        superseded_at = clock.now().isoformat()
+        chains = suppressed = 0
+        
+        with self._connection(conn) as conn:
+            cursor = conn.cursor()
+            
+            # Пачками, чтобы не упереться в лимит параметров SQLite
+            for start in range(0, len(task_keys), SQL_BATCH_SIZE):
+                batch = task_keys[start:start + SQL_BATCH_SIZE]
+                keys_sql = ", ".join("(?, ?, ?)" for _ in batch)
+                keys_params = tuple(value for key in batch for value in key)
+                
+                cursor.execute(f"""
+                    SELECT COUNT(*), COALESCE(SUM(MAX(? - reminder_count, 0)), 0)
+                    FROM reminder_history
+                    WHERE is_completed = 0 AND next_reminder IS NOT NULL
+                    AND (task_type, task_id, user_id) IN (VALUES {keys_sql})
+                """, (max_reminders,) + keys_params)
+                batch_chains, batch_suppressed = cursor.fetchone()
+                
+                cursor.execute(f"""
+                    UPDATE reminder_history
+                    SET next_reminder = NULL, superseded_at = ?
+                    WHERE is_completed = 0 AND next_reminder IS NOT NULL
+                    AND (task_type, task_id, user_id) IN (VALUES {keys_sql})
+                """, (superseded_at,) + keys_params)
+                
+                chains += batch_chains
+                suppressed += batch_suppressed
+        
+        return chains, suppressed
     
-    def get_pending_reminders(self) -> List[Dict]:
+    def get_pending_reminders(self, partitions: Sequence[int] = None) -> List[Dict]:
         """Получает все активные напоминания, которые нужно отправить"""
-        current_time = datetime.datetime.now()
+        current_time = clock.now()
+        partition_sql, partition_params = _partition_filter('rh.user_id', partitions)
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT id, user_id, task_type, task_id, next_reminder, reminder_count
-                FROM reminder_history
-                WHERE is_completed = 0 
-                AND next_reminder IS NOT NULL 
-                AND next_reminder <= ?
-            """, (current_time.isoformat(),))
+                SELECT rh.id, rh.user_id, rh.task_type, rh.task_id, rh.next_reminder, rh.reminder_count
+                FROM reminder_history rh
+                JOIN users u ON rh.user_id = u.user_id
+                WHERE rh.is_completed = 0 
+                AND rh.next_reminder IS NOT NULL 
+                AND rh.next_reminder <= ?
+                AND u.is_reachable = 1
+            """ + partition_sql, (current_time.isoformat(),) + partition_params)
             
             rows = cursor.fetchall()
             return [
@@ -337,16 +1149,29 @@ class Database:
                 for row in rows
             ]
     
-    def get_tasks_for_time(self, target_time: str) -> List[Dict]:
-        """Получает все ежедневные задачи для определенного времени"""
+    def get_task_name(self, task_type: str, task_id: int) -> Optional[str]:
+        """Получает название задачи по типу и id"""
+        table = 'daily_tasks' if task_type == 'daily' else 'one_time_tasks'
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT task_name FROM {table} WHERE id = ?", (task_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+    
+    def get_tasks_for_window(self, after: datetime.datetime, until: datetime.datetime,
+                             partitions: Sequence[int] = None) -> List[Dict]:
+        """Получает ежедневные задачи, чье время попадает в окно тиков (after, until]"""
+        window_sql, window_params = _time_window_filter('dt.time', after, until)
+        partition_sql, partition_params = _partition_filter('dt.user_id', partitions)
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT dt.id, dt.user_id, dt.task_name, dt.time, u.first_name
+                SELECT dt.id, u.user_id, dt.task_name, dt.time, u.first_name,
+                       tm.user_id IS NOT NULL
                 FROM daily_tasks dt
-                JOIN users u ON dt.user_id = u.user_id
-                WHERE dt.time = ? AND dt.is_active = 1
-            """, (target_time,))
+            """ + _members_join('daily', 'dt') + """
+                WHERE dt.is_active = 1 AND u.is_reachable = 1
+            """ + window_sql + partition_sql, window_params + partition_params)
             
             rows = cursor.fetchall()
             return [
@@ -355,24 +1180,32 @@ class Database:
                     'user_id': row[1],
                     'task_name': row[2],
                     'time': row[3],
-                    'first_name': row[4]
+                    'first_name': row[4],
+                    'shared': bool(row[5])
                 }
                 for row in rows
             ]
     
-    def get_one_time_tasks_for_time(self, target_datetime: datetime.datetime) -> List[Dict]:
-        """Получает все одноразовые задачи для определенного времени"""
-        target_str = target_datetime.strftime("%Y-%m-%d %H:%M")
+    
+    def get_one_time_tasks_for_window(self, after: datetime.datetime, until: datetime.datetime,
+                                      partitions: Sequence[int] = None) -> List[Dict]:
+        """Получает одноразовые задачи, запланированные на окно тиков (after, until]"""
+        # Задача относится к минуте своего времени: [after + 1 мин, until + 1 мин)
+        start = after + datetime.timedelta(minutes=1)
+        end = until + datetime.timedelta(minutes=1)
+        partition_sql, partition_params = _partition_filter('ott.user_id', partitions)
         
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT ott.id, ott.user_id, ott.task_name, ott.scheduled_datetime, u.first_name
+                SELECT ott.id, u.user_id, ott.task_name, ott.scheduled_datetime, u.first_name,
+                       tm.user_id IS NOT NULL
                 FROM one_time_tasks ott
-                JOIN users u ON ott.user_id = u.user_id
-                WHERE strftime('%Y-%m-%d %H:%M', ott.scheduled_datetime) = ? 
+            """ + _members_join('one_time', 'ott') + """
+                WHERE ott.scheduled_datetime >= ? AND ott.scheduled_datetime < ?
                 AND ott.is_active = 1 AND ott.is_completed = 0
-            """, (target_str,))
+                AND u.is_reachable = 1
+            """ + partition_sql, (start.isoformat(), end.isoformat()) + partition_params)
             
             rows = cursor.fetchall()
             return [
@@ -381,7 +1214,243 @@ class Database:
                     'user_id': row[1],
                     'task_name': row[2],
                     'scheduled_datetime': row[3],
-                    'first_name': row[4]
+                    'first_name': row[4],
+                    'shared': bool(row[5])
+                }
+                for row in rows
+            ]
+    
+    def enqueue_message(self, chat_id: int, text: str, parse_mode: str = None,
+                        reply_markup: str = None, label: str = None,
+                        send_at: datetime.datetime = None, conn=None) -> int:
+        """Кладет сообщение в outbox (в рамках переданной транзакции, если есть)"""
+        send_at = send_at or clock.now()
+        with self._connection(conn) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO outbox (chat_id, text, parse_mode, reply_markup, label, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (chat_id, text, parse_mode, reply_markup, label, send_at.isoformat()))
+            return cursor.lastrowid
+    
+    def get_due_outbox_messages(self, limit: int, partitions: Sequence[int] = None,
+                                lookahead_seconds: float = 0) -> List[Dict]:
+        """
+        Получает сообщения outbox, которые пора отправить
+        
+        Для чатов, у которых есть готовые сообщения, дополнительно забирает
+        сообщения, которые станут готовы в ближайшие lookahead_seconds,
+        чтобы их можно было объединить в одну сводку.
+        """
+        current_time = clock.now()
+        lookahead_time = current_time + datetime.timedelta(seconds=lookahead_seconds)
+        partition_sql, partition_params = _partition_filter('chat_id', partitions)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, chat_id, text, parse_mode, reply_markup, label, attempts
+                FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                AND chat_id IN (
+                    SELECT chat_id FROM outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+            """ + partition_sql + """
+                )
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            """, (lookahead_time.isoformat(), current_time.isoformat())
+                + partition_params + (limit,))
+            
+            rows = cursor.fetchall()
+            return [
+                {
+                    'id': row[0],
+                    'chat_id': row[1],
+                    'text': row[2],
+                    'parse_mode': row[3],
+                    'reply_markup': row[4],
+                    'label': row[5],
+                    'attempts': row[6]
                 }
                 for row in rows
             ]
+    
+    def mark_outbox_sent(self, message_ids: Sequence[int]):
+        """Отмечает сообщения outbox как доставленные"""
+        sent_at = clock.now().isoformat()
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                UPDATE outbox
+                SET status = 'sent', sent_at = ?, attempts = attempts + 1
+                WHERE id = ?
+            """, [(sent_at, message_id) for message_id in message_ids])
+            conn.commit()
+    
+    def reschedule_outbox_messages(self, message_ids: Sequence[int],
+                                   next_attempt_at: datetime.datetime, error: str):
+        """Планирует повторную попытку доставки сообщений outbox"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                UPDATE outbox
+                SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            """, [(next_attempt_at.isoformat(), error, message_id) for message_id in message_ids])
+            conn.commit()
+    
+    def dead_letter_outbox_messages(self, message_ids: Sequence[int], error: str):
+        """Переводит сообщения outbox в dead-letter (больше не отправляются)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                UPDATE outbox
+                SET status = 'dead', attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+            """, [(error, message_id) for message_id in message_ids])
+            conn.commit()
+    
+    def get_outbox_send_histogram(self, start: datetime.datetime, end: datetime.datetime,
+                                  partitions: Sequence[int] = None) -> Dict[str, int]:
+        """Считает ожидающие сообщения outbox по секундам плановой отправки"""
+        partition_sql, partition_params = _partition_filter('chat_id', partitions)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT substr(next_attempt_at, 1, 19) AS second, COUNT(*)
+                FROM outbox
+                WHERE status = 'pending' AND next_attempt_at >= ? AND next_attempt_at < ?
+            """ + partition_sql + """
+                GROUP BY second
+                ORDER BY second
+            """, (start.isoformat(), end.isoformat()) + partition_params)
+            return {row[0]: row[1] for row in cursor.fetchall()}
+    
+    def purge_sent_outbox_messages(self, before: datetime.datetime) -> int:
+        """Удаляет доставленные сообщения outbox старше указанного времени"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM outbox
+                WHERE status = 'sent' AND sent_at < ?
+            """, (before.isoformat(),))
+            conn.commit()
+            return cursor.rowcount
+    
+    def get_stats(self, days: int = 7) -> Dict:
+        """Сводка для администратора из счетчиков, которые ведут триггеры"""
+        since = (clock.now().date() - datetime.timedelta(days=days - 1)).isoformat()
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, value FROM stats_counters")
+            totals = dict(cursor.fetchall())
+            cursor.execute("""
+                SELECT day, name, value FROM stats_daily
+                WHERE day >= ?
+                ORDER BY day
+            """, (since,))
+            daily = {}
+            for day, name, value in cursor.fetchall():
+                daily.setdefault(day, {})[name] = value
+        return {'totals': totals, 'daily': daily}
+    
+    def add_api_calls(self, api: str, periods: Sequence[str], calls: int = 1):
+        """Добавляет запросы к API в счетчики периодов (например, 'YYYY-MM-DD' и 'YYYY-MM')"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO api_usage (api, period, calls)
+                VALUES (?, ?, ?)
+                ON CONFLICT (api, period) DO UPDATE SET calls = calls + excluded.calls
+            """, [(api, period, calls) for period in periods])
+            conn.commit()
+    
+    def get_api_calls(self, api: str, periods: Sequence[str]) -> Dict[str, int]:
+        """Получает число запросов к API по периодам (нет записи - 0)"""
+        usage = {period: 0 for period in periods}
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT period, calls FROM api_usage
+                WHERE api = ? AND period IN ({','.join('?' * len(usage))})
+            """, (api, *usage))
+            usage.update(cursor.fetchall())
+        return usage
+    
+    def assign_partitions(self, assignments: Dict[int, int]):
+        """Сохраняет распределение партиций {partition_id: worker_id}"""
+        assigned_at = clock.now().isoformat()
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM scheduler_partitions")
+            cursor.executemany("""
+                INSERT INTO scheduler_partitions (partition_id, worker_id, assigned_at)
+                VALUES (?, ?, ?)
+            """, [(partition_id, worker_id, assigned_at)
+                  for partition_id, worker_id in assignments.items()])
+            conn.commit()
+    
+    def get_worker_partitions(self, worker_id: int) -> List[int]:
+        """Получает партиции, закрепленные за воркером"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT partition_id FROM scheduler_partitions
+                WHERE worker_id = ?
+                ORDER BY partition_id
+            """, (worker_id,))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def acquire_lease(self, name: str, holder: str, lease_seconds: float) -> bool:
+        """Захватывает или продлевает аренду, если она свободна, истекла или уже своя"""
+        now = clock.time()
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            # Один атомарный UPSERT: чужая действующая аренда не перезаписывается
+            cursor.execute("""
+                INSERT INTO leases (name, holder, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE
+                SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            """, (name, holder, now + lease_seconds, now))
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    def release_lease(self, name: str, holder: str):
+        """Освобождает аренду, если она принадлежит holder"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+            conn.commit()
+    
+    def get_scheduler_ticks(self, job: str,
+                            partitions: Sequence[int] = None) -> Dict[int, Optional[str]]:
+        """Получает последний обработанный тик задачи по партициям (None - еще не было)"""
+        if partitions is None:
+            partitions = range(PARTITION_COUNT)
+        ticks = {partition_id: None for partition_id in partitions}
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT partition_id, last_tick FROM scheduler_state
+                WHERE job = ?
+            """, (job,))
+            for partition_id, last_tick in cursor.fetchall():
+                if partition_id in ticks:
+                    ticks[partition_id] = last_tick
+        return ticks
+    
+    def set_scheduler_ticks(self, job: str, partitions: Optional[Sequence[int]],
+                            tick: datetime.datetime, conn=None):
+        """Сохраняет последний обработанный тик задачи для партиций"""
+        if partitions is None:
+            partitions = range(PARTITION_COUNT)
+        tick_str = tick.strftime(TICK_FORMAT)
+        with self._connection(conn) as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO scheduler_state (job, partition_id, last_tick)
+                VALUES (?, ?, ?)
+                ON CONFLICT (job, partition_id) DO UPDATE SET last_tick = excluded.last_tick
+            """, [(job, partition_id, tick_str) for partition_id in partitions])
@@ -0,0 +1,123 @@
+"""
+Модуль защиты от флуда входящими обновлениями
+
+Один пользователь, часто нажимающий кнопки, мог вызывать неограниченное
+число запросов к базе из handle_callback и к WeatherAPI через action|weather.
+FloodGuard стоит перед обработчиками (отдельная группа до остальных) и
+держит token bucket на каждую пару (пользователь, действие):
+- действие - префикс callback_data, команда или обычное сообщение,
+  для дорогих действий (погода) лимиты строже
+- бакеты хранятся в LRU на FLOOD_MAX_BUCKETS записей, вытесненный бакет
+  просто начинается заново полным
+- лишнее обновление останавливает обработку (ApplicationHandlerStop)
+  без обращения к базе и внешним сервисам; на лишнее нажатие кнопки
+  отвечаем не чаще раза в FLOOD_NOTICE_INTERVAL и с низшим приоритетом,
+  чтобы ответы флудеру не расходовали общий бюджет запросов
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from metrics import metrics
+from ratelimit import BULK
+
+# Константы
+FLOOD_MAX_BUCKETS = 50000
+FLOOD_NOTICE_INTERVAL = 5  # секунды
+FLOOD_NOTICE_TEXT = "⏳ Слишком часто, подождите немного"
+
+# Действие -> (токенов в секунду, емкость бакета)
+DEFAULT_LIMIT = (1.0, 10)
+ACTION_LIMITS = {
+    'weather': (1 / 10, 2),
+    'message': (1.0, 10),
+}
+
+
+def get_action(update: Update) -> Optional[str]:
+    """Действие обновления для выбора бакета (None - не ограничивается)"""
+    if update.callback_query and update.callback_query.data:
+        parts = update.callback_query.data.split("|")
+        if parts[0] == "action" and len(parts) == 2 and parts[1] == "weather":
+            return 'weather'
+        return f"callback:{parts[0]}"
+    if update.message and update.message.text:
+        text = update.message.text
+        if text.startswith('/'):
+            command = text[1:].split()[0].split('@')[0] if len(text) > 1 else ''
+            return 'weather' if command == 'weather' else f"command:{command}"
+        return 'message'
+    return None
+
+
+def get_limit(action: str) -> Tuple[float, float]:
+    return ACTION_LIMITS.get(action, DEFAULT_LIMIT)
+
+
+class FloodGuard:
+    def __init__(self, max_buckets: int = FLOOD_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        # (user_id, действие) -> [токены, время пополнения, время последнего ответа]
+        self.buckets = OrderedDict()
+
+    def allow(self, user_id: int, action: str, now: float = None) -> bool:
+        """Забирает токен из бакета; False - лимит исчерпан"""
+        now = time.monotonic() if now is None else now
+        rate, capacity = get_limit(action)
+        key = (user_id, action)
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = [capacity, now, 0.0]
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+                metrics.increment('flood.evictions')
+            metrics.set_gauge('flood.buckets', len(self.buckets))
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        return False
+
+    def should_notify(self, user_id: int, action: str, now: float = None) -> bool:
+        """Отвечать ли на лишнее обновление (не чаще раза в FLOOD_NOTICE_INTERVAL)"""
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.get((user_id, action))
+        if bucket is None or now - bucket[2] < FLOOD_NOTICE_INTERVAL:
+            return False
+        bucket[2] = now
+        return True
+
+    async def check_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик группы перед остальными: останавливает лишние обновления"""
+        if not update.effective_user:
+            return
+        action = get_action(update)
+        if action is None:
+            return
+
+        user_id = update.effective_user.id
+        if self.allow(user_id, action):
+            return
+
+        metrics.increment('flood.throttled')
+        metrics.increment(f"flood.throttled.{action.split(':')[0]}")
+
+        query = update.callback_query
+        if query and self.should_notify(user_id, action):
+            try:
+                await context.bot.answer_callback_query(
+                    query.id, FLOOD_NOTICE_TEXT, rate_limit_args=BULK
+                )
+            except Exception:
+                # Ответ на лишнее нажатие не важен: callback мог уже устареть
+                metrics.increment('flood.notice_failures')
+        raise ApplicationHandlerStop
@@ -130,10 +130,39 @@ class KeyboardBuilder:
         
         return InlineKeyboardMarkup(keyboard)
     
+    @staticmethod
+    def search_results(tasks):
+        """Найденные задачи (/find) с переходом к управлению задачей"""
+        keyboard = []
+        
+        for task in tasks:
+            # Обрезаем длинные названия
+            task_name = task['task_name']
+            if len(task_name) > 20:
+                task_name = task_name[:17] + "..."
+            
+            if task['task_type'] == 'daily':
+                text = f"📝 {task_name} ({task['time']})"
+            else:
+                dt = datetime.datetime.fromisoformat(task['scheduled_datetime'])
+                text = f"⏰ {task_name} ({dt.strftime('%d.%m %H:%M')})"
+            keyboard.append([
+                InlineKeyboardButton(text, callback_data=f"view_{task['task_type']}|{task['id']}")
+            ])
+        
+        keyboard.append([
+            InlineKeyboardButton("◀️ Назад к задачам", callback_data="action|my_tasks")
+        ])
+        
+        return InlineKeyboardMarkup(keyboard)
+    
     @staticmethod
     def task_detail_menu(task_id, task_type):
         """Меню действий для конкретной задачи"""
         keyboard = [
+            [
+                InlineKeyboardButton("👥 Поделиться", callback_data=f"share|{task_type}|{task_id}")
+            ],
             [
                 InlineKeyboardButton("🗑️ Удалить", callback_data=f"delete|{task_type}|{task_id}")
             ],
@@ -143,6 +172,32 @@ class KeyboardBuilder:
         ]
         return InlineKeyboardMarkup(keyboard)
     
+    @staticmethod
+    def share_invite(invite_url, task_id, task_type):
+        """Приглашение в общую задачу (ссылка работает и в групповых чатах)"""
+        keyboard = [
+            [
+                InlineKeyboardButton("🙋 Присоединиться", url=invite_url)
+            ],
+            [
+                InlineKeyboardButton("◀️ Назад к задаче", callback_data=f"view_{task_type}|{task_id}")
+            ]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def shared_task_menu(task_id, task_type):
+        """Меню участника общей задачи"""
+        keyboard = [
+            [
+                InlineKeyboardButton("🚪 Выйти из общей задачи", callback_data=f"leave|{task_type}|{task_id}")
+            ],
+            [
+                InlineKeyboardButton("🏠 Главное меню", callback_data="action|main_menu")
+            ]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
     @staticmethod
     def confirm_delete(task_id, task_type):
         """Подтверждение удаления задачи"""
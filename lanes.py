@@ -0,0 +1,114 @@
+"""
+Модуль параллельной обработки обновлений с очередями пользователей
+
+По умолчанию Application обрабатывает обновления строго по одному, и
+медленный обработчик (например, запрос к WeatherAPI в /weather) задерживает
+всех остальных пользователей. Просто включить concurrent_updates нельзя:
+диалоги добавления задач (user_states) рассчитывают, что сообщения одного
+пользователя обрабатываются по порядку.
+
+UserLaneProcessor держит для каждого пользователя свою очередь (lane):
+обновления разных пользователей выполняются параллельно, а обновления
+одного пользователя - строго в порядке поступления.
+
+Ограничений два:
+- max_concurrent_updates - сколько обработчиков выполняется одновременно
+- max_pending_updates - сколько обновлений может ждать и выполняться всего
+  (семафор BaseUpdateProcessor). Он берется до очереди пользователя, поэтому
+  задается с запасом, иначе обновления, ждущие своей очереди, заняли бы
+  все места выполняющихся
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import metrics
+from tracing import span, start_trace
+
+# Константы
+DEFAULT_CONCURRENT_UPDATES = 32
+DEFAULT_PENDING_UPDATES = 1024
+
+
+def get_lane_key(update: object) -> Optional[int]:
+    """Ключ очереди: пользователь, для обновлений без пользователя - чат"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class UserLaneProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int = DEFAULT_CONCURRENT_UPDATES,
+                 max_pending_updates: int = DEFAULT_PENDING_UPDATES):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.concurrency = max_concurrent_updates
+        self.running = None
+        self.running_count = 0
+        # Ключ очереди -> futures обновлений в порядке поступления
+        self.lanes = {}
+        self.peak_lane_depth = 0
+
+    async def initialize(self):
+        self.running = asyncio.Semaphore(self.concurrency)
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        key = get_lane_key(update)
+        update_id = update.update_id if isinstance(update, Update) else None
+        # Трасса обновления охватывает и ожидание очереди пользователя
+        with start_trace('update', update_id=update_id, user=key):
+            await self._process(key, coroutine)
+
+    async def _process(self, key: Optional[int], coroutine: Awaitable):
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        # Место в очереди занимается синхронно, до первого await
+        lane = self.lanes.setdefault(key, deque())
+        previous = lane[-1] if lane else None
+        done = asyncio.get_running_loop().create_future()
+        lane.append(done)
+        self._update_lane_gauges(len(lane))
+
+        try:
+            if previous is not None:
+                metrics.increment('updates.lane_waits')
+                # shield: отмена этого обновления не должна отменять предыдущее
+                with span('lane.wait', depth=len(lane)):
+                    await asyncio.shield(previous)
+            await self._run(coroutine)
+        finally:
+            done.set_result(None)
+            lane.remove(done)
+            if not lane:
+                del self.lanes[key]
+            metrics.set_gauge('updates.lanes_active', len(self.lanes))
+
+    async def _run(self, coroutine: Awaitable):
+        with span('concurrency.wait'):
+            await self.running.acquire()
+        self.running_count += 1
+        metrics.set_gauge('updates.running', self.running_count)
+        try:
+            await coroutine
+        finally:
+            self.running.release()
+            self.running_count -= 1
+            metrics.set_gauge('updates.running', self.running_count)
+            metrics.increment('updates.processed')
+
+    def _update_lane_gauges(self, depth: int):
+        self.peak_lane_depth = max(self.peak_lane_depth, depth)
+        metrics.set_gauge('updates.lanes_active', len(self.lanes))
+        metrics.set_gauge('updates.last_lane_depth', depth)
+        metrics.set_gauge('updates.peak_lane_depth', self.peak_lane_depth)
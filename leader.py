@@ -0,0 +1,82 @@
+"""
+Модуль выбора лидера планировщика между репликами бота
+
+Обработчики обновлений можно запускать в нескольких репликах, но задачи
+планировщика должны выполняться ровно в одной. Реплики соревнуются
+за аренду (строку leases в общей базе): лидер продлевает ее каждые
+LEASE_HEARTBEAT_INTERVAL секунд, а если он умер, аренда истекает через
+LEASE_SECONDS и ее забирает первая реплика, приславшая heartbeat.
+
+Лидер считает себя лидером только LEASE_SECONDS - LEASE_SAFETY_MARGIN
+после последнего успешного продления, поэтому старый лидер перестает
+выполнять задачи раньше, чем аренду сможет забрать другая реплика.
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+
+# Константы
+LEASE_SECONDS = 10
+LEASE_HEARTBEAT_INTERVAL = 2  # секунды
+LEASE_SAFETY_MARGIN = 3  # секунды
+SCHEDULER_LEASE = 'scheduler'
+
+logger = logging.getLogger(__name__)
+
+
+def make_holder_id() -> str:
+    """Уникальный идентификатор реплики: хост, процесс и случайный суффикс"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderElection:
+    def __init__(self, db, name: str = SCHEDULER_LEASE, holder: str = None,
+                 lease_seconds: float = LEASE_SECONDS, on_elected=None, on_demoted=None):
+        self.db = db
+        self.name = name
+        self.holder = holder or make_holder_id()
+        self.lease_seconds = lease_seconds
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.renewed_at = None
+        self.was_leader = False
+
+    @property
+    def is_leader(self) -> bool:
+        """Действует ли еще аренда этой реплики (с запасом на расхождение часов)"""
+        if self.renewed_at is None:
+            return False
+        return time.monotonic() < self.renewed_at + self.lease_seconds - LEASE_SAFETY_MARGIN
+
+    def heartbeat(self) -> bool:
+        """Захватывает или продлевает аренду и сообщает о смене роли"""
+        started = time.monotonic()
+        try:
+            if self.db.acquire_lease(self.name, self.holder, self.lease_seconds):
+                self.renewed_at = started
+        except Exception as e:
+            # База недоступна: роль сохраняется, пока не истечет локальный срок аренды
+            logger.error("Ошибка продления аренды %s: %s", self.name, e,
+                         extra={'sample_key': f"leader.renew:{self.name}"})
+
+        leader = self.is_leader
+        if leader and not self.was_leader:
+            logger.info("Реплика %s стала лидером планировщика", self.holder)
+            if self.on_elected:
+                self.on_elected()
+        elif not leader and self.was_leader:
+            logger.warning("Реплика %s больше не лидер планировщика", self.holder)
+            if self.on_demoted:
+                self.on_demoted()
+        self.was_leader = leader
+        return leader
+
+    def release(self):
+        """Отдает аренду (при штатной остановке), чтобы другая реплика не ждала истечения"""
+        if self.was_leader and self.on_demoted:
+            self.on_demoted()
+        self.was_leader = False
+        self.renewed_at = None
+        self.db.release_lease(self.name, self.holder)
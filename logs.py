@@ -0,0 +1,152 @@
+"""
+Модуль структурированного логирования
+
+Раньше ошибки и статусы печатались через print() прямо из асинхронного кода.
+Теперь модули пишут в стандартный logging (logger = logging.getLogger(__name__)),
+а setup_logging настраивает конвейер:
+- обработчик в вызывающем потоке только кладет запись в ограниченную очередь
+  (при переполнении запись отбрасывается и учитывается в logs.dropped),
+  форматирование и запись в stdout выполняет фоновый поток QueueListener
+- каждая запись - одна строка JSON: время, уровень, модуль, сообщение,
+  поля из extra и трассировка исключения
+- уровень задается LOG_LEVEL, для отдельных модулей - LOG_LEVELS,
+  например LOG_LEVELS="database=WARNING,outbox=DEBUG"
+- записи с extra={'sample_key': ...} (ошибки отправки при массовой рассылке)
+  сэмплируются: за LOG_SAMPLE_WINDOW секунд по ключу пишутся первые
+  LOG_SAMPLE_BURST, остальные только считаются, и первая запись следующего
+  окна сообщает, сколько было пропущено
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict
+
+from metrics import metrics
+
+# Константы
+LOG_QUEUE_SIZE = 10000  # записей
+LOG_SAMPLE_WINDOW = 60  # секунды
+LOG_SAMPLE_BURST = 5  # записей на ключ за окно
+
+# Атрибуты LogRecord, которые не являются полями extra
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message'}
+
+_listener = None
+
+
+def parse_levels(value: str) -> Dict[str, int]:
+    """Разбирает LOG_LEVELS вида "database=WARNING,outbox=DEBUG" """
+    levels = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает первые LOG_SAMPLE_BURST записей каждого sample_key за окно"""
+
+    def __init__(self, window: float = LOG_SAMPLE_WINDOW, burst: int = LOG_SAMPLE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._lock = threading.Lock()
+        # sample_key -> [начало окна, записано, пропущено]
+        self.windows = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'sample_key', None)
+        if key is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            state = self.windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                state = [now, 0, 0]
+                self.windows[key] = state
+                if suppressed:
+                    record.suppressed = suppressed
+            if state[1] >= self.burst:
+                state[2] += 1
+                metrics.increment('logs.sampled_out')
+                return False
+            state[1] += 1
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не блокирует и не падает при переполненной очереди"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы подставляются сразу (они могут измениться), форматирование - в фоне
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment('logs.dropped')
+
+
+def setup_logging(level: str = None, levels: str = None):
+    """Настраивает JSON-логирование через очередь и фоновый поток (один раз на процесс)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO').upper())
+    # Библиотеки HTTP пишут каждый запрос на INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    for name, module_level in parse_levels(levels or os.environ.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся записи и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -13,22 +13,40 @@ Butler Bot - персональный помощник для ежедневны
 """
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, 
-    CallbackQueryHandler, ContextTypes, filters
+    CallbackQueryHandler, ContextTypes, TypeHandler, filters
 )
 from telegram import Update
-from telegram.error import TelegramError
+import asyncio
 import datetime
+import logging
 import pytz
 import os
-import sqlite3
 from dotenv import load_dotenv
 
-from weather import WeatherService
+import clock
+from container import Services
 from database import Database
-from reminders import ReminderManager
+from storage import PARTITION_COUNT, SEARCH_LIMIT, TASK_TYPES
 from keyboard_utils import KeyboardBuilder
+from outbox import DIGEST_HOLD
+from sharding import Coordinator, MONITOR_INTERVAL, get_process_rate
+from backup import BackupManager
+from catchup import (
+    CATCHUP_LATE, CATCHUP_MERGED, CATCHUP_SKIP, format_late_note, format_merged_message,
+    get_current_tick, get_occurrence, get_tick_window, group_partitions_by_tick,
+    split_by_policy
+)
+from lanes import UserLaneProcessor
+from leader import LEASE_HEARTBEAT_INTERVAL, LeaderElection
+from logs import setup_logging
+from metrics import metrics
+from ratelimit import PriorityRateLimiter
+from shaping import (
+    build_send_histogram, get_spread_lead, get_spread_send_at, summarize_send_histogram
+)
+from tracing import setup_tracing, trace_job
 
-# Загружаем переменные окружения
+# Загружаем переменные окружения (единственное место, остальные модули читают os.environ)
 load_dotenv()
 
 # Константы
@@ -36,11 +54,38 @@ TIMEZONE = pytz.timezone('Europe/Moscow')
 DEFAULT_WEATHER_TIME = '08:30'
 CHECK_INTERVAL = 60  # секунды
 MAX_REMINDERS = 10
+OUTBOX_INTERVAL = 5  # секунды
+OUTBOX_RETENTION_DAYS = 7
+# Количество процессов-воркеров планировщика (0 - всё в одном процессе)
+SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS', '0'))
+# Движок хранилища: 'sqlite' (по умолчанию) или 'memory'
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+# Онлайн резервное копирование SQLite (0 - выключено)
+BACKUP_INTERVAL_HOURS = int(os.environ.get('BACKUP_INTERVAL_HOURS', '24'))
+BACKUP_DIR = os.environ.get('BACKUP_DIR')
+# Окно сглаживания рассылки погоды вокруг номинальной минуты (0 - без сглаживания)
+WEATHER_SPREAD_WINDOW = int(os.environ.get('WEATHER_SPREAD_WINDOW', '600'))  # секунды
+# Сколько обновлений разных пользователей обрабатывается параллельно
+UPDATE_CONCURRENCY = int(os.environ.get('UPDATE_CONCURRENCY', '32'))
+# Администраторы бота: user_id через запятую (доступ к /admin_stats)
+ADMIN_IDS = {int(user_id) for user_id in os.environ.get('ADMIN_IDS', '').split(',') if user_id.strip()}
+ADMIN_STATS_DAYS = 7
+# На сколько минут вперед /admin_stats показывает гистограмму отправок outbox
+ADMIN_SEND_HISTOGRAM_MINUTES = 15
+# Параметр /start из ссылки-приглашения в общую задачу: join_<токен приглашения>
+JOIN_PREFIX = 'join_'
+# Файл выгрузки трасс (пустая строка - трассы не выгружаются)
+TRACE_FILE = os.environ.get('TRACE_FILE', os.path.join(
+    os.path.dirname(os.path.abspath(Database.get_default_path())), 'traces.jsonl'
+))
 
-# Инициализация сервисов
-weather_service = WeatherService()
-db = Database()
-reminder_manager = ReminderManager()
+# При запуске скриптом __name__ == '__main__', поэтому имя логгера задано явно
+logger = logging.getLogger('main')
+
+# Сервисы создаются при первом обращении (см. container.py)
+services = Services(STORAGE_BACKEND)
+# Выбор лидера планировщика (создается в main, в воркерах шардинга не используется)
+leader_election = None
 
 # Состояния пользователя для многошаговых диалогов
 user_states = {}
@@ -53,13 +98,23 @@ class UserState:
     ADDING_ONE_TIME_TASK_DATE = "adding_one_time_task_date"
     ADDING_ONE_TIME_TASK_TIME = "adding_one_time_task_time"
 
+async def track_reachability(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Входящее обновление от пользователя снова делает его чат доступным"""
+    if update.effective_user and services.db.mark_user_reachable(update.effective_user.id):
+        metrics.increment('users.reactivated')
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
     user = update.effective_user
     chat_id = update.effective_chat.id
     
+    # Переход по приглашению в общую задачу
+    if context.args and context.args[0].startswith(JOIN_PREFIX):
+        await join_shared_task(update, context.args[0][len(JOIN_PREFIX):])
+        return
+    
     # Добавляем пользователя в базу данных
-    db.add_user(user.id, user.username, user.first_name)
+    services.db.add_user(user.id, user.username, user.first_name)
     
     welcome_message = f"""🤖 *Привет, {user.first_name}!*
 
@@ -82,6 +137,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /add\\_daily - добавить ежедневное дело
 /add\\_reminder - добавить разовое напоминание
 /my\\_tasks - посмотреть все мои дела
+/find - найти дело по названию
 /weather - получить текущую погоду
 
 Готов помочь! 😊"""
@@ -92,6 +148,49 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=KeyboardBuilder.main_menu()
     )
 
+def describe_task_time(task) -> str:
+    """Время ежедневной задачи или дата и время разовой"""
+    if 'time' in task:
+        return f"каждый день в {task['time']}"
+    dt = datetime.datetime.fromisoformat(task['scheduled_datetime'])
+    return dt.strftime("%d.%m.%Y в %H:%M")
+
+async def join_shared_task(update: Update, payload: str):
+    """Присоединение к общей задаче по ссылке-приглашению (payload - токен приглашения)"""
+    user = update.effective_user
+    task = services.db.get_task_by_invite(payload)
+    
+    if not task:
+        await update.message.reply_text(
+            "❌ Общая задача не найдена или уже удалена.",
+            reply_markup=KeyboardBuilder.back_to_menu()
+        )
+        return
+    
+    if task['user_id'] == user.id:
+        await update.message.reply_text(
+            "ℹ️ Это ваша задача: поделитесь ссылкой с теми, кому нужны напоминания.",
+            reply_markup=KeyboardBuilder.back_to_menu()
+        )
+        return
+    
+    # Напоминания приходят участнику лично, поэтому он должен быть в базе
+    services.db.ensure_user(user.id, user.username, user.first_name)
+    if services.db.add_task_member(task['task_type'], task['id'], user.id):
+        metrics.increment('tasks.members_joined')
+        message = "✅ *Вы участвуете в общей задаче*"
+    else:
+        message = "ℹ️ *Вы уже участвуете в этой задаче*"
+    
+    await update.message.reply_text(
+        f"{message}\n\n"
+        f"📝 {task['task_name']}\n"
+        f"⏰ {describe_task_time(task)}\n\n"
+        "Напоминания будут приходить вам лично, отмечайте выполнение кнопкой под ними.",
+        parse_mode='Markdown',
+        reply_markup=KeyboardBuilder.shared_task_menu(task['id'], task['task_type'])
+    )
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /help"""
     help_text = """🆘 *Справка по командам*
@@ -103,6 +202,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /add\\_daily - добавить ежедневное дело
 /add\\_reminder - добавить разовое напоминание
 /my\\_tasks - посмотреть все дела
+/find - найти дело по словам из названия
 
 *⚙️ Другое:*
 /help - показать эту справку
@@ -116,6 +216,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 *Примеры:*
 • Ежедневная задача: "Почистить зубы в 22:00"
 • Разовое напоминание: "Позвонить в фитнес зал 10.08.2025 в 14:00"
+• Дата и время одним сообщением: "завтра 9:00", "в пятницу в 18:00", "через 2 часа"
 
 Нужна помощь? Просто напиши мне! 😊"""
     
@@ -125,9 +226,80 @@ async def weather_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /weather"""
     await update.message.reply_text("🌤️ Получаю данные о погоде...")
     
-    weather_message = weather_service.format_weather_message()
+    weather_message = services.weather_service.format_weather_message()
     await update.message.reply_text(weather_message, parse_mode='Markdown')
 
+def format_admin_stats(stats: dict, weather_quota: dict = None,
+                       send_histogram: dict = None) -> str:
+    """
+    Форматирует сводку get_stats для администратора
+
+    weather_quota - прогноз квоты WeatherAPI, send_histogram - посекундная
+    гистограмма ожидающих отправок outbox (get_outbox_send_histogram)
+    """
+    totals = stats['totals']
+    chains = totals.get('reminder_chains', 0)
+    completed = totals.get('reminder_chains_completed', 0)
+    completion_rate = f"{completed / chains:.0%}" if chains else "—"
+    
+    lines = [
+        "📊 *Статистика бота*\n",
+        f"👥 Пользователей: {totals.get('users', 0)}",
+        f"🚫 Заблокировали бота: {totals.get('users_unreachable', 0)}",
+        f"🌤️ Подписаны на погоду: {totals.get('weather_subscribers', 0)}",
+        f"📅 Активных ежедневных дел: {totals.get('daily_tasks_active', 0)}",
+        f"⏰ Активных разовых напоминаний: {totals.get('one_time_tasks_active', 0)}",
+        f"📤 В очереди отправки: {totals.get('outbox_pending', 0)}",
+        f"🔁 Цепочек напоминаний: {chains}, выполнено: {completed} ({completion_rate})",
+        f"\n*За {ADMIN_STATS_DAYS} дней:*",
+    ]
+    today = clock.now().date()
+    for offset in range(ADMIN_STATS_DAYS - 1, -1, -1):
+        day = today - datetime.timedelta(days=offset)
+        values = stats['daily'].get(day.isoformat(), {})
+        day_chains = values.get('reminder_chains', 0)
+        day_completed = values.get('reminder_chains_completed', 0)
+        day_rate = f" ({day_completed / day_chains:.0%})" if day_chains else ""
+        lines.append(
+            f"`{day.strftime('%d.%m')}` 📤 {values.get('sends', 0)} · "
+            f"🔁 {day_chains} · ✅ {day_completed}{day_rate}"
+        )
+    if send_histogram is not None:
+        lines.append(f"\n*Отправки на {ADMIN_SEND_HISTOGRAM_MINUTES} мин вперед:*")
+        minutes = summarize_send_histogram(send_histogram)
+        for minute, (sends, peak) in minutes.items():
+            lines.append(f"`{minute}` 📤 {sends} · пик {peak}/с")
+        if not minutes:
+            lines.append("очередь пуста")
+    if weather_quota:
+        interval = weather_quota['refresh_interval']
+        refresh = f"раз в {interval / 60:.0f} мин" if interval else "исчерпан бюджет на сутки"
+        lines += [
+            "\n*Квота WeatherAPI:*",
+            f"Сегодня {weather_quota['day_calls']} из {weather_quota['daily_budget']}, "
+            f"за месяц {weather_quota['month_calls']} из {weather_quota['monthly_quota']}",
+            f"Обновление прогноза: {refresh}",
+            f"Прогноз на месяц: {weather_quota['projected_month_calls']}",
+        ]
+    return "\n".join(lines)
+
+async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /admin_stats (только для администраторов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Команда доступна только администраторам")
+        return
+    
+    stats = services.db.get_stats(ADMIN_STATS_DAYS)
+    quota = services.weather_service.quota
+    weather_quota = quota.get_projection() if quota else None
+    now = clock.now()
+    send_histogram = services.db.get_outbox_send_histogram(
+        now, now + datetime.timedelta(minutes=ADMIN_SEND_HISTOGRAM_MINUTES)
+    )
+    await update.message.reply_text(
+        format_admin_stats(stats, weather_quota, send_histogram), parse_mode='Markdown'
+    )
+
 async def add_daily_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /add_daily"""
     user_id = update.effective_user.id
@@ -155,8 +327,8 @@ async def my_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Получаем ежедневные задачи
-    daily_tasks = db.get_user_daily_tasks(user_id)
-    one_time_tasks = db.get_user_one_time_tasks(user_id)
+    daily_tasks = services.db.get_user_daily_tasks(user_id)
+    one_time_tasks = services.db.get_user_one_time_tasks(user_id)
     
     message = "📋 *Ваши задачи:*\n\n"
     
@@ -184,6 +356,32 @@ async def my_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=KeyboardBuilder.tasks_menu(daily_tasks, one_time_tasks)
     )
 
+async def find_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /find <текст> - поиск среди активных задач пользователя"""
+    user_id = update.effective_user.id
+    query = " ".join(context.args or [])
+    
+    if not query.strip():
+        await update.message.reply_text(
+            "🔎 Напишите, что найти, например: /find зубы"
+        )
+        return
+    
+    tasks = services.db.search_tasks(user_id, query, SEARCH_LIMIT)
+    metrics.increment('search.queries')
+    if not tasks:
+        await update.message.reply_text(
+            f"🔎 По запросу «{query}» ничего не нашлось",
+            reply_markup=KeyboardBuilder.back_to_menu()
+        )
+        return
+    
+    await update.message.reply_text(
+        f"🔎 Найдено по запросу «{query}»: {len(tasks)}\n"
+        "Выберите задачу для управления:",
+        reply_markup=KeyboardBuilder.search_results(tasks)
+    )
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка текстовых сообщений в зависимости от состояния пользователя"""
     user_id = update.effective_user.id
@@ -204,7 +402,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif state == UserState.ADDING_DAILY_TASK_TIME:
         # Обрабатываем время и сохраняем задачу
-        time_str = reminder_manager.parse_time_input(text)
+        time_str = services.reminder_manager.parse_time_input(text)
         
         if not time_str:
             await update.message.reply_text(
@@ -213,7 +411,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         task_name = context.user_data.get('daily_task_name')
-        task_id = db.add_daily_task(user_id, task_name, time_str)
+        task_id = services.db.add_daily_task(user_id, task_name, time_str)
         
         user_states[user_id] = UserState.NONE
         context.user_data.pop('daily_task_name', None)
@@ -234,11 +432,25 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text(
             f"✅ Задача: '{text}'\n\n"
-            "Введите дату (например: 10.08.2025 или 15/12/2024):",
+            "Введите дату (например: 10.08.2025, завтра или пятница).\n"
+            "Можно сразу с временем: завтра 9:00, через 2 часа:",
             parse_mode='Markdown'
         )
     
     elif state == UserState.ADDING_ONE_TIME_TASK_DATE:
+        # Дата и время могут прийти одним сообщением
+        target_datetime = services.reminder_manager.parse_datetime_text(text)
+        if target_datetime:
+            await save_one_time_task(update, context, target_datetime)
+            return
+        
+        if not services.reminder_manager.parse_date_input(text):
+            await update.message.reply_text(
+                "❌ Неверный формат даты или дата уже прошла. "
+                "Попробуйте еще раз (например: 10.08.2025, завтра или завтра 9:00):"
+            )
+            return
+        
         # Сохраняем дату и просим время
         context.user_data['one_time_task_date'] = text
         user_states[user_id] = UserState.ADDING_ONE_TIME_TASK_TIME
@@ -251,10 +463,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif state == UserState.ADDING_ONE_TIME_TASK_TIME:
         # Обрабатываем время и сохраняем задачу
-        task_name = context.user_data.get('one_time_task_name')
         date_text = context.user_data.get('one_time_task_date')
         
-        target_datetime = reminder_manager.parse_datetime_input(date_text, text)
+        target_datetime = services.reminder_manager.parse_datetime_input(date_text, text)
         
         if not target_datetime:
             await update.message.reply_text(
@@ -263,21 +474,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        task_id = db.add_one_time_task(user_id, task_name, target_datetime)
-        
-        user_states[user_id] = UserState.NONE
-        context.user_data.pop('one_time_task_name', None)
-        context.user_data.pop('one_time_task_date', None)
-        
-        formatted_dt = target_datetime.strftime("%d.%m.%Y в %H:%M")
-        await update.message.reply_text(
-            f"✅ *Напоминание добавлено!*\n\n"
-            f"📝 {task_name}\n"
-            f"📅 {formatted_dt}\n\n"
-            f"Я напомню вам об этом в указанное время!",
-            parse_mode='Markdown',
-            reply_markup=KeyboardBuilder.main_menu()
-        )
+        await save_one_time_task(update, context, target_datetime)
     
     else:
         # Обычное сообщение
@@ -286,29 +483,53 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Используйте /help для просмотра доступных команд."
         )
 
+async def save_one_time_task(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                             target_datetime: datetime.datetime):
+    """Сохраняет разовое напоминание и завершает диалог добавления"""
+    user_id = update.effective_user.id
+    task_name = context.user_data.get('one_time_task_name')
+    
+    services.db.add_one_time_task(user_id, task_name, target_datetime)
+    
+    user_states[user_id] = UserState.NONE
+    context.user_data.pop('one_time_task_name', None)
+    context.user_data.pop('one_time_task_date', None)
+    
+    formatted_dt = target_datetime.strftime("%d.%m.%Y в %H:%M")
+    await update.message.reply_text(
+        f"✅ *Напоминание добавлено!*\n\n"
+        f"📝 {task_name}\n"
+        f"📅 {formatted_dt}\n\n"
+        f"Я напомню вам об этом в указанное время!",
+        parse_mode='Markdown',
+        reply_markup=KeyboardBuilder.main_menu()
+    )
+
 async def handle_action_callback(query, action):
     """Обработка action кнопок (главное меню, навигация)"""
     user_id = query.from_user.id
     
     if action == "main_menu":
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             "🏠 *Главное меню*\n\nВыберите действие:",
             parse_mode='Markdown',
             reply_markup=KeyboardBuilder.main_menu()
         )
     
     elif action == "weather":
-        await query.edit_message_text("🌤️ Получаю данные о погоде...")
-        weather_message = weather_service.format_weather_message()
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(query, "🌤️ Получаю данные о погоде...")
+        weather_message = services.weather_service.format_weather_message()
+        await services.render_cache.edit_message_text(
+            query,
             weather_message, 
             parse_mode='Markdown',
             reply_markup=KeyboardBuilder.back_to_menu()
         )
     
     elif action == "my_tasks":
-        daily_tasks = db.get_user_daily_tasks(user_id)
-        one_time_tasks = db.get_user_one_time_tasks(user_id)
+        daily_tasks = services.db.get_user_daily_tasks(user_id)
+        one_time_tasks = services.db.get_user_one_time_tasks(user_id)
         
         message = "📋 *Ваши задачи:*\n\n"
         
@@ -330,7 +551,8 @@ async def handle_action_callback(query, action):
             message += "У вас пока нет задач.\n\n"
             message += "Используйте кнопки ниже для добавления задач!"
         
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             message,
             parse_mode='Markdown',
             reply_markup=KeyboardBuilder.tasks_menu(daily_tasks, one_time_tasks)
@@ -338,7 +560,8 @@ async def handle_action_callback(query, action):
     
     elif action == "add_daily":
         user_states[user_id] = UserState.ADDING_DAILY_TASK_NAME
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             "📅 *Добавление ежедневного дела*\n\n"
             "Введите название задачи (например: 'Почистить зубы'):",
             parse_mode='Markdown'
@@ -346,7 +569,8 @@ async def handle_action_callback(query, action):
     
     elif action == "add_reminder":
         user_states[user_id] = UserState.ADDING_ONE_TIME_TASK_NAME
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             "⏰ *Добавление разового напоминания*\n\n"
             "Введите название задачи (например: 'Позвонить в фитнес зал'):",
             parse_mode='Markdown'
@@ -362,6 +586,7 @@ async def handle_action_callback(query, action):
 /add\\_daily - добавить ежедневное дело
 /add\\_reminder - добавить разовое напоминание
 /my\\_tasks - посмотреть все дела
+/find - найти дело по словам из названия
 
 *⚙️ Другое:*
 /help - показать эту справку
@@ -375,18 +600,21 @@ async def handle_action_callback(query, action):
 *Примеры:*
 • Ежедневная задача: "Почистить зубы в 22:00"
 • Разовое напоминание: "Позвонить в фитнес зал 10.08.2025 в 14:00"
+• Дата и время одним сообщением: "завтра 9:00", "в пятницу в 18:00", "через 2 часа"
 
 Нужна помощь? Просто напиши мне! 😊"""
         
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             help_text,
             parse_mode='Markdown',
             reply_markup=KeyboardBuilder.back_to_menu()
         )
     
     elif action == "settings":
-        settings = db.get_user_weather_settings(user_id)
-        await query.edit_message_text(
+        settings = services.db.get_user_weather_settings(user_id)
+        await services.render_cache.edit_message_text(
+            query,
             "⚙️ *Настройки*\n\n"
             "Здесь вы можете настроить уведомления о погоде:",
             parse_mode='Markdown',
@@ -401,32 +629,36 @@ async def handle_manage_callback(query, list_type):
     user_id = query.from_user.id
     
     if list_type == "daily_tasks":
-        tasks = db.get_user_daily_tasks(user_id)
+        tasks = services.db.get_user_daily_tasks(user_id)
         if tasks:
-            await query.edit_message_text(
+            await services.render_cache.edit_message_text(
+                query,
                 "📅 *Управление ежедневными делами*\n\n"
                 "Выберите задачу для просмотра или удаления:",
                 parse_mode='Markdown',
                 reply_markup=KeyboardBuilder.daily_tasks_list(tasks)
             )
         else:
-            await query.edit_message_text(
+            await services.render_cache.edit_message_text(
+                query,
                 "📅 У вас нет ежедневных дел.",
                 parse_mode='Markdown',
                 reply_markup=KeyboardBuilder.back_to_menu()
             )
     
     elif list_type == "one_time_tasks":
-        tasks = db.get_user_one_time_tasks(user_id)
+        tasks = services.db.get_user_one_time_tasks(user_id)
         if tasks:
-            await query.edit_message_text(
+            await services.render_cache.edit_message_text(
+                query,
                 "⏰ *Управление напоминаниями*\n\n"
                 "Выберите напоминание для просмотра или удаления:",
                 parse_mode='Markdown',
                 reply_markup=KeyboardBuilder.one_time_tasks_list(tasks)
             )
         else:
-            await query.edit_message_text(
+            await services.render_cache.edit_message_text(
+                query,
                 "⏰ У вас нет разовых напоминаний.",
                 parse_mode='Markdown',
                 reply_markup=KeyboardBuilder.back_to_menu()
@@ -437,7 +669,7 @@ async def handle_view_task_callback(query, task_type, task_id):
     user_id = query.from_user.id
     
     if task_type == "daily":
-        tasks = db.get_user_daily_tasks(user_id)
+        tasks = services.db.get_user_daily_tasks(user_id)
         task = next((t for t in tasks if t['id'] == task_id), None)
         
         if task:
@@ -449,7 +681,7 @@ async def handle_view_task_callback(query, task_type, task_id):
             message = "❌ Задача не найдена."
     
     elif task_type == "one_time":
-        tasks = db.get_user_one_time_tasks(user_id)
+        tasks = services.db.get_user_one_time_tasks(user_id)
         task = next((t for t in tasks if t['id'] == task_id), None)
         
         if task:
@@ -462,24 +694,78 @@ async def handle_view_task_callback(query, task_type, task_id):
         else:
             message = "❌ Напоминание не найдено."
     
-    await query.edit_message_text(
+    members = services.db.get_task_members(task_type, task_id) if task else []
+    if members:
+        message += f"\n👥 *Участников:* {len(members)}"
+    
+    await services.render_cache.edit_message_text(
+        query,
         message,
         parse_mode='Markdown',
         reply_markup=KeyboardBuilder.task_detail_menu(task_id, task_type)
     )
 
+async def handle_share_callback(query, task_type, task_id):
+    """Приглашение в общую задачу: ссылка на бота с параметром join"""
+    task = services.db.get_task(task_type, task_id)
+    if not task or task['user_id'] != query.from_user.id:
+        await services.render_cache.edit_message_text(
+            query,
+            "❌ Задача не найдена.",
+            reply_markup=KeyboardBuilder.back_to_menu()
+        )
+        return
+    
+    token = services.db.get_invite_token(task_type, task_id)
+    invite_url = f"https://t.me/{query.get_bot().username}?start={JOIN_PREFIX}{token}"
+    members = services.db.get_task_members(task_type, task_id)
+    message = f"👥 *Общая задача*\n\n" \
+             f"📝 {task['task_name']}\n" \
+             f"⏰ {describe_task_time(task)}\n\n" \
+             f"Перешлите это сообщение тем, кому нужны напоминания, " \
+             f"или в групповой чат. Каждый участник получает свои напоминания " \
+             f"и сам отмечает выполнение."
+    if members:
+        message += f"\n\n👥 *Участников:* {len(members)}"
+    
+    await services.render_cache.edit_message_text(
+        query,
+        message,
+        parse_mode='Markdown',
+        reply_markup=KeyboardBuilder.share_invite(invite_url, task_id, task_type)
+    )
+
+async def handle_leave_callback(query, task_type, task_id):
+    """Выход участника из общей задачи"""
+    user_id = query.from_user.id
+    task = services.db.get_task(task_type, task_id)
+    
+    if task and task['user_id'] == user_id:
+        message = "ℹ️ Это ваша задача: чтобы остановить напоминания для всех, удалите ее."
+    elif services.db.remove_task_member(task_type, task_id, user_id):
+        metrics.increment('tasks.members_left')
+        message = "🚪 Вы вышли из общей задачи и больше не получите по ней напоминаний."
+    else:
+        message = "ℹ️ Вы не участвуете в этой задаче."
+    
+    await services.render_cache.edit_message_text(
+        query,
+        message,
+        reply_markup=KeyboardBuilder.back_to_menu()
+    )
+
 async def handle_delete_callback(query, task_type, task_id):
     """Обработка запроса на удаление задачи"""
     user_id = query.from_user.id
     
     # Получаем название задачи для подтверждения
     if task_type == "daily":
-        tasks = db.get_user_daily_tasks(user_id)
+        tasks = services.db.get_user_daily_tasks(user_id)
         task = next((t for t in tasks if t['id'] == task_id), None)
         task_name = task['task_name'] if task else "Неизвестная задача"
         type_name = "ежедневное дело"
     else:
-        tasks = db.get_user_one_time_tasks(user_id)
+        tasks = services.db.get_user_one_time_tasks(user_id)
         task = next((t for t in tasks if t['id'] == task_id), None)
         task_name = task['task_name'] if task else "Неизвестное напоминание"
         type_name = "разовое напоминание"
@@ -488,7 +774,8 @@ async def handle_delete_callback(query, task_type, task_id):
              f"Вы уверены, что хотите удалить {type_name}?\n\n" \
              f"📝 *{task_name}*"
     
-    await query.edit_message_text(
+    await services.render_cache.edit_message_text(
+        query,
         message,
         parse_mode='Markdown',
         reply_markup=KeyboardBuilder.confirm_delete(task_id, task_type)
@@ -500,20 +787,22 @@ async def handle_confirm_delete_callback(query, task_type, task_id):
     
     try:
         if task_type == "daily":
-            db.delete_daily_task(task_id)
+            services.db.delete_daily_task(task_id)
             message = "✅ Ежедневное дело успешно удалено!"
         else:
-            db.delete_one_time_task(task_id)
+            services.db.delete_one_time_task(task_id)
             message = "✅ Разовое напоминание успешно удалено!"
         
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             message,
             parse_mode='Markdown',
             reply_markup=KeyboardBuilder.back_to_menu()
         )
     
     except Exception as e:
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             "❌ Ошибка при удалении задачи. Попробуйте еще раз.",
             parse_mode='Markdown',
             reply_markup=KeyboardBuilder.back_to_menu()
@@ -524,13 +813,14 @@ async def handle_toggle_callback(query, setting_type):
     user_id = query.from_user.id
     
     if setting_type == "weather_notifications":
-        new_state = db.toggle_weather_notifications(user_id)
-        settings = db.get_user_weather_settings(user_id)
+        new_state = services.db.toggle_weather_notifications(user_id)
+        settings = services.db.get_user_weather_settings(user_id)
         
         status = "включены" if new_state else "выключены"
         message = f"🌤️ Уведомления о погоде {status}!"
         
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             f"⚙️ *Настройки*\n\n{message}\n\n"
             "Здесь вы можете настроить уведомления о погоде:",
             parse_mode='Markdown',
@@ -545,7 +835,8 @@ async def handle_set_callback(query, setting_type):
     user_id = query.from_user.id
     
     if setting_type == "weather_time":
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             "⏰ *Выберите время для получения погоды:*\n\n"
             "Погода будет приходить каждый день в выбранное время.",
             parse_mode='Markdown',
@@ -557,10 +848,11 @@ async def handle_set_time_callback(query, time_str):
     user_id = query.from_user.id
     
     try:
-        db.update_user_weather_time(user_id, time_str)
-        settings = db.get_user_weather_settings(user_id)
+        services.db.update_user_weather_time(user_id, time_str)
+        settings = services.db.get_user_weather_settings(user_id)
         
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             f"⚙️ *Настройки*\n\n"
             f"✅ Время получения погоды изменено на {time_str}!\n\n"
             "Здесь вы можете настроить уведомления о погоде:",
@@ -571,7 +863,8 @@ async def handle_set_time_callback(query, time_str):
             )
         )
     except Exception as e:
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             "❌ Ошибка при сохранении настроек. Попробуйте еще раз.",
             parse_mode='Markdown',
             reply_markup=KeyboardBuilder.back_to_menu()
@@ -602,6 +895,15 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await handle_view_task_callback(query, task_type, task_id)
         return
     
+    # Обработка кнопок общих задач (приглашение и выход)
+    elif len(parts) == 3 and parts[0] == "share" and parts[1] in TASK_TYPES:
+        await handle_share_callback(query, parts[1], int(parts[2]))
+        return
+    
+    elif len(parts) == 3 and parts[0] == "leave" and parts[1] in TASK_TYPES:
+        await handle_leave_callback(query, parts[1], int(parts[2]))
+        return
+    
     # Обработка delete кнопок
     elif len(parts) == 3 and parts[0] == "delete":
         task_type = parts[1]
@@ -639,20 +941,21 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             task_id = int(parts[2])
             reminder_id = int(parts[3])
         except ValueError as e:
-            await query.edit_message_text(
+            await services.render_cache.edit_message_text(
+                query,
                 "❌ Ошибка обработки команды. Попробуйте еще раз.",
                 parse_mode='Markdown'
             )
             return
         
         if action == "complete":
-            # Отмечаем задачу как выполненную
-            db.complete_reminder(reminder_id)
-            
-            if task_type == "one_time":
-                db.complete_one_time_task(task_id)
+            # Отмечаем задачу как выполненную (в общей задаче - только для этого участника)
+            await asyncio.wrap_future(services.db.submit_write(
+                make_complete_reminder_write(task_type, task_id, reminder_id)
+            ))
             
-            await query.edit_message_text(
+            await services.render_cache.edit_message_text(
+                query,
                 f"✅ *Отлично!* Задача отмечена как выполненная.\n\n"
                 f"{query.message.text.split('📝')[1] if '📝' in query.message.text else 'Задача'}",
                 parse_mode='Markdown'
@@ -660,49 +963,131 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         elif action == "snooze":
             # Откладываем напоминание
-            next_reminder_time = reminder_manager.get_next_reminder_time(1)  # Начинаем с 1 часа
+            next_reminder_time = services.reminder_manager.get_next_reminder_time(1)  # Начинаем с 1 часа
             
             if next_reminder_time:
-                db.update_reminder_history(reminder_id, next_reminder_time)
+                await asyncio.wrap_future(services.db.submit_write(
+                    lambda conn: services.db.update_reminder_history(
+                        reminder_id, next_reminder_time, conn=conn
+                    )
+                ))
                 time_str = next_reminder_time.strftime("%H:%M")
                 
-                await query.edit_message_text(
+                await services.render_cache.edit_message_text(
+                    query,
                     f"⏱️ *Напоминание отложено*\n\n"
                     f"Я напомню снова в {time_str}",
                     parse_mode='Markdown'
                 )
             else:
-                await query.edit_message_text(
+                await services.render_cache.edit_message_text(
+                    query,
                     "❌ Больше нельзя откладывать это напоминание.",
                     parse_mode='Markdown'
                 )
     else:
         # Если формат callback_data неправильный
-        await query.edit_message_text(
+        await services.render_cache.edit_message_text(
+            query,
             "❌ Неизвестная команда.",
             parse_mode='Markdown'
         )
 
+def is_scheduler_leader() -> bool:
+    """Выполняет ли эта реплика задачи планировщика"""
+    return leader_election is None or leader_election.is_leader
+
+def get_job_partitions(context: ContextTypes.DEFAULT_TYPE):
+    """Возвращает партиции воркера, выполняющего задачу (None - все, [] - ни одной)"""
+    worker_id = context.job.data.get('worker_id') if context.job.data else None
+    if worker_id is None:
+        # Реплика-последователь принимает обновления, но не выполняет задачи планировщика
+        return None if is_scheduler_leader() else []
+    return services.db.get_worker_partitions(worker_id)
+
+def get_digest_send_at() -> datetime.datetime:
+    """Время отправки сообщения планировщика: с задержкой на сбор сводки"""
+    return clock.now() + datetime.timedelta(seconds=DIGEST_HOLD)
+
+def get_tick_windows(job: str, partitions, current_tick: datetime.datetime):
+    """Возвращает необработанные окна тиков задачи: [(after, until, партиции)]"""
+    windows = []
+    ticks = services.db.get_scheduler_ticks(job, partitions)
+    for last_tick, group in group_partitions_by_tick(ticks).items():
+        after, until = get_tick_window(last_tick, current_tick)
+        if after >= until:
+            # Этот тик уже обработан (повторный запуск в ту же минуту)
+            continue
+        if partitions is None and len(group) == PARTITION_COUNT:
+            group = None
+        windows.append((after, until, group))
+    return windows
+
+def count_missed(kind: str, by_policy):
+    """Учитывает пропущенные элементы в метриках догонки"""
+    for policy in (CATCHUP_SKIP, CATCHUP_LATE, CATCHUP_MERGED):
+        if by_policy.get(policy):
+            metrics.increment(f"catchup.{kind}.{policy}", len(by_policy[policy]))
+
+@trace_job
 async def send_weather_notification_for_time(context: ContextTypes.DEFAULT_TYPE):
     """Отправка персонализированных уведомлений о погоде"""
-    current_time = datetime.datetime.now(TIMEZONE).strftime("%H:%M")
-    users = db.get_users_for_weather_time(current_time)
-    
-    if not users:
+    partitions = get_job_partitions(context)
+    if partitions == []:
         return
     
-    weather_message = weather_service.format_weather_message()
+    # Рассылка начинается заранее: окно сглаживания центрировано на номинальной минуте
+    lead = datetime.timedelta(minutes=get_spread_lead(WEATHER_SPREAD_WINDOW))
+    nominal = clock.now().replace(second=0, microsecond=0) + lead
+    nominal_tick = get_current_tick(clock.now(TIMEZONE)) + lead
+    weather_message = None
+    send_times = []
+    
+    for after, until, group in get_tick_windows('weather', partitions, nominal_tick):
+        users = services.db.get_users_for_weather_window(after, until, group)
+        by_policy = split_by_policy(
+            'weather', users, lambda user: get_occurrence(user['weather_time'], until), nominal_tick
+        )
+        count_missed('weather', by_policy)
+        
+        if (by_policy.get(None) or by_policy.get(CATCHUP_LATE)
+                or by_policy.get(CATCHUP_MERGED)) and weather_message is None:
+            weather_message = services.weather_service.format_weather_message()
+        digest_send_at = get_digest_send_at()
+        
+        # Кладем уведомления в outbox вместе с отметкой тика, доставкой занимается deliver_outbox
+        with services.db.transaction() as conn:
+            for user in by_policy.get(None, ()):
+                send_at = max(
+                    get_spread_send_at(user['user_id'], nominal, WEATHER_SPREAD_WINDOW),
+                    digest_send_at
+                )
+                send_times.append(send_at)
+                services.db.enqueue_message(
+                    user['user_id'],
+                    f"{get_time_greeting(user['weather_time'])}\n\n{weather_message}",
+                    parse_mode='Markdown',
+                    send_at=send_at,
+                    conn=conn
+                )
+            
+            # Погода у пользователя одна в сутки, поэтому merged для нее - то же, что late
+            for user in by_policy.get(CATCHUP_LATE, []) + by_policy.get(CATCHUP_MERGED, []):
+                due_at = get_occurrence(user['weather_time'], until)
+                services.db.enqueue_message(
+                    user['user_id'],
+                    f"{format_late_note(due_at)}\n\n{weather_message}",
+                    parse_mode='Markdown',
+                    send_at=digest_send_at,
+                    conn=conn
+                )
+            
+            services.db.set_scheduler_ticks('weather', group, until, conn=conn)
     
-    for user in users:
-        try:
-            greeting = get_time_greeting(current_time)
-            await context.bot.send_message(
-                chat_id=user['user_id'],
-                text=f"{greeting}\n\n{weather_message}",
-                parse_mode='Markdown'
-            )
-        except TelegramError as e:
-            print(f"Ошибка отправки погоды пользователю {user['user_id']}: {e}")
+    if send_times:
+        histogram = build_send_histogram(send_times)
+        metrics.increment('weather.notifications_scheduled', len(send_times))
+        metrics.set_gauge('weather.peak_sends_per_second', max(histogram.values()))
 
 def get_time_greeting(time_str: str) -> str:
     """Возвращает приветствие в зависимости от времени"""
@@ -717,174 +1102,381 @@ def get_time_greeting(time_str: str) -> str:
     else:
         return "🌙 *Доброй ночи!*"
 
+def supersede_reminder_chains(task_type: str, tasks, conn):
+    """Оставляет одну живую цепочку напоминаний на задачу и участника: старые закрываются разом"""
+    chains, suppressed = services.db.supersede_reminder_chains(
+        [(task_type, task['task_id'], task['user_id']) for task in tasks], MAX_REMINDERS, conn=conn
+    )
+    metrics.increment('reminders.chains_superseded', chains)
+    metrics.increment('reminders.sends_suppressed', suppressed)
+
+def enqueue_task_reminders(task_type: str, by_policy, due_at_key, describe, conn):
+    """Кладет в outbox напоминания о задачах окна тиков с учетом политик догонки"""
+    send_at = get_digest_send_at()
+    reminder_tasks = (
+        [(task, False) for task in by_policy.get(None, [])]
+        + [(task, True) for task in by_policy.get(CATCHUP_LATE, [])]
+    )
+    supersede_reminder_chains(task_type, [task for task, _ in reminder_tasks], conn)
+    
+    for task, late in reminder_tasks:
+        message = f"⏰ *Напоминание:*\n\n📝 {task['task_name']}"
+        if task.get('shared'):
+            message = f"{message}\n👥 Общая задача"
+        if late:
+            message = f"{message}\n\n{format_late_note(due_at_key(task))}"
+        next_reminder = services.reminder_manager.get_next_reminder_time(1)
+        
+        reminder_id = services.db.add_reminder_history(
+            task['user_id'], task_type, task['task_id'], 
+            clock.now(), next_reminder, conn=conn
+        )
+        
+        # Создаем keyboard с правильным reminder_id
+        keyboard = services.reminder_manager.get_reminder_keyboard_markup(
+            task['task_id'], task_type, reminder_id
+        )
+        
+        services.db.enqueue_message(
+            task['user_id'], message, parse_mode='Markdown',
+            reply_markup=keyboard.to_json(), label=task['task_name'],
+            send_at=send_at, conn=conn
+        )
+    
+    # Пропущенное с политикой merged - одним сообщением на пользователя, без повторов
+    merged_lines = {}
+    for task in sorted(by_policy.get(CATCHUP_MERGED, []), key=due_at_key):
+        merged_lines.setdefault(task['user_id'], []).append(describe(task))
+    for user_id, lines in merged_lines.items():
+        services.db.enqueue_message(
+            user_id, format_merged_message(lines), parse_mode='Markdown',
+            send_at=send_at, conn=conn
+        )
+
+@trace_job
 async def check_daily_tasks(context: ContextTypes.DEFAULT_TYPE):
-    """Проверка ежедневных задач"""
-    current_time = datetime.datetime.now(TIMEZONE).strftime("%H:%M")
-    tasks = db.get_tasks_for_time(current_time)
+    """Проверка ежедневных задач (включая пропущенные за время простоя)"""
+    partitions = get_job_partitions(context)
+    if partitions == []:
+        return
     
-    for task in tasks:
-        try:
-            message = f"⏰ *Напоминание:*\n\n📝 {task['task_name']}"
-            
-            # Добавляем запись в историю напоминаний
-            next_reminder = reminder_manager.get_next_reminder_time(1)
-            reminder_id = db.add_reminder_history(
-                task['user_id'], 'daily', task['task_id'], 
-                datetime.datetime.now(), next_reminder
-            )
-            
-            # Создаем keyboard с правильным reminder_id
-            keyboard = reminder_manager.get_reminder_keyboard_markup(
-                task['task_id'], 'daily', reminder_id
-            )
-            
-            await context.bot.send_message(
-                chat_id=task['user_id'],
-                text=message,
-                reply_markup=keyboard,
-                parse_mode='Markdown'
+    current_tick = get_current_tick(clock.now(TIMEZONE))
+    
+    for after, until, group in get_tick_windows('daily', partitions, current_tick):
+        tasks = services.db.get_tasks_for_window(after, until, group)
+        
+        def due_at_key(task):
+            return get_occurrence(task['time'], until)
+        
+        by_policy = split_by_policy('daily', tasks, due_at_key, current_tick)
+        count_missed('daily', by_policy)
+        
+        # История напоминаний, сообщения в outbox и отметка тика пишутся одной транзакцией
+        with services.db.transaction() as conn:
+            enqueue_task_reminders(
+                'daily', by_policy, due_at_key,
+                lambda task: f"{task['time']} - {task['task_name']}", conn
             )
-            
-        except TelegramError as e:
-            print(f"Ошибка отправки напоминания пользователю {task['user_id']}: {e}")
+            services.db.set_scheduler_ticks('daily', group, until, conn=conn)
 
+def get_one_time_due_at(task) -> datetime.datetime:
+    """Минута, на которую запланирована разовая задача"""
+    return datetime.datetime.fromisoformat(task['scheduled_datetime']).replace(
+        second=0, microsecond=0, tzinfo=None
+    )
+
+@trace_job
 async def check_one_time_tasks(context: ContextTypes.DEFAULT_TYPE):
-    """Проверка одноразовых задач"""
-    current_datetime = datetime.datetime.now(TIMEZONE)
-    tasks = db.get_one_time_tasks_for_time(current_datetime)
+    """Проверка одноразовых задач (включая пропущенные за время простоя)"""
+    partitions = get_job_partitions(context)
+    if partitions == []:
+        return
     
-    for task in tasks:
-        try:
-            message = f"⏰ *Напоминание:*\n\n📝 {task['task_name']}"
-            
-            # Добавляем запись в историю напоминаний
-            next_reminder = reminder_manager.get_next_reminder_time(1)
-            reminder_id = db.add_reminder_history(
-                task['user_id'], 'one_time', task['task_id'], 
-                datetime.datetime.now(), next_reminder
-            )
-            
-            # Создаем keyboard с правильным reminder_id
-            keyboard = reminder_manager.get_reminder_keyboard_markup(
-                task['task_id'], 'one_time', reminder_id
-            )
-            
-            await context.bot.send_message(
-                chat_id=task['user_id'],
-                text=message,
-                reply_markup=keyboard,
-                parse_mode='Markdown'
+    current_tick = get_current_tick(clock.now(TIMEZONE))
+    
+    for after, until, group in get_tick_windows('one_time', partitions, current_tick):
+        tasks = services.db.get_one_time_tasks_for_window(after, until, group)
+        by_policy = split_by_policy('one_time', tasks, get_one_time_due_at, current_tick)
+        count_missed('one_time', by_policy)
+        
+        # История напоминаний, сообщения в outbox и отметка тика пишутся одной транзакцией
+        with services.db.transaction() as conn:
+            enqueue_task_reminders(
+                'one_time', by_policy, get_one_time_due_at,
+                lambda task: (f"{get_one_time_due_at(task).strftime('%d.%m %H:%M')}"
+                              f" - {task['task_name']}"),
+                conn
             )
-            
-        except TelegramError as e:
-            print(f"Ошибка отправки напоминания пользователю {task['user_id']}: {e}")
+            services.db.set_scheduler_ticks('one_time', group, until, conn=conn)
+
+def make_complete_reminder_write(task_type: str, task_id: int, reminder_id: int):
+    """
+    Операция записи "Уже сделал": цепочка напоминаний и разовая задача в одной транзакции
+
+    Разовая задача закрывается, когда ее выполнили все участники.
+    Возвращает число живых цепочек остальных участников.
+    """
+    def write(conn):
+        remaining = services.db.complete_reminder(reminder_id, conn=conn)
+        if task_type == 'one_time' and not remaining:
+            services.db.complete_one_time_task(task_id, conn=conn)
+        return remaining
+    return write
 
+def make_repeat_reminder_write(reminder, next_reminder, message, reply_markup, task_name,
+                               send_at):
+    """Операция записи повторного напоминания: история и outbox в одной транзакции"""
+    def write(conn):
+        services.db.update_reminder_history(reminder['id'], next_reminder, conn=conn)
+        return services.db.enqueue_message(
+            reminder['user_id'], message, parse_mode='Markdown',
+            reply_markup=reply_markup, label=task_name,
+            send_at=send_at, conn=conn
+        )
+    return write
+
+@trace_job
 async def check_pending_reminders(context: ContextTypes.DEFAULT_TYPE):
     """Проверка отложенных напоминаний"""
-    reminders = db.get_pending_reminders()
+    partitions = get_job_partitions(context)
+    if partitions == []:
+        return
+    
+    reminders = services.db.get_pending_reminders(partitions)
+    send_at = get_digest_send_at()
+    writes = []
     
     for reminder in reminders:
-        try:
-            # Получаем информацию о задаче
-            if reminder['task_type'] == 'daily':
-                with sqlite3.connect(db.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "SELECT task_name FROM daily_tasks WHERE id = ?",
-                        (reminder['task_id'],)
-                    )
-                    result = cursor.fetchone()
-                    task_name = result[0] if result else "Неизвестная задача"
-            else:
-                with sqlite3.connect(db.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "SELECT task_name FROM one_time_tasks WHERE id = ?",
-                        (reminder['task_id'],)
-                    )
-                    result = cursor.fetchone()
-                    task_name = result[0] if result else "Неизвестная задача"
-            
-            # Форматируем сообщение
-            message = reminder_manager.format_reminder_message(
-                task_name, reminder['reminder_count']
-            )
-            
-            # Получаем время следующего напоминания
-            next_reminder = reminder_manager.get_next_reminder_time(
-                reminder['reminder_count'] + 1
-            )
-            
-            # Обновляем историю
-            db.update_reminder_history(reminder['id'], next_reminder)
-            
-            # Отправляем напоминание
-            keyboard = reminder_manager.get_reminder_keyboard_markup(
-                reminder['task_id'], reminder['task_type'], reminder['id']
-            )
-            
-            await context.bot.send_message(
-                chat_id=reminder['user_id'],
-                text=message,
-                reply_markup=keyboard,
-                parse_mode='Markdown'
-            )
-            
-        except TelegramError as e:
-            print(f"Ошибка отправки повторного напоминания: {e}")
+        # Получаем информацию о задаче
+        task_name = services.db.get_task_name(reminder['task_type'], reminder['task_id'])
+        if not task_name:
+            task_name = "Неизвестная задача"
+        
+        # Форматируем сообщение
+        message = services.reminder_manager.format_reminder_message(
+            task_name, reminder['reminder_count']
+        )
+        
+        # Получаем время следующего напоминания
+        next_reminder = services.reminder_manager.get_next_reminder_time(
+            reminder['reminder_count'] + 1
+        )
+        
+        keyboard = services.reminder_manager.get_reminder_keyboard_markup(
+            reminder['task_id'], reminder['task_type'], reminder['id']
+        )
+        
+        # Обновляем историю и кладем напоминание в outbox атомарно;
+        # операции разных напоминаний коммитятся общими пачками (group commit)
+        writes.append(asyncio.wrap_future(services.db.submit_write(make_repeat_reminder_write(
+            reminder, next_reminder, message, keyboard.to_json(), task_name, send_at
+        ))))
+    
+    for result in await asyncio.gather(*writes, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.error("Ошибка сохранения повторного напоминания: %s", result,
+                         exc_info=result)
 
-def main():
-    """Основная функция запуска бота"""
-    app = ApplicationBuilder().token(os.environ.get('TELEGRAM_TOKEN_WISH_BOT')).build()
+@trace_job
+async def deliver_outbox(context: ContextTypes.DEFAULT_TYPE):
+    """Доставка сообщений из outbox с повторами и dead-letter"""
+    partitions = get_job_partitions(context)
+    if partitions == []:
+        return
     
-    # Команды
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("weather", weather_command))
-    app.add_handler(CommandHandler("add_daily", add_daily_task))
-    app.add_handler(CommandHandler("add_reminder", add_one_time_reminder))
-    app.add_handler(CommandHandler("my_tasks", my_tasks))
+    await services.outbox_worker.drain(context.bot, partitions)
+
+@trace_job
+async def purge_outbox(context: ContextTypes.DEFAULT_TYPE):
+    """Очистка давно доставленных сообщений outbox"""
+    if not is_scheduler_leader():
+        return
     
-    # Обработчики сообщений и callback'ов
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    app.add_handler(CallbackQueryHandler(handle_callback))
+    before = clock.now() - datetime.timedelta(days=OUTBOX_RETENTION_DAYS)
+    services.db.purge_sent_outbox_messages(before)
+
+@trace_job
+async def backup_database(context: ContextTypes.DEFAULT_TYPE):
+    """Онлайн снимок базы в отдельном потоке, чтобы не держать event loop"""
+    if not is_scheduler_leader():
+        return
     
-    # Планировщик задач
-    job_queue = app.job_queue
+    try:
+        path = await asyncio.to_thread(context.job.data.create_backup)
+        logger.info("Снимок базы создан: %s", path)
+    except Exception as e:
+        metrics.increment('backup.failures')
+        logger.exception("Ошибка резервного копирования базы: %s", e)
+
+@trace_job
+async def monitor_scheduler_workers(context: ContextTypes.DEFAULT_TYPE):
+    """Контроль воркеров планировщика и перераспределение партиций"""
+    if not is_scheduler_leader():
+        return
+    context.job.data.check_workers()
+
+@trace_job
+async def leader_heartbeat(context: ContextTypes.DEFAULT_TYPE):
+    """Продление аренды лидера планировщика"""
+    context.job.data.heartbeat()
+
+def setup_observability():
+    """Включает JSON-логи и выгрузку трасс (до первого обращения к хранилищу)"""
+    setup_logging()
+    if TRACE_FILE:
+        setup_tracing(TRACE_FILE)
+
+def register_scheduler_jobs(job_queue, worker_id=None):
+    """Регистрирует задачи планировщика (worker_id - номер воркера в режиме шардинга)"""
+    if worker_id is not None:
+        # Процесс-воркер запускается с чистого интерпретатора
+        setup_observability()
+    data = {'worker_id': worker_id}
     
     # Проверка персональных уведомлений о погоде каждую минуту
     job_queue.run_repeating(
         send_weather_notification_for_time,
         interval=60,
-        name="weather_notifications"
+        name="weather_notifications",
+        data=data
     )
     
     # Проверка задач каждую минуту
     job_queue.run_repeating(
         check_daily_tasks,
         interval=60,
-        name="check_daily_tasks"
+        name="check_daily_tasks",
+        data=data
     )
     
     job_queue.run_repeating(
         check_one_time_tasks,
         interval=60,
-        name="check_one_time_tasks"
+        name="check_one_time_tasks",
+        data=data
     )
     
     job_queue.run_repeating(
         check_pending_reminders,
         interval=60,
-        name="check_pending_reminders"
+        name="check_pending_reminders",
+        data=data
+    )
+    
+    # Доставка сообщений из outbox (переживает перезапуски бота)
+    job_queue.run_repeating(
+        deliver_outbox,
+        interval=OUTBOX_INTERVAL,
+        name="deliver_outbox",
+        data=data
+    )
+
+def main():
+    """Основная функция запуска бота"""
+    global leader_election
+    timer = services.timer
+    
+    with timer.phase('observability'):
+        setup_observability()
+    
+    # Хранилище создается намеренно до старта бота: DDL и миграции выполняются здесь,
+    # а не в первом обработчике (при актуальной версии схемы они пропускаются)
+    services.warm_up()
+    
+    with timer.phase('application'):
+        app = (
+            ApplicationBuilder()
+            .token(os.environ.get('TELEGRAM_TOKEN_WISH_BOT'))
+            .rate_limiter(PriorityRateLimiter(get_process_rate(SCHEDULER_WORKERS)))
+            # Разные пользователи - параллельно, обновления одного пользователя - по порядку
+            .concurrent_updates(UserLaneProcessor(UPDATE_CONCURRENCY))
+            .build()
+        )
+    
+    # Защита от флуда (группа -2): лишние обновления не доходят до базы и WeatherAPI
+    app.add_handler(TypeHandler(Update, services.flood_guard.check_update), group=-2)
+    
+    # Отслеживание доступности чатов (группа -1 выполняется до остальных обработчиков)
+    app.add_handler(TypeHandler(Update, track_reachability), group=-1)
+    
+    # Команды
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("weather", weather_command))
+    app.add_handler(CommandHandler("add_daily", add_daily_task))
+    app.add_handler(CommandHandler("add_reminder", add_one_time_reminder))
+    app.add_handler(CommandHandler("my_tasks", my_tasks))
+    app.add_handler(CommandHandler("find", find_tasks))
+    app.add_handler(CommandHandler("admin_stats", admin_stats))
+    
+    # Обработчики сообщений и callback'ов
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_handler(CallbackQueryHandler(handle_callback))
+    
+    # Планировщик задач
+    job_queue = app.job_queue
+    coordinator = None
+    
+    if SCHEDULER_WORKERS > 0:
+        # Задачи планировщика выполняют воркеры, каждый для своих партиций
+        coordinator = Coordinator(
+            services.db, SCHEDULER_WORKERS,
+            os.environ.get('TELEGRAM_TOKEN_WISH_BOT'),
+            register_scheduler_jobs
+        )
+        
+        job_queue.run_repeating(
+            monitor_scheduler_workers,
+            interval=MONITOR_INTERVAL,
+            name="monitor_scheduler_workers",
+            data=coordinator
+        )
+    else:
+        register_scheduler_jobs(job_queue)
+    
+    # Задачи планировщика выполняет только реплика-лидер; воркеры запускаются при избрании
+    leader_election = LeaderElection(
+        services.db,
+        on_elected=coordinator.start if coordinator else None,
+        on_demoted=coordinator.stop if coordinator else None
+    )
+    job_queue.run_repeating(
+        leader_heartbeat,
+        interval=LEASE_HEARTBEAT_INTERVAL,
+        first=0,
+        name="leader_heartbeat",
+        data=leader_election
     )
     
-    print("🤖 Butler Bot запущен...")
-    print("🌤️ Погода: персональные настройки времени")
-    print("📅 Проверка задач: каждую минуту")
-    print("⏰ Проверка напоминаний: каждую минуту")
-    print("⚙️ Персональные настройки: доступны")
+    job_queue.run_repeating(
+        purge_outbox,
+        interval=3600,
+        name="purge_outbox"
+    )
     
-    app.run_polling()
+    if BACKUP_INTERVAL_HOURS > 0 and STORAGE_BACKEND == 'sqlite':
+        # Смещение на полминуты уводит копирование от ежеминутных проверок задач
+        job_queue.run_repeating(
+            backup_database,
+            interval=BACKUP_INTERVAL_HOURS * 3600,
+            first=30,
+            name="backup_database",
+            data=BackupManager(services.db.db_path, BACKUP_DIR)
+        )
+    
+    logger.info("Butler Bot запущен", extra={
+        'outbox_interval': OUTBOX_INTERVAL,
+        'scheduler_workers': SCHEDULER_WORKERS,
+        'update_concurrency': UPDATE_CONCURRENCY,
+        'storage': STORAGE_BACKEND,
+        'startup_ms': timer.report(),
+    })
+    
+    try:
+        app.run_polling()
+    finally:
+        # Освобождаем аренду, чтобы другая реплика стала лидером сразу
+        leader_election.release()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,44 @@
+"""
+Модуль метрик бота
+
+Потокобезопасные счетчики и гауги в памяти процесса.
+Имена метрик - строки через точку, например 'reminders.sends_suppressed'.
+"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+
+    def increment(self, name: str, value: int = 1):
+        """Увеличивает счетчик"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value):
+        """Устанавливает текущее значение гауга"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name: str, default=0):
+        """Возвращает значение счетчика или гауга"""
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name]
+            return self._gauges.get(name, default)
+
+    def snapshot(self, prefix: str = '') -> Dict:
+        """Возвращает копию всех метрик (опционально только с префиксом)"""
+        with self._lock:
+            values = dict(self._counters)
+            values.update(self._gauges)
+        return {name: value for name, value in sorted(values.items()) if name.startswith(prefix)}
+
+
+# Метрики процесса
+metrics = Metrics()
@@ -0,0 +1,234 @@
+"""
+Модуль доставки исходящих сообщений через outbox
+
+Планировщик не отправляет сообщения напрямую: он пишет их в таблицу outbox
+в той же транзакции, что и состояние напоминаний. OutboxWorker периодически
+забирает готовые к отправке сообщения пачками и доставляет их:
+- при успехе сообщение помечается как отправленное
+- при временной ошибке планируется повтор с экспоненциальной задержкой
+- при постоянной ошибке или исчерпании попыток сообщение уходит в dead-letter
+
+Сообщения одного чата, готовые в одну минуту (погода, ежедневные и разовые
+задачи, повторные напоминания), объединяются в сводку: один send_message
+с общим текстом и общей inline-клавиатурой. Планировщик ставит сообщения
+с небольшой задержкой DIGEST_HOLD, а воркер при выборке заглядывает на
+DIGEST_HOLD вперед, поэтому сообщения разных задач одного тика попадают
+в одну выборку.
+"""
+import datetime
+import json
+import logging
+from typing import Dict, List
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import clock
+from metrics import metrics
+from ratelimit import BULK, REMINDER
+
+# Константы
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_BATCHES = 20  # пачек за один запуск воркера
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BASE_DELAY = 5  # секунды
+OUTBOX_MAX_DELAY = 3600  # секунды
+DIGEST_HOLD = 3  # секунды ожидания соседних сообщений того же чата
+DIGEST_SEPARATOR = '\n\n➖➖➖\n\n'
+DIGEST_LABEL_LENGTH = 20  # символов подписи задачи в кнопках сводки
+
+# Ограничения Telegram на одно сообщение
+MAX_MESSAGE_LENGTH = 4096
+MAX_KEYBOARD_BUTTONS = 100
+
+logger = logging.getLogger(__name__)
+
+# Ошибки BadRequest, означающие, что чата больше нет
+UNREACHABLE_CHAT_ERRORS = ('chat not found', 'user not found', 'have no rights to send')
+
+
+def is_chat_unreachable(error: TelegramError) -> bool:
+    """Проверяет, что ошибка означает недоступность чата, а не кривое сообщение"""
+    if isinstance(error, Forbidden):
+        return True
+    message = str(error).lower()
+    return any(text in message for text in UNREACHABLE_CHAT_ERRORS)
+
+
+def _count_buttons(reply_markup) -> int:
+    if not reply_markup:
+        return 0
+    return sum(len(row) for row in json.loads(reply_markup)['inline_keyboard'])
+
+
+def build_digests(messages: List[Dict]) -> List[List[Dict]]:
+    """
+    Группирует сообщения outbox в сводки
+
+    Сообщения группируются по чату с сохранением порядка. Сводка не превышает
+    ограничения Telegram на длину текста и число кнопок, а parse_mode у всех
+    сообщений сводки одинаковый.
+    """
+    digests = []
+    open_digests = {}  # chat_id -> (сообщения, длина текста, число кнопок)
+
+    for message in messages:
+        length = len(message['text'])
+        buttons = _count_buttons(message['reply_markup'])
+        current = open_digests.get(message['chat_id'])
+
+        if current is not None:
+            group, group_length, group_buttons = current
+            if (group[0]['parse_mode'] == message['parse_mode']
+                    and group_length + len(DIGEST_SEPARATOR) + length <= MAX_MESSAGE_LENGTH
+                    and group_buttons + buttons <= MAX_KEYBOARD_BUTTONS):
+                group.append(message)
+                open_digests[message['chat_id']] = (
+                    group, group_length + len(DIGEST_SEPARATOR) + length, group_buttons + buttons
+                )
+                continue
+
+        group = [message]
+        digests.append(group)
+        open_digests[message['chat_id']] = (group, length, buttons)
+
+    return digests
+
+
+def merge_digest(messages: List[Dict]):
+    """Собирает текст и JSON-клавиатуру сводки из нескольких сообщений"""
+    if len(messages) == 1:
+        return messages[0]['text'], messages[0]['reply_markup']
+
+    text = DIGEST_SEPARATOR.join(message['text'] for message in messages)
+    keyboard = []
+
+    for message in messages:
+        if not message['reply_markup']:
+            continue
+        label = message.get('label')
+        if label and len(label) > DIGEST_LABEL_LENGTH:
+            label = label[:DIGEST_LABEL_LENGTH - 1] + '…'
+
+        for row in json.loads(message['reply_markup'])['inline_keyboard']:
+            if label:
+                # Без подписи одинаковые кнопки разных задач не различить
+                row = [dict(button, text=f"{label}: {button['text']}") for button in row]
+            keyboard.append(row)
+
+    reply_markup = json.dumps({'inline_keyboard': keyboard}) if keyboard else None
+    return text, reply_markup
+
+
+def get_priority_class(messages: List[Dict]) -> str:
+    """Класс запроса сводки: напоминания о задачах важнее массовой рассылки"""
+    # Подпись есть только у напоминаний, сообщения без нее - массовые
+    if any(message.get('label') for message in messages):
+        return REMINDER
+    return BULK
+
+
+class OutboxWorker:
+    def __init__(self, db, batch_size: int = OUTBOX_BATCH_SIZE,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        # Чаты, ставшие недоступными во время текущего прохода drain
+        self.unreachable_chats = set()
+
+    def get_retry_delay(self, attempts: int) -> int:
+        """Возвращает задержку перед повтором (экспоненциально, с ограничением)"""
+        return min(OUTBOX_BASE_DELAY * 2 ** max(attempts - 1, 0), OUTBOX_MAX_DELAY)
+
+    async def drain(self, bot, partitions=None) -> int:
+        """Доставляет все готовые сообщения пачками, возвращает число отправленных"""
+        sent = 0
+        self.unreachable_chats.clear()
+
+        for _ in range(OUTBOX_MAX_BATCHES):
+            messages = self.db.get_due_outbox_messages(
+                self.batch_size, partitions, lookahead_seconds=DIGEST_HOLD
+            )
+
+            for digest in build_digests(messages):
+                # Сообщения этого чата уже сняты из outbox в mark_user_unreachable
+                if digest[0]['chat_id'] in self.unreachable_chats:
+                    continue
+                if await self.deliver(bot, digest):
+                    sent += len(digest)
+
+            if len(messages) < self.batch_size:
+                break
+
+        return sent
+
+    async def deliver(self, bot, messages: List[Dict]) -> bool:
+        """Отправляет сводку из сообщений outbox одного чата и фиксирует результат"""
+        chat_id = messages[0]['chat_id']
+        message_ids = [message['id'] for message in messages]
+        text, reply_markup_json = merge_digest(messages)
+
+        reply_markup = None
+        if reply_markup_json:
+            reply_markup = InlineKeyboardMarkup.de_json(json.loads(reply_markup_json), bot)
+
+        # Счетчик попыток сводки ведется по самому "невезучему" сообщению
+        attempts = max(message['attempts'] for message in messages) + 1
+
+        try:
+            await bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                parse_mode=messages[0]['parse_mode'],
+                reply_markup=reply_markup,
+                rate_limit_args=get_priority_class(messages)
+            )
+        except RetryAfter as e:
+            # Telegram сам говорит, когда можно повторить
+            self._retry(chat_id, message_ids, attempts, int(e.retry_after), e)
+            return False
+        except (Forbidden, BadRequest) as e:
+            # Бот заблокирован или сообщение некорректно - повтор не поможет
+            self.db.dead_letter_outbox_messages(message_ids, str(e))
+            # При массовой рассылке такие ошибки однотипны: пишем выборку по классу ошибки
+            logger.warning(
+                "Сообщения %s для %s в dead-letter: %s", message_ids, chat_id, e,
+                extra={'chat_id': chat_id, 'sample_key': f"outbox.dead_letter:{type(e).__name__}"}
+            )
+            
+            if is_chat_unreachable(e):
+                # Чат исключается из выборок планировщика до следующего входящего обновления
+                self.db.mark_user_unreachable(chat_id, str(e))
+                self.unreachable_chats.add(chat_id)
+                metrics.increment('users.marked_unreachable')
+            return False
+        except TelegramError as e:
+            self._retry(chat_id, message_ids, attempts, self.get_retry_delay(attempts), e)
+            return False
+
+        self.db.mark_outbox_sent(message_ids)
+        if len(messages) > 1:
+            metrics.increment('outbox.digest_messages_merged', len(messages) - 1)
+        return True
+
+    def _retry(self, chat_id: int, message_ids: List[int], attempts: int, delay: int,
+               error: Exception):
+        """Планирует повтор либо переводит сообщения в dead-letter"""
+        if attempts >= self.max_attempts:
+            self.db.dead_letter_outbox_messages(message_ids, str(error))
+            logger.warning(
+                "Сообщения %s для %s в dead-letter после %s попыток: %s",
+                message_ids, chat_id, attempts, error,
+                extra={'chat_id': chat_id,
+                       'sample_key': f"outbox.dead_letter:{type(error).__name__}"}
+            )
+            return
+
+        next_attempt_at = clock.now() + datetime.timedelta(seconds=delay)
+        self.db.reschedule_outbox_messages(message_ids, next_attempt_at, str(error))
+        logger.warning(
+            "Ошибка отправки сообщений %s пользователю %s, повтор через %s с: %s",
+            message_ids, chat_id, delay, error,
+            extra={'chat_id': chat_id, 'sample_key': f"outbox.retry:{type(error).__name__}"}
+        )
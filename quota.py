@@ -0,0 +1,118 @@
+"""
+Модуль бюджета запросов к WeatherAPI
+
+У платного тарифа WeatherAPI месячная квота запросов. Раньше каждое
+сообщение о погоде (и /weather, и рассылка) запрашивало API, так что
+всплеск нажатий или пользователей расходовал квоту без ограничений.
+
+WeatherQuota считает запросы за сутки и за месяц (UTC) в хранилище -
+счетчики переживают перезапуски и общие для всех реплик - и задает,
+как часто WeatherService может обновлять кэш прогноза:
+- остаток месячной квоты (за вычетом резерва) делится поровну на
+  оставшиеся дни месяца, так что ни один день не съест чужой бюджет
+- дневной бюджет растягивается на оставшиеся до полуночи секунды:
+  интервал обновления = секунды до конца суток / оставшиеся запросы,
+  но не чаще WEATHER_REFRESH_INTERVAL
+- когда дневной бюджет исчерпан, обновлений нет до следующих суток,
+  а WeatherService отдает последние данные с указанием их возраста
+
+Число запросов зависит только от времени, а не от трафика: все сообщения
+между обновлениями берут прогноз из кэша.
+"""
+import calendar
+import datetime
+import os
+from typing import Dict, Optional
+
+import clock
+from metrics import metrics
+
+# Константы
+WEATHER_API = 'weatherapi'
+# Квота тарифа на месяц и необязательный потолок на сутки (0 - без потолка)
+WEATHER_MONTHLY_QUOTA = int(os.environ.get('WEATHER_MONTHLY_QUOTA', '1000000'))
+WEATHER_DAILY_QUOTA = int(os.environ.get('WEATHER_DAILY_QUOTA', '0'))
+# Доля месячной квоты, которую бюджет никогда не тратит (ручные проверки, ошибки учета)
+WEATHER_QUOTA_RESERVE = float(os.environ.get('WEATHER_QUOTA_RESERVE', '0.05'))
+# Самый частый интервал обновления прогноза: WeatherAPI сам обновляет данные раз в 15 минут
+WEATHER_REFRESH_INTERVAL = int(os.environ.get('WEATHER_REFRESH_INTERVAL', '600'))  # секунды
+
+
+def get_periods(now: datetime.datetime):
+    """Сутки и месяц учета квоты ('YYYY-MM-DD', 'YYYY-MM')"""
+    return now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+
+
+class WeatherQuota:
+    def __init__(self, storage, monthly_quota: int = WEATHER_MONTHLY_QUOTA,
+                 daily_quota: int = WEATHER_DAILY_QUOTA,
+                 reserve: float = WEATHER_QUOTA_RESERVE,
+                 min_interval: float = WEATHER_REFRESH_INTERVAL):
+        self.storage = storage
+        self.monthly_quota = monthly_quota
+        self.daily_quota = daily_quota
+        self.reserve = reserve
+        self.min_interval = min_interval
+
+    def record_call(self):
+        """Учитывает запрос к API (до отправки: неудачные запросы тоже тратят квоту)"""
+        self.storage.add_api_calls(WEATHER_API, get_periods(clock.utcnow()))
+        metrics.increment('weather.api_calls')
+
+    def get_projection(self) -> Dict:
+        """
+        Текущий бюджет и прогноз расхода квоты
+
+        refresh_interval - секунды между обновлениями (None - бюджет на сутки
+        исчерпан), projected_month_calls - расход к концу месяца, если
+        обновляться с текущим интервалом
+        """
+        now = clock.utcnow()
+        day, month = get_periods(now)
+        usage = self.storage.get_api_calls(WEATHER_API, (day, month))
+        day_calls, month_calls = usage.get(day, 0), usage.get(month, 0)
+
+        # Бюджет суток: остаток квоты на начало суток поровну на оставшиеся дни
+        days_in_month = calendar.monthrange(now.year, now.month)[1]
+        days_left = days_in_month - now.day + 1
+        usable = self.monthly_quota * (1 - self.reserve)
+        daily_budget = max(usable - (month_calls - day_calls), 0) / days_left
+        if self.daily_quota:
+            daily_budget = min(daily_budget, self.daily_quota)
+
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1),
+                                             datetime.time())
+        seconds_left_today = (midnight - now).total_seconds()
+        remaining_today = daily_budget - day_calls
+        if remaining_today >= 1:
+            refresh_interval = max(self.min_interval, seconds_left_today / remaining_today)
+            calls_left_today = seconds_left_today / refresh_interval
+        else:
+            refresh_interval = None
+            calls_left_today = 0
+
+        # Дальше по дню с тем же интервалом, но не больше бюджета каждого дня
+        later_days = days_left - 1
+        later_calls = min(
+            later_days * 86400 / (refresh_interval or self.min_interval),
+            max(usable - month_calls - calls_left_today, 0)
+        )
+        projection = {
+            'day_calls': day_calls,
+            'month_calls': month_calls,
+            'monthly_quota': self.monthly_quota,
+            'daily_budget': int(daily_budget),
+            'refresh_interval': refresh_interval,
+            'projected_month_calls': int(month_calls + calls_left_today + later_calls),
+        }
+
+        metrics.set_gauge('weather.quota.day_calls', day_calls)
+        metrics.set_gauge('weather.quota.month_calls', month_calls)
+        metrics.set_gauge('weather.quota.refresh_interval', refresh_interval)
+        metrics.set_gauge('weather.quota.projected_month_calls',
+                          projection['projected_month_calls'])
+        return projection
+
+    def get_refresh_interval(self) -> Optional[float]:
+        """Секунды между обновлениями прогноза (None - бюджет на сутки исчерпан)"""
+        return self.get_projection()['refresh_interval']
@@ -0,0 +1,129 @@
+"""
+Модуль приоритетного ограничения исходящих запросов к Bot API
+
+Все запросы бота проходят через PriorityRateLimiter (ExtBot.rate_limiter)
+и делят общий бюджет запросов в секунду. Запросы разбиты на классы:
+- interactive - ответы на команды и правки сообщений по кнопкам
+- reminder - напоминания о задачах, чувствительные ко времени
+- bulk - массовая рассылка погоды
+
+Класс передается через rate_limit_args (запросы без него - интерактивные).
+Бюджет выдается по одному токену, и каждый свободный токен достается самому
+приоритетному ожидающему запросу: пришедший интерактивный запрос обгоняет
+всю очередь массовой рассылки.
+"""
+import asyncio
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import metrics
+from tracing import span
+
+# Классы запросов в порядке приоритета
+INTERACTIVE = 'interactive'
+REMINDER = 'reminder'
+BULK = 'bulk'
+PRIORITY_CLASSES = (INTERACTIVE, REMINDER, BULK)
+
+# Глобальный лимит Telegram - около 30 сообщений в секунду
+DEFAULT_OVERALL_RATE = 30  # запросов в секунду
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    def __init__(self, overall_rate: float = DEFAULT_OVERALL_RATE, burst: float = None):
+        self.overall_rate = overall_rate
+        self.burst = burst if burst is not None else overall_rate
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.queues = {priority_class: deque() for priority_class in PRIORITY_CLASSES}
+        self.paused_until = 0.0
+        self.wakeup = None
+        self.dispatcher = None
+
+    async def initialize(self):
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            try:
+                await self.dispatcher
+            except asyncio.CancelledError:
+                pass
+            self.dispatcher = None
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority_class = rate_limit_args if rate_limit_args in self.queues else INTERACTIVE
+        with span(f"bot.{endpoint}", priority=priority_class):
+            return await self._process_request(callback, args, kwargs, priority_class)
+
+    async def _process_request(self, callback, args, kwargs, priority_class):
+        ticket = asyncio.get_running_loop().create_future()
+        queued_at = time.monotonic()
+        self.queues[priority_class].append(ticket)
+        metrics.set_gauge(f"ratelimit.{priority_class}.queue_depth",
+                          len(self.queues[priority_class]))
+        self.wakeup.set()
+
+        try:
+            with span('ratelimit.wait'):
+                await ticket
+        except asyncio.CancelledError:
+            if ticket in self.queues[priority_class]:
+                self.queues[priority_class].remove(ticket)
+            raise
+
+        wait_ms = int((time.monotonic() - queued_at) * 1000)
+        metrics.increment(f"ratelimit.{priority_class}.requests")
+        metrics.increment(f"ratelimit.{priority_class}.wait_ms_total", wait_ms)
+        metrics.set_gauge(f"ratelimit.{priority_class}.last_wait_ms", wait_ms)
+
+        try:
+            return await callback(*args, **kwargs)
+        except RetryAfter as e:
+            # Telegram ограничил всего бота: останавливаем выдачу токенов всем классам
+            self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+            metrics.increment('ratelimit.retry_after')
+            raise
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.overall_rate)
+        self.updated_at = now
+
+    def _next_ticket(self):
+        """Забирает ожидающий запрос самого приоритетного непустого класса"""
+        for priority_class in PRIORITY_CLASSES:
+            queue = self.queues[priority_class]
+            while queue:
+                ticket = queue.popleft()
+                metrics.set_gauge(f"ratelimit.{priority_class}.queue_depth", len(queue))
+                if not ticket.done():
+                    return ticket
+        return None
+
+    async def _dispatch(self):
+        """Выдает токены ожидающим запросам в порядке приоритета"""
+        while True:
+            if not any(self.queues.values()):
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self._refill(now)
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.overall_rate)
+                continue
+
+            ticket = self._next_ticket()
+            if ticket is not None:
+                self.tokens -= 1
+                ticket.set_result(None)
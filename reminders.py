@@ -2,7 +2,10 @@
 Модуль для управления напоминаниями и повторами
 """
 import datetime
-from typing import Optional
+import re
+from typing import Optional, Tuple
+
+import clock
 
 class ReminderManager:
     def __init__(self):
@@ -25,7 +28,7 @@ class ReminderManager:
         if reminder_count >= 10:
             return None
             
-        return datetime.datetime.now() + datetime.timedelta(minutes=interval_minutes)
+        return clock.now() + datetime.timedelta(minutes=interval_minutes)
     
     def format_reminder_message(self, task_name: str, reminder_count: int, 
                                task_type: str = "task") -> str:
@@ -76,80 +79,168 @@ class ReminderManager:
     
     def parse_time_input(self, time_input: str) -> Optional[str]:
         """Парсит введенное пользователем время"""
-        try:
-            # Убираем лишние пробелы
-            time_input = time_input.strip()
-            
-            # Если есть точка, заменяем на двоеточие
-            time_input = time_input.replace(".", ":")
-            
-            # Проверяем различные форматы
-            if ":" in time_input:
-                parts = time_input.split(":")
-                if len(parts) == 2:
-                    hour = int(parts[0])
-                    minute = int(parts[1])
-                else:
-                    return None
-            else:
-                # Только час
-                hour = int(time_input)
-                minute = 0
-            
-            # Валидация
-            if 0 <= hour <= 23 and 0 <= minute <= 59:
-                return f"{hour:02d}:{minute:02d}"
-            
+        match = _TIME_RE.match(time_input)
+        if not match:
             return None
-            
-        except (ValueError, IndexError):
+        
+        time_value = _match_time(match)
+        if not time_value:
             return None
+        
+        return f"{time_value[0]:02d}:{time_value[1]:02d}"
     
-    def parse_datetime_input(self, date_input: str, time_input: str) -> Optional[datetime.datetime]:
-        """Парсит введенные пользователем дату и время"""
-        try:
-            # Парсим время
-            time_str = self.parse_time_input(time_input)
-            if not time_str:
+    def parse_date_input(self, date_input: str,
+                         now: datetime.datetime = None) -> Optional[datetime.date]:
+        """Парсит дату без времени: 10.08.2025, 10.08, завтра, пятница"""
+        match = _DATETIME_RE.match(date_input)
+        if not match or match.group('unit') or match.group('hour'):
+            return None
+        
+        now = now or clock.now()
+        return _match_date(match, now, None)
+    
+    def parse_datetime_text(self, text: str,
+                            now: datetime.datetime = None) -> Optional[datetime.datetime]:
+        """
+        Парсит дату и время из одной строки за один проход
+        
+        Поддерживает: "10.08.2025 14:00", "10/08/25 в 9.30", "10.08 14:00",
+        "завтра 9:00", "в пятницу в 18:00", "через 2 часа", "через 15 минут".
+        Возвращает None, если строка не распознана или время уже прошло.
+        """
+        match = _DATETIME_RE.match(text)
+        if not match:
+            return None
+        
+        now = now or clock.now()
+        
+        if match.group('unit'):
+            target_datetime = _match_relative(match, now)
+        else:
+            time_value = _match_time(match) if match.group('hour') else None
+            if not time_value:
                 return None
             
-            hour, minute = map(int, time_str.split(":"))
-            
-            # Парсим дату
-            date_input = date_input.strip()
-            
-            # Различные форматы даты
-            date_formats = [
-                "%d.%m.%Y",    # 10.08.2025
-                "%d/%m/%Y",    # 10/08/2025
-                "%d-%m-%Y",    # 10-08-2025
-                "%d.%m.%y",    # 10.08.25
-                "%d/%m/%y",    # 10/08/25
-                "%d-%m-%y",    # 10-08-25
-            ]
-            
-            target_date = None
-            for date_format in date_formats:
-                try:
-                    target_date = datetime.datetime.strptime(date_input, date_format).date()
-                    break
-                except ValueError:
-                    continue
-            
+            target_date = _match_date(match, now, time_value)
             if not target_date:
                 return None
             
-            # Создаем datetime объект
             target_datetime = datetime.datetime.combine(
-                target_date, 
-                datetime.time(hour, minute)
+                target_date,
+                datetime.time(*time_value)
             )
-            
-            # Проверяем, что дата в будущем
-            if target_datetime <= datetime.datetime.now():
-                return None
-                
-            return target_datetime
-            
-        except Exception:
+        
+        # Проверяем, что дата в будущем
+        if target_datetime <= now:
             return None
+        
+        return target_datetime
+    
+    def parse_datetime_input(self, date_input: str, time_input: str,
+                             now: datetime.datetime = None) -> Optional[datetime.datetime]:
+        """Парсит введенные пользователем дату и время"""
+        return self.parse_datetime_text(f"{date_input.strip()} {time_input.strip()}", now)
+
+
+# Грамматика ввода даты и времени (компилируется один раз при импорте)
+_TIME_PATTERN = r"(?P<hour>0*\d{1,2})(?:\s*[:.]\s*(?P<minute>0*\d{1,2}))?"
+
+_WEEKDAY_PATTERN = (
+    r"понедельник|вторник|сред[ау]|четверг|пятниц[ау]|суббот[ау]|воскресенье"
+    r"|пн|вт|ср|чт|пт|сб|вс"
+)
+
+_UNIT_PATTERN = r"минут[аыу]?|мин|час(?:а|ов)?|ч|день|дн(?:я|ей)|недел[юиь]"
+
+_TIME_RE = re.compile(rf"^\s*{_TIME_PATTERN}\s*$")
+
+_DATETIME_RE = re.compile(rf"""
+    ^\s*(?:
+        через \s+ (?P<amount>\d+|пол)? \s* (?P<unit>{_UNIT_PATTERN})
+      |
+        (?:
+            (?P<day>\d{{1,2}}) (?P<sep>[./-]) (?P<month>\d{{1,2}})
+            (?: (?P=sep) (?P<year>\d{{4}}|\d{{2}}) )?
+          | (?P<keyword>сегодня|завтра|послезавтра)
+          | (?:во?\s+)? (?P<weekday>{_WEEKDAY_PATTERN})
+        )
+        (?: (?:\s*,\s*|\s+) (?:в\s+)? {_TIME_PATTERN} )?
+    )\s*$
+""", re.VERBOSE | re.IGNORECASE)
+
+_KEYWORD_DAYS = {'сегодня': 0, 'завтра': 1, 'послезавтра': 2}
+
+_WEEKDAYS = {
+    'пн': 0, 'пон': 0, 'вт': 1, 'вто': 1, 'ср': 2, 'сре': 2, 'чт': 3, 'чет': 3,
+    'пт': 4, 'пят': 4, 'сб': 5, 'суб': 5, 'вс': 6, 'вос': 6
+}
+
+_UNIT_MINUTES = {'м': 1, 'ч': 60, 'д': 24 * 60, 'н': 7 * 24 * 60}
+
+
+def _match_time(match) -> Optional[Tuple[int, int]]:
+    """Достает (час, минута) из совпадения грамматики"""
+    hour = int(match.group('hour'))
+    minute = int(match.group('minute') or 0)
+    
+    # Валидация
+    if 0 <= hour <= 23 and 0 <= minute <= 59:
+        return hour, minute
+    return None
+
+
+def _match_date(match, now: datetime.datetime,
+                time_value: Optional[Tuple[int, int]]) -> Optional[datetime.date]:
+    """Достает дату из совпадения грамматики относительно now"""
+    today = now.date()
+    
+    if match.group('day'):
+        year = match.group('year')
+        if year is None:
+            year = today.year
+        elif len(year) == 2:
+            # Как %y в strptime: 00-68 -> 20xx, 69-99 -> 19xx
+            year = int(year) + (2000 if int(year) < 69 else 1900)
+        
+        try:
+            target_date = datetime.date(int(year), int(match.group('month')), int(match.group('day')))
+        except ValueError:
+            return None
+        
+        # Дата без года, которая уже прошла, - это дата в следующем году
+        if match.group('year') is None and target_date < today:
+            try:
+                target_date = target_date.replace(year=today.year + 1)
+            except ValueError:
+                return None
+        return target_date
+    
+    if match.group('keyword'):
+        return today + datetime.timedelta(days=_KEYWORD_DAYS[match.group('keyword').lower()])
+    
+    weekday_name = match.group('weekday').lower()
+    weekday = _WEEKDAYS[weekday_name[:2] if len(weekday_name) == 2 else weekday_name[:3]]
+    days_ahead = (weekday - today.weekday()) % 7
+    
+    # Сегодняшний день недели, но время уже прошло - значит, через неделю
+    if days_ahead == 0 and time_value and datetime.time(*time_value) <= now.time():
+        days_ahead = 7
+    
+    return today + datetime.timedelta(days=days_ahead)
+
+
+def _match_relative(match, now: datetime.datetime) -> datetime.datetime:
+    """Считает время для "через N минут/часов/дней/недель" """
+    amount = match.group('amount')
+    if amount is None:
+        amount = 1
+    elif amount.lower() == 'пол':
+        amount = 0.5
+    else:
+        amount = int(amount)
+    
+    minutes = amount * _UNIT_MINUTES[match.group('unit')[0].lower()]
+    target_datetime = now + datetime.timedelta(minutes=minutes)
+    
+    # Напоминания срабатывают с точностью до минуты
+    return target_datetime.replace(second=0, microsecond=0)
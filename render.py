@@ -0,0 +1,67 @@
+"""
+Модуль редактирования сообщений без лишних запросов
+
+Обработчики кнопок каждый раз заново рендерят текст и клавиатуру сообщения
+и вызывают edit_message_text, даже если на экране ничего не изменится.
+RenderCache помнит хеш последнего отрисованного текста и клавиатуры для
+каждого сообщения чата и:
+- пропускает правку, если не изменилось ничего
+- вызывает edit_message_reply_markup, если изменилась только клавиатура
+- иначе вызывает edit_message_text
+
+Кеш ограничен RENDER_CACHE_SIZE сообщениями и вытесняет самые давние.
+"""
+from collections import OrderedDict
+
+from telegram.error import BadRequest
+
+from metrics import metrics
+
+# Константы
+RENDER_CACHE_SIZE = 10000  # сообщений
+
+
+def _hash_markup(reply_markup) -> int:
+    return hash(reply_markup.to_json()) if reply_markup else hash(None)
+
+
+class RenderCache:
+    def __init__(self, max_size: int = RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        # (chat_id, message_id) -> (хеш текста, хеш клавиатуры)
+        self.rendered = OrderedDict()
+
+    def _remember(self, key, rendered):
+        self.rendered[key] = rendered
+        self.rendered.move_to_end(key)
+        if len(self.rendered) > self.max_size:
+            self.rendered.popitem(last=False)
+
+    async def edit_message_text(self, query, text: str, parse_mode: str = None,
+                                reply_markup=None):
+        """Редактирует сообщение кнопки, отправляя только то, что изменилось"""
+        key = (query.message.chat_id, query.message.message_id)
+        rendered = (hash((text, parse_mode)), _hash_markup(reply_markup))
+        previous = self.rendered.get(key)
+
+        if previous == rendered:
+            self.rendered.move_to_end(key)
+            metrics.increment('render.edits_skipped')
+            return
+
+        try:
+            if previous is not None and previous[0] == rendered[0]:
+                await query.edit_message_reply_markup(reply_markup=reply_markup)
+                metrics.increment('render.markup_only_edits')
+            else:
+                await query.edit_message_text(
+                    text, parse_mode=parse_mode, reply_markup=reply_markup
+                )
+                metrics.increment('render.text_edits')
+        except BadRequest as e:
+            # Кеш пуст (перезапуск, вытеснение), а сообщение уже в нужном виде
+            if 'message is not modified' not in str(e).lower():
+                raise
+            metrics.increment('render.edits_not_modified')
+
+        self._remember(key, rendered)
@@ -0,0 +1,51 @@
+"""
+Модуль сглаживания пиков массовой рассылки
+
+Большинство пользователей получает погоду в одни и те же минуты
+(по умолчанию 08:30), и все уведомления такой минуты упираются
+в глобальный лимит Telegram. Массовые уведомления растягиваются на окно
+вокруг номинальной минуты: каждому пользователю детерминированно
+(по хешу user_id) назначается смещение внутри окна, так что один и тот же
+пользователь каждый день получает уведомление в одно и то же время.
+
+Интерактивные ответы идут мимо outbox и сглаживанием не задерживаются.
+"""
+import datetime
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+
+def get_spread_lead(window: int) -> int:
+    """Возвращает, за сколько минут до номинальной минуты начинается окно"""
+    return max(window, 0) // 120
+
+
+def get_spread_offset(user_id: int, window: int) -> int:
+    """Возвращает смещение пользователя внутри окна в секундах (0..window-1)"""
+    if window <= 0:
+        return 0
+    # crc32 одинаков во всех процессах, в отличие от hash() со случайной солью
+    return zlib.crc32(str(user_id).encode()) % window
+
+
+def get_spread_send_at(user_id: int, nominal: datetime.datetime,
+                       window: int) -> datetime.datetime:
+    """Время отправки массового уведомления пользователю для номинальной минуты"""
+    start = nominal - datetime.timedelta(minutes=get_spread_lead(window))
+    return start + datetime.timedelta(seconds=get_spread_offset(user_id, window))
+
+
+def build_send_histogram(send_times: Iterable[datetime.datetime]) -> Dict[str, int]:
+    """Строит гистограмму отправок по секундам {'YYYY-MM-DDTHH:MM:SS': количество}"""
+    counts = Counter(send_time.isoformat()[:19] for send_time in send_times)
+    return dict(sorted(counts.items()))
+
+
+def summarize_send_histogram(histogram: Dict[str, int]) -> Dict[str, Tuple[int, int]]:
+    """Сворачивает посекундную гистограмму по минутам {'HH:MM': (отправок, пик в секунду)}"""
+    minutes = {}
+    for second, count in sorted(histogram.items()):
+        sends, peak = minutes.get(second[11:16], (0, 0))
+        minutes[second[11:16]] = (sends + count, max(peak, count))
+    return minutes
@@ -0,0 +1,147 @@
+"""
+Модуль горизонтального масштабирования планировщика
+
+Координатор (процесс с polling) запускает N процессов-воркеров.
+Пользователи разбиты на PARTITION_COUNT hash-партиций по user_id,
+каждая партиция закреплена за одним воркером в таблице scheduler_partitions.
+Воркер выполняет проверку задач и доставку outbox только для своих партиций
+на общей SQLite базе в режиме WAL.
+
+Глобальный лимит запросов к Bot API делится поровну между координатором
+(интерактивные ответы) и воркерами.
+
+Если воркер умирает, координатор сразу перераспределяет его партиции
+между живыми воркерами и через RESTART_DELAY перезапускает процесс.
+"""
+import asyncio
+import datetime
+import logging
+import multiprocessing
+import signal
+
+from telegram.ext import ApplicationBuilder
+
+import clock
+from logs import setup_logging
+from ratelimit import DEFAULT_OVERALL_RATE, PriorityRateLimiter
+from storage import PARTITION_COUNT
+
+# Константы
+MONITOR_INTERVAL = 5  # секунды
+RESTART_DELAY = 30  # секунды
+
+logger = logging.getLogger(__name__)
+
+
+def get_process_rate(worker_count: int) -> float:
+    """Доля глобального лимита запросов на один процесс (координатор + воркеры)"""
+    return DEFAULT_OVERALL_RATE / (worker_count + 1)
+
+
+def run_worker(worker_id: int, token: str, register_jobs, overall_rate: float):
+    """Точка входа процесса-воркера: только JobQueue, без получения обновлений"""
+    setup_logging()
+    app = (
+        ApplicationBuilder()
+        .token(token)
+        .updater(None)
+        .rate_limiter(PriorityRateLimiter(overall_rate))
+        .build()
+    )
+    register_jobs(app.job_queue, worker_id)
+    asyncio.run(_serve(app))
+
+
+async def _serve(app):
+    """Держит приложение воркера запущенным до SIGTERM/SIGINT"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    async with app:
+        await app.start()
+        await stop_event.wait()
+        await app.stop()
+
+
+class Coordinator:
+    def __init__(self, db, worker_count: int, token: str, register_jobs):
+        self.db = db
+        self.worker_count = worker_count
+        self.token = token
+        self.register_jobs = register_jobs
+        # spawn: воркеры не наследуют event loop и соединения координатора
+        self.mp_context = multiprocessing.get_context('spawn')
+        self.processes = {}
+        self.restart_at = {}
+        self.live_workers = ()
+
+    def start(self):
+        """Запускает всех воркеров и раздает им партиции"""
+        for worker_id in range(self.worker_count):
+            self._spawn(worker_id)
+        self.rebalance()
+
+    def stop(self):
+        """Останавливает всех воркеров"""
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=10)
+        # Координатор можно запустить снова (например, при повторном избрании лидером)
+        self.processes = {}
+        self.restart_at = {}
+        self.live_workers = ()
+
+    def _spawn(self, worker_id: int):
+        process = self.mp_context.Process(
+            target=run_worker,
+            args=(worker_id, self.token, self.register_jobs,
+                  get_process_rate(self.worker_count)),
+            name=f"butler-scheduler-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self.processes[worker_id] = process
+        self.restart_at.pop(worker_id, None)
+
+    def get_assignments(self, live_workers) -> dict:
+        """Равномерно раскладывает партиции по живым воркерам"""
+        if not live_workers:
+            return {}
+        return {
+            partition_id: live_workers[partition_id % len(live_workers)]
+            for partition_id in range(PARTITION_COUNT)
+        }
+
+    def rebalance(self):
+        """Перераспределяет партиции, если изменился набор живых воркеров"""
+        live_workers = tuple(sorted(
+            worker_id for worker_id, process in self.processes.items()
+            if process.is_alive()
+        ))
+        if live_workers == self.live_workers:
+            return
+
+        self.db.assign_partitions(self.get_assignments(live_workers))
+        self.live_workers = live_workers
+        logger.info("Партиции перераспределены между воркерами: %s", list(live_workers))
+
+    def check_workers(self):
+        """Находит упавших воркеров, перераспределяет партиции и перезапускает их"""
+        now = clock.now()
+
+        for worker_id, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+
+            restart_at = self.restart_at.get(worker_id)
+            if restart_at is None:
+                logger.warning("Воркер %s завершился (код %s)", worker_id, process.exitcode)
+                self.restart_at[worker_id] = now + datetime.timedelta(seconds=RESTART_DELAY)
+            elif now >= restart_at:
+                self._spawn(worker_id)
+
+        self.rebalance()
@@ -0,0 +1,289 @@
+"""
+Симуляция расписания бота на виртуальных часах
+
+Прогоняет задачи планировщика (погода, ежедневные и разовые задачи,
+повторные напоминания, доставка outbox) на in-memory хранилище
+с заранее засеянными пользователями и задачами. Время двигается
+через clock.SimulatedClock так быстро, как позволяет процессор:
+сутки расписания проходят за секунды.
+
+- Bot API заменен SimulatedBot, который только записывает отправки
+- WeatherAPI заменен SimulatedWeatherService с постоянным прогнозом,
+  оба подставляются через собственный контейнер сервисов (container.Services)
+- пользователи нажимают "Уже сделал" с вероятностью --complete-rate
+  через случайную задержку, остальные цепочки доходят до лимита повторов
+
+Отчет: число отправок, длины цепочек напоминаний и процессорное время
+на тик. Годится как регрессионный бенчмарк (--json для сравнения прогонов).
+
+Запуск:
+    python simulate.py                          # сутки, 1000 пользователей
+    python simulate.py --users 5000 --hours 6 --seed 7 --json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import statistics
+import time
+import types
+from collections import Counter
+
+import clock
+import main as bot_main
+from catchup import get_current_tick
+from container import Services
+from metrics import metrics
+from weather import WeatherService
+
+# Константы
+DEFAULT_USERS = 1000
+DEFAULT_HOURS = 24
+DEFAULT_SEED = 1
+MAX_DAILY_TASKS = 3  # на пользователя
+MAX_ONE_TIME_TASKS = 2  # на пользователя
+COMPLETE_RATE = 0.7  # доля напоминаний, на которые пользователь отвечает
+MAX_COMPLETE_DELAY = 90  # минуты до ответа пользователя
+
+SCHEDULER_JOBS = (
+    bot_main.send_weather_notification_for_time,
+    bot_main.check_daily_tasks,
+    bot_main.check_one_time_tasks,
+    bot_main.check_pending_reminders,
+)
+
+
+class SimulatedBot:
+    """Записывает отправленные сообщения вместо запросов к Bot API"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None, reply_markup=None, **kwargs):
+        self.sent.append({
+            'chat_id': chat_id,
+            'text': text,
+            'reply_markup': reply_markup,
+            'sent_at': clock.now(),
+        })
+        return types.SimpleNamespace(message_id=len(self.sent))
+
+
+class SimulatedWeatherService(WeatherService):
+    """Постоянный прогноз вместо запросов к WeatherAPI"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def get_weather_data(self):
+        self.requests += 1
+        day = clock.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        hours = []
+        for hour in range(24):
+            at = day + datetime.timedelta(hours=hour)
+            hours.append({
+                'time_epoch': int(at.timestamp()),
+                'time': at.strftime("%Y-%m-%d %H:%M"),
+                'temp_c': 10 + hour % 8,
+                'feelslike_c': 8 + hour % 8,
+                'wind_kph': 12.0,
+                'gust_kph': 20.0,
+                'chance_of_rain': 80 if 14 <= hour < 16 else 10,
+            })
+        return {
+            'location': {'name': 'Нижний Новгород'},
+            'current': {
+                'temp_c': 12, 'feelslike_c': 10, 'condition': {'text': 'Облачно'},
+                'wind_kph': 12.0, 'wind_dir': 'NW',
+                'last_updated_epoch': int(clock.time()),
+            },
+            'forecast': {'forecastday': [{'hour': hours}]},
+        }
+
+
+def random_time(rng: random.Random) -> str:
+    return f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"
+
+
+def seed_data(db, users: int, start: datetime.datetime, hours: int, rng: random.Random):
+    """Засевает пользователей, ежедневные и разовые задачи"""
+    span_minutes = hours * 60
+    counts = Counter()
+    for user_id in range(1, users + 1):
+        db.add_user(user_id, f"user{user_id}", f"User {user_id}")
+        db.update_user_weather_time(user_id, random_time(rng))
+        counts['users'] += 1
+
+        for index in range(rng.randint(0, MAX_DAILY_TASKS)):
+            db.add_daily_task(user_id, f"Ежедневная {index + 1}", random_time(rng))
+            counts['daily_tasks'] += 1
+
+        for index in range(rng.randint(0, MAX_ONE_TIME_TASKS)):
+            scheduled = start + datetime.timedelta(minutes=rng.randrange(1, span_minutes))
+            db.add_one_time_task(user_id, f"Разовая {index + 1}", scheduled)
+            counts['one_time_tasks'] += 1
+    return counts
+
+
+def get_reminder_buttons(reply_markup):
+    """Данные кнопок "Уже сделал" из клавиатуры отправленного сообщения"""
+    if not reply_markup:
+        return []
+    return [
+        button.callback_data.split('|')[1:]
+        for row in reply_markup.inline_keyboard for button in row
+        if button.callback_data and button.callback_data.startswith('complete|')
+    ]
+
+
+class Simulation:
+    def __init__(self, users: int = DEFAULT_USERS, hours: int = DEFAULT_HOURS,
+                 seed: int = DEFAULT_SEED, complete_rate: float = COMPLETE_RATE,
+                 start: datetime.datetime = None):
+        self.users = users
+        self.hours = hours
+        self.rng = random.Random(seed)
+        self.complete_rate = complete_rate
+        self.start = start or datetime.datetime(2025, 1, 6)
+        self.clock = clock.SimulatedClock(self.start)
+        self.bot = SimulatedBot()
+        self.weather_service = SimulatedWeatherService()
+        # Свой контейнер сервисов: in-memory хранилище и погода без WeatherAPI
+        self.services = Services('memory')
+        self.services.weather_service = self.weather_service
+        # (время ответа, тип задачи, id задачи, id напоминания)
+        self.completions = []
+        # (тип задачи, id задачи) -> число доставленных напоминаний
+        self.chains = Counter()
+        self.tick_cpu_ms = []
+
+    def _context(self, name: str):
+        return types.SimpleNamespace(
+            bot=self.bot,
+            job=types.SimpleNamespace(name=name, data={'worker_id': None})
+        )
+
+    def _observe_sends(self, first: int):
+        """Учитывает новые отправки: цепочки напоминаний и будущие ответы пользователей"""
+        for message in self.bot.sent[first:]:
+            for task_type, task_id, reminder_id in get_reminder_buttons(message['reply_markup']):
+                self.chains[(task_type, task_id)] += 1
+                if self.rng.random() < self.complete_rate:
+                    delay = datetime.timedelta(minutes=self.rng.randint(1, MAX_COMPLETE_DELAY))
+                    self.completions.append(
+                        (clock.now() + delay, task_type, int(task_id), int(reminder_id))
+                    )
+
+    def _apply_completions(self):
+        """Нажатия "Уже сделал", время которых наступило (как в handle_callback)"""
+        now = clock.now()
+        due = [item for item in self.completions if item[0] <= now]
+        if not due:
+            return
+        self.completions = [item for item in self.completions if item[0] > now]
+        for _, task_type, task_id, reminder_id in due:
+            self.services.db.submit_write(
+                bot_main.make_complete_reminder_write(task_type, task_id, reminder_id)
+            ).result()
+
+    async def _run_minute(self, minute: datetime.datetime):
+        first = len(self.bot.sent)
+        started = time.process_time()
+
+        self.clock.set(minute)
+        self._apply_completions()
+        for job in SCHEDULER_JOBS:
+            await job(self._context(job.__name__))
+
+        for offset in range(0, 60, bot_main.OUTBOX_INTERVAL):
+            self.clock.set(minute + datetime.timedelta(seconds=offset))
+            await bot_main.deliver_outbox(self._context('deliver_outbox'))
+
+        self.tick_cpu_ms.append((time.process_time() - started) * 1000)
+        self._observe_sends(first)
+
+    async def run(self) -> dict:
+        previous_clock = clock.get_clock()
+        previous_services = bot_main.services
+        clock.set_clock(self.clock)
+        bot_main.services = self.services
+        try:
+            # Разовые задачи сравниваются с тиками планировщика, а они идут в TIMEZONE
+            first_tick = get_current_tick(clock.now(bot_main.TIMEZONE))
+            seeded = seed_data(self.services.db, self.users, first_tick, self.hours, self.rng)
+            started = time.perf_counter()
+            for index in range(self.hours * 60):
+                await self._run_minute(self.start + datetime.timedelta(minutes=index))
+            wall_seconds = time.perf_counter() - started
+        finally:
+            clock.set_clock(previous_clock)
+            bot_main.services = previous_services
+        return self.report(seeded, wall_seconds)
+
+    def report(self, seeded: Counter, wall_seconds: float) -> dict:
+        cpu = sorted(self.tick_cpu_ms)
+        lengths = Counter(self.chains.values())
+        return {
+            'seeded': dict(seeded),
+            'virtual_hours': self.hours,
+            'wall_seconds': round(wall_seconds, 3),
+            'speedup': round(self.hours * 3600 / wall_seconds) if wall_seconds else None,
+            'sends': len(self.bot.sent),
+            'weather_requests': self.weather_service.requests,
+            'reminders_delivered': sum(self.chains.values()),
+            'chains': {
+                'count': len(self.chains),
+                'mean_length': round(statistics.mean(self.chains.values()), 2) if self.chains else 0,
+                'max_length': max(self.chains.values(), default=0),
+                'length_histogram': dict(sorted(lengths.items())),
+            },
+            'tick_cpu_ms': {
+                'ticks': len(cpu),
+                'mean': round(statistics.mean(cpu), 3) if cpu else 0,
+                'p50': round(cpu[len(cpu) // 2], 3) if cpu else 0,
+                'p95': round(cpu[int(len(cpu) * 0.95)], 3) if cpu else 0,
+                'max': round(cpu[-1], 3) if cpu else 0,
+            },
+            'metrics': metrics.snapshot('outbox.') | metrics.snapshot('reminders.'),
+        }
+
+
+def print_report(report: dict):
+    chains = report['chains']
+    cpu = report['tick_cpu_ms']
+    seeded = report['seeded']
+    print(f"🧪 Симуляция {report['virtual_hours']} ч за {report['wall_seconds']} с "
+          f"(x{report['speedup']})")
+    print(f"👥 Пользователей: {seeded.get('users', 0)}, ежедневных задач: "
+          f"{seeded.get('daily_tasks', 0)}, разовых: {seeded.get('one_time_tasks', 0)}")
+    print(f"📤 Отправок: {report['sends']}, напоминаний: {report['reminders_delivered']}, "
+          f"запросов погоды: {report['weather_requests']}")
+    print(f"🔁 Цепочек напоминаний: {chains['count']}, средняя длина {chains['mean_length']}, "
+          f"максимальная {chains['max_length']}")
+    print(f"   Длины цепочек: {chains['length_histogram']}")
+    print(f"⏱️ CPU на тик, мс: среднее {cpu['mean']}, p50 {cpu['p50']}, "
+          f"p95 {cpu['p95']}, максимум {cpu['max']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Симуляция расписания Butler Bot")
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--hours', type=int, default=DEFAULT_HOURS)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--complete-rate', type=float, default=COMPLETE_RATE,
+                        help="доля напоминаний, на которые пользователь отвечает")
+    parser.add_argument('--json', action='store_true', help="отчет в JSON")
+    args = parser.parse_args()
+
+    simulation = Simulation(args.users, args.hours, args.seed, args.complete_rate)
+    report = asyncio.run(simulation.run())
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1040 @@
+"""
+Модуль интерфейса хранилища данных
+
+Storage описывает все операции, которые бот выполняет с данными:
+пользователи, ежедневные и разовые задачи, история напоминаний,
+outbox и партиции планировщика. Реализации:
+- database.Database - SQLite (основное хранилище)
+- MemoryStorage - in-memory движок на индексированных словарях и кучах
+  для бенчмарков и тестов с симулированным временем
+"""
+import datetime
+import heapq
+import itertools
+import re
+import secrets
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Sequence, Tuple
+
+import clock
+from catchup import TICK_FORMAT, get_time_of_day_bounds, time_in_bounds
+
+# Количество hash-партиций user_id для распределения работы планировщика
+PARTITION_COUNT = 64
+# Сколько задач возвращает поиск /find
+SEARCH_LIMIT = 10
+# Слово для поиска - буквы и цифры (как у токенизатора unicode61 в SQLite FTS5)
+SEARCH_WORD_PATTERN = re.compile(r"[^\W_]+")
+# Счетчики статистики по дням (get_stats)
+DAILY_STATS = ('sends', 'reminder_chains', 'reminder_chains_completed')
+# Типы задач (task_type в callback_data, истории напоминаний и общих задачах)
+TASK_TYPES = ('daily', 'one_time')
+# Случайные байты токена приглашения в общую задачу (в ссылке - 16 символов base64)
+INVITE_TOKEN_BYTES = 12
+
+
+def _fold_search_char(char: str) -> str:
+    # remove_diacritics в FTS5 снимает диакритику только с латиницы (é -> e, но й остается)
+    base = unicodedata.normalize('NFD', char)[0]
+    return base if base < '\u0250' else char
+
+
+def get_search_terms(text: str) -> List[str]:
+    """Слова текста так, как их видит индекс FTS5: без регистра, ё -> е"""
+    folded = "".join(map(_fold_search_char, text.casefold().replace('ё', 'е')))
+    return SEARCH_WORD_PATTERN.findall(folded)
+
+
+def check_task_type(task_type: str):
+    """Проверяет тип задачи, иначе ValueError (чтобы не писать строки с чужим типом)"""
+    if task_type not in TASK_TYPES:
+        raise ValueError(f"Неизвестный тип задачи: {task_type}")
+
+
+def new_invite_token() -> str:
+    """Случайный токен приглашения: id задач идут подряд, и ссылку по id можно подобрать"""
+    return secrets.token_urlsafe(INVITE_TOKEN_BYTES)
+
+
+def get_partition(user_id: int) -> int:
+    """Возвращает номер партиции для пользователя (совпадает с SQL-выражением)"""
+    return abs(user_id) % PARTITION_COUNT
+
+
+class Storage(ABC):
+    """Интерфейс хранилища данных бота"""
+
+    @contextmanager
+    def transaction(self):
+        """Открывает транзакцию; соединение передается в методы через conn="""
+        yield None
+
+    def submit_write(self, work) -> Future:
+        """Выполняет work(conn) в транзакции, результат - в Future (по умолчанию сразу)"""
+        future = Future()
+        try:
+            with self.transaction() as conn:
+                result = work(conn)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        return future
+
+    # Пользователи
+
+    @abstractmethod
+    def add_user(self, user_id: int, username: str = None, first_name: str = None):
+        """Добавляет пользователя"""
+
+    @abstractmethod
+    def ensure_user(self, user_id: int, username: str = None, first_name: str = None):
+        """Добавляет пользователя, если его еще нет (настройки существующего не сбрасываются)"""
+
+    @abstractmethod
+    def mark_user_unreachable(self, user_id: int, error: str = None):
+        """Помечает чат недоступным и снимает его сообщения из outbox"""
+
+    @abstractmethod
+    def mark_user_reachable(self, user_id: int) -> bool:
+        """Снова включает чат, True - если он был недоступен"""
+
+    @abstractmethod
+    def get_user_weather_settings(self, user_id: int) -> Dict:
+        """Получает настройки погоды пользователя"""
+
+    @abstractmethod
+    def update_user_weather_time(self, user_id: int, weather_time: str):
+        """Обновляет время получения погоды для пользователя"""
+
+    @abstractmethod
+    def toggle_weather_notifications(self, user_id: int) -> bool:
+        """Переключает уведомления о погоде для пользователя"""
+
+    @abstractmethod
+    def get_users_for_weather_window(self, after: datetime.datetime, until: datetime.datetime,
+                                     partitions: Sequence[int] = None) -> List[Dict]:
+        """Получает пользователей, чье время погоды попадает в окно тиков (after, until]"""
+
+    # Ежедневные задачи
+
+    @abstractmethod
+    def add_daily_task(self, user_id: int, task_name: str, time: str) -> int:
+        """Добавляет ежедневную задачу"""
+
+    @abstractmethod
+    def get_user_daily_tasks(self, user_id: int) -> List[Dict]:
+        """Получает все активные ежедневные задачи пользователя"""
+
+    @abstractmethod
+    def delete_daily_task(self, task_id: int):
+        """Удаляет ежедневную задачу"""
+
+    @abstractmethod
+    def get_tasks_for_window(self, after: datetime.datetime, until: datetime.datetime,
+                             partitions: Sequence[int] = None) -> List[Dict]:
+        """Получает ежедневные задачи, чье время попадает в окно тиков (after, until]"""
+
+    # Разовые задачи
+
+    @abstractmethod
+    def add_one_time_task(self, user_id: int, task_name: str,
+                          scheduled_datetime: datetime.datetime) -> int:
+        """Добавляет одноразовую задачу"""
+
+    @abstractmethod
+    def get_user_one_time_tasks(self, user_id: int) -> List[Dict]:
+        """Получает все активные одноразовые задачи пользователя"""
+
+    @abstractmethod
+    def complete_one_time_task(self, task_id: int, conn=None):
+        """Отмечает одноразовую задачу как выполненную"""
+
+    @abstractmethod
+    def delete_one_time_task(self, task_id: int):
+        """Удаляет одноразовую задачу"""
+
+    @abstractmethod
+    def get_one_time_tasks_for_window(self, after: datetime.datetime, until: datetime.datetime,
+                                      partitions: Sequence[int] = None) -> List[Dict]:
+        """Получает одноразовые задачи, запланированные на окно тиков (after, until]"""
+
+    # Общие задачи
+
+    @abstractmethod
+    def get_task(self, task_type: str, task_id: int) -> Optional[Dict]:
+        """Получает активную задачу по типу и id (с владельцем)"""
+
+    @abstractmethod
+    def add_task_member(self, task_type: str, task_id: int, user_id: int) -> bool:
+        """Добавляет участника общей задачи, True - если он присоединился сейчас"""
+
+    @abstractmethod
+    def remove_task_member(self, task_type: str, task_id: int, user_id: int) -> bool:
+        """
+        Убирает участника общей задачи и закрывает его открытые цепочки напоминаний;
+        True - если он был участником
+        """
+
+    @abstractmethod
+    def get_task_members(self, task_type: str, task_id: int) -> List[int]:
+        """Получает участников общей задачи (пусто - задача личная)"""
+
+    @abstractmethod
+    def get_invite_token(self, task_type: str, task_id: int) -> str:
+        """Получает токен приглашения в задачу (создается при первом запросе)"""
+
+    @abstractmethod
+    def get_task_by_invite(self, token: str) -> Optional[Dict]:
+        """Получает активную задачу по токену приглашения (как get_task)"""
+
+    # История напоминаний
+
+    @abstractmethod
+    def add_reminder_history(self, user_id: int, task_type: str, task_id: int,
+                             reminder_time: datetime.datetime,
+                             next_reminder: datetime.datetime = None, conn=None) -> int:
+        """Добавляет запись в историю напоминаний"""
+
+    @abstractmethod
+    def update_reminder_history(self, reminder_id: int,
+                                next_reminder: datetime.datetime = None, conn=None):
+        """Обновляет историю напоминаний"""
+
+    @abstractmethod
+    def complete_reminder(self, reminder_id: int, conn=None) -> int:
+        """
+        Отмечает напоминание и открытые цепочки той же задачи у того же участника
+        как выполненные; возвращает число живых цепочек остальных текущих участников
+        (у личной задачи - 0)
+        """
+
+    @abstractmethod
+    def supersede_reminder_chains(self, task_keys: Sequence, max_reminders: int,
+                                  conn=None) -> Tuple[int, int]:
+        """Закрывает незавершенные цепочки (task_type, task_id, user_id): (цепочки, повторы)"""
+
+    @abstractmethod
+    def get_pending_reminders(self, partitions: Sequence[int] = None) -> List[Dict]:
+        """Получает все активные напоминания, которые нужно отправить"""
+
+    @abstractmethod
+    def get_task_name(self, task_type: str, task_id: int) -> Optional[str]:
+        """Получает название задачи по типу и id"""
+
+    # Outbox
+
+    @abstractmethod
+    def enqueue_message(self, chat_id: int, text: str, parse_mode: str = None,
+                        reply_markup: str = None, label: str = None,
+                        send_at: datetime.datetime = None, conn=None) -> int:
+        """Кладет сообщение в outbox (send_at - не раньше этого времени)"""
+
+    @abstractmethod
+    def get_due_outbox_messages(self, limit: int, partitions: Sequence[int] = None,
+                                lookahead_seconds: float = 0) -> List[Dict]:
+        """Получает готовые сообщения outbox (и ближайшие сообщения тех же чатов)"""
+
+    @abstractmethod
+    def mark_outbox_sent(self, message_ids: Sequence[int]):
+        """Отмечает сообщения outbox как доставленные"""
+
+    @abstractmethod
+    def reschedule_outbox_messages(self, message_ids: Sequence[int],
+                                   next_attempt_at: datetime.datetime, error: str):
+        """Планирует повторную попытку доставки сообщений outbox"""
+
+    @abstractmethod
+    def dead_letter_outbox_messages(self, message_ids: Sequence[int], error: str):
+        """Переводит сообщения outbox в dead-letter"""
+
+    @abstractmethod
+    def get_outbox_send_histogram(self, start: datetime.datetime, end: datetime.datetime,
+                                  partitions: Sequence[int] = None) -> Dict[str, int]:
+        """Считает ожидающие сообщения outbox по секундам плановой отправки"""
+
+    @abstractmethod
+    def purge_sent_outbox_messages(self, before: datetime.datetime) -> int:
+        """Удаляет доставленные сообщения outbox старше указанного времени"""
+
+    @abstractmethod
+    def search_tasks(self, user_id: int, query: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
+        """
+        Ищет активные задачи пользователя по началам слов названия
+
+        Лучшие совпадения первыми; элементы - {'task_type', 'id', 'task_name'}
+        и 'time' (ежедневные) или 'scheduled_datetime' (разовые)
+        """
+
+    # Статистика
+
+    @abstractmethod
+    def get_stats(self, days: int = 7) -> Dict:
+        """
+        Сводка для администратора за постоянное время
+
+        {'totals': {счетчик: значение}, 'daily': {'YYYY-MM-DD': {счетчик: значение}}}
+        за последние days дней; счетчики ведутся при записи, а не считаются запросом
+        """
+
+    # Квоты внешних API
+
+    @abstractmethod
+    def add_api_calls(self, api: str, periods: Sequence[str], calls: int = 1):
+        """Добавляет запросы к API в счетчики периодов (например, 'YYYY-MM-DD' и 'YYYY-MM')"""
+
+    @abstractmethod
+    def get_api_calls(self, api: str, periods: Sequence[str]) -> Dict[str, int]:
+        """Получает число запросов к API по периодам (нет записи - 0)"""
+
+    # Партиции планировщика
+
+    @abstractmethod
+    def assign_partitions(self, assignments: Dict[int, int]):
+        """Сохраняет распределение партиций {partition_id: worker_id}"""
+
+    @abstractmethod
+    def get_worker_partitions(self, worker_id: int) -> List[int]:
+        """Получает партиции, закрепленные за воркером"""
+
+    @abstractmethod
+    def acquire_lease(self, name: str, holder: str, lease_seconds: float) -> bool:
+        """Захватывает или продлевает аренду, если она свободна, истекла или уже своя"""
+
+    @abstractmethod
+    def release_lease(self, name: str, holder: str):
+        """Освобождает аренду, если она принадлежит holder"""
+
+    @abstractmethod
+    def get_scheduler_ticks(self, job: str,
+                            partitions: Sequence[int] = None) -> Dict[int, Optional[str]]:
+        """Получает последний обработанный тик задачи по партициям (None - еще не было)"""
+
+    @abstractmethod
+    def set_scheduler_ticks(self, job: str, partitions: Optional[Sequence[int]],
+                            tick: datetime.datetime, conn=None):
+        """Сохраняет последний обработанный тик задачи для партиций"""
+
+
+def _timestamp() -> str:
+    """Аналог CURRENT_TIMESTAMP в SQLite (UTC)"""
+    return clock.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _in_partitions(user_id: int, partitions: Optional[Sequence[int]]) -> bool:
+    return partitions is None or get_partition(user_id) in partitions
+
+
+class MemoryStorage(Storage):
+    """
+    In-memory хранилище
+
+    Данные лежат в словарях по id, выборки по времени идут через индексы
+    (время -> множество id), а очереди с временем срабатывания (повторы
+    напоминаний и outbox) - через кучи с ленивым удалением устаревших записей.
+    Транзакции не поддерживают откат: операции применяются сразу.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.users_by_weather_time = {}
+
+        self.daily_tasks = {}
+        self.daily_tasks_by_time = {}
+        self.daily_tasks_by_user = {}
+
+        self.one_time_tasks = {}
+        self.one_time_tasks_by_minute = {}
+        self.one_time_tasks_by_user = {}
+
+        # (тип задачи, id задачи) -> участники по порядку присоединения (только общие задачи)
+        self.task_members = {}
+        # Приглашения в общие задачи: токен -> (тип задачи, id задачи) и обратно
+        self.task_invites = {}
+        self.invite_tokens = {}
+
+        self.reminders = {}
+        self.reminders_heap = []
+        # (тип задачи, id задачи, user_id) -> открытые цепочки
+        self.open_reminders_by_task = {}
+
+        self.outbox = {}
+        self.outbox_heap = []
+
+        # Счетчики сводки get_stats: имя -> значение, (день, имя) -> значение
+        self.stats = defaultdict(int)
+        self.daily_stats = defaultdict(int)
+
+        # (api, период) -> число запросов
+        self.api_usage = defaultdict(int)
+
+        self.partitions = {}
+        self.scheduler_ticks = {}
+        self.leases = {}
+        self._ids = {}
+
+    def _next_id(self, table: str) -> int:
+        if table not in self._ids:
+            self._ids[table] = itertools.count(1)
+        return next(self._ids[table])
+
+    def _count(self, name: str, delta: int = 1, day: str = None):
+        if day is None:
+            self.stats[name] += delta
+        else:
+            self.daily_stats[(day, name)] += delta
+
+    # Пользователи
+
+    def add_user(self, user_id: int, username: str = None, first_name: str = None):
+        old = self.users.get(user_id)
+        if old:
+            self.users_by_weather_time[old['weather_time']].discard(user_id)
+            self._count('users', -1)
+            self._count('users_unreachable', -(not old['is_reachable']))
+            self._count('weather_subscribers', -old['weather_notifications'])
+        self._count('users')
+        self._count('weather_subscribers')
+
+        # Как INSERT OR REPLACE: настройки сбрасываются к значениям по умолчанию
+        self.users[user_id] = {
+            'user_id': user_id,
+            'username': username,
+            'first_name': first_name,
+            'weather_notifications': True,
+            'weather_time': '08:30',
+            'is_reachable': True,
+            'created_at': _timestamp()
+        }
+        self.users_by_weather_time.setdefault('08:30', set()).add(user_id)
+
+    def ensure_user(self, user_id: int, username: str = None, first_name: str = None):
+        if user_id not in self.users:
+            self.add_user(user_id, username, first_name)
+
+    def _is_reachable(self, user_id: int) -> bool:
+        user = self.users.get(user_id)
+        return bool(user and user['is_reachable'])
+
+    def mark_user_unreachable(self, user_id: int, error: str = None):
+        user = self.users.get(user_id)
+        if user:
+            self._count('users_unreachable', user['is_reachable'])
+            user['is_reachable'] = False
+        for message in self.outbox.values():
+            if message['chat_id'] == user_id and message['status'] == 'pending':
+                self._count('outbox_pending', -1)
+                message['status'] = 'dead'
+                message['last_error'] = error or 'chat unreachable'
+
+    def mark_user_reachable(self, user_id: int) -> bool:
+        user = self.users.get(user_id)
+        if user and not user['is_reachable']:
+            user['is_reachable'] = True
+            self._count('users_unreachable', -1)
+            return True
+        return False
+
+    def get_user_weather_settings(self, user_id: int) -> Dict:
+        user = self.users.get(user_id)
+        if user:
+            return {
+                'notifications_enabled': user['weather_notifications'],
+                'weather_time': user['weather_time']
+            }
+        return {'notifications_enabled': True, 'weather_time': '08:30'}
+
+    def update_user_weather_time(self, user_id: int, weather_time: str):
+        user = self.users.get(user_id)
+        if not user:
+            return
+        self.users_by_weather_time[user['weather_time']].discard(user_id)
+        user['weather_time'] = weather_time
+        self.users_by_weather_time.setdefault(weather_time, set()).add(user_id)
+
+    def toggle_weather_notifications(self, user_id: int) -> bool:
+        user = self.users.get(user_id)
+        if not user:
+            return True
+        user['weather_notifications'] = not user['weather_notifications']
+        self._count('weather_subscribers', 1 if user['weather_notifications'] else -1)
+        return user['weather_notifications']
+
+    def _get_users_for_weather_time(self, time_str: str,
+                                    partitions: Sequence[int] = None) -> List[Dict]:
+        result = []
+        for user_id in self.users_by_weather_time.get(time_str, ()):
+            user = self.users[user_id]
+            if (user['weather_notifications'] and user['is_reachable']
+                    and _in_partitions(user_id, partitions)):
+                result.append({
+                    'user_id': user_id,
+                    'first_name': user['first_name'],
+                    'weather_time': user['weather_time']
+                })
+        return result
+
+    def get_users_for_weather_window(self, after: datetime.datetime, until: datetime.datetime,
+                                     partitions: Sequence[int] = None) -> List[Dict]:
+        bounds = get_time_of_day_bounds(after, until)
+        result = []
+        for time_str in list(self.users_by_weather_time):
+            if time_in_bounds(time_str, bounds):
+                result.extend(self._get_users_for_weather_time(time_str, partitions))
+        return result
+
+    # Ежедневные задачи
+
+    def add_daily_task(self, user_id: int, task_name: str, time: str) -> int:
+        task_id = self._next_id('daily_tasks')
+        self.daily_tasks[task_id] = {
+            'id': task_id,
+            'user_id': user_id,
+            'task_name': task_name,
+            'time': time,
+            'is_active': True,
+            'created_at': _timestamp()
+        }
+        self.daily_tasks_by_time.setdefault(time, set()).add(task_id)
+        self.daily_tasks_by_user.setdefault(user_id, set()).add(task_id)
+        self._count('daily_tasks_active')
+        return task_id
+
+    def get_user_daily_tasks(self, user_id: int) -> List[Dict]:
+        tasks = [self.daily_tasks[task_id] for task_id in self.daily_tasks_by_user.get(user_id, ())]
+        tasks.sort(key=lambda task: (task['time'], task['id']))
+        return [
+            {
+                'id': task['id'],
+                'task_name': task['task_name'],
+                'time': task['time'],
+                'created_at': task['created_at']
+            }
+            for task in tasks
+        ]
+
+    def delete_daily_task(self, task_id: int):
+        task = self.daily_tasks.get(task_id)
+        if task and task['is_active']:
+            task['is_active'] = False
+            self._count('daily_tasks_active', -1)
+            self.daily_tasks_by_time[task['time']].discard(task_id)
+            self.daily_tasks_by_user[task['user_id']].discard(task_id)
+
+    def _get_tasks_for_time(self, target_time: str,
+                            partitions: Sequence[int] = None) -> List[Dict]:
+        result = []
+        for task_id in self.daily_tasks_by_time.get(target_time, ()):
+            task = self.daily_tasks[task_id]
+            if not _in_partitions(task['user_id'], partitions):
+                continue
+            for user, shared in self._get_recipients('daily', task):
+                result.append({
+                    'task_id': task_id,
+                    'user_id': user['user_id'],
+                    'task_name': task['task_name'],
+                    'time': task['time'],
+                    'first_name': user['first_name'],
+                    'shared': shared
+                })
+        return result
+
+    def get_tasks_for_window(self, after: datetime.datetime, until: datetime.datetime,
+                             partitions: Sequence[int] = None) -> List[Dict]:
+        bounds = get_time_of_day_bounds(after, until)
+        result = []
+        for time_str in list(self.daily_tasks_by_time):
+            if time_in_bounds(time_str, bounds):
+                result.extend(self._get_tasks_for_time(time_str, partitions))
+        return result
+
+    # Разовые задачи
+
+    def add_one_time_task(self, user_id: int, task_name: str,
+                          scheduled_datetime: datetime.datetime) -> int:
+        task_id = self._next_id('one_time_tasks')
+        minute = scheduled_datetime.strftime("%Y-%m-%d %H:%M")
+        self.one_time_tasks[task_id] = {
+            'id': task_id,
+            'user_id': user_id,
+            'task_name': task_name,
+            'scheduled_datetime': scheduled_datetime.isoformat(),
+            'minute': minute,
+            'created_at': _timestamp()
+        }
+        self.one_time_tasks_by_minute.setdefault(minute, set()).add(task_id)
+        self.one_time_tasks_by_user.setdefault(user_id, set()).add(task_id)
+        self._count('one_time_tasks_active')
+        return task_id
+
+    def get_user_one_time_tasks(self, user_id: int) -> List[Dict]:
+        tasks = [self.one_time_tasks[task_id]
+                 for task_id in self.one_time_tasks_by_user.get(user_id, ())]
+        tasks.sort(key=lambda task: (task['scheduled_datetime'], task['id']))
+        return [
+            {
+                'id': task['id'],
+                'task_name': task['task_name'],
+                'scheduled_datetime': task['scheduled_datetime'],
+                'created_at': task['created_at']
+            }
+            for task in tasks
+        ]
+
+    def _deactivate_one_time_task(self, task_id: int):
+        # Индексы хранят только активные и невыполненные задачи
+        task = self.one_time_tasks.get(task_id)
+        if task:
+            if task_id in self.one_time_tasks_by_minute.get(task['minute'], ()):
+                self._count('one_time_tasks_active', -1)
+            self.one_time_tasks_by_minute.get(task['minute'], set()).discard(task_id)
+            self.one_time_tasks_by_user.get(task['user_id'], set()).discard(task_id)
+
+    def complete_one_time_task(self, task_id: int, conn=None):
+        self._deactivate_one_time_task(task_id)
+
+    def delete_one_time_task(self, task_id: int):
+        self._deactivate_one_time_task(task_id)
+
+    def _get_one_time_tasks_for_time(self, target_datetime: datetime.datetime,
+                                     partitions: Sequence[int] = None) -> List[Dict]:
+        minute = target_datetime.strftime("%Y-%m-%d %H:%M")
+        result = []
+        for task_id in self.one_time_tasks_by_minute.get(minute, ()):
+            task = self.one_time_tasks[task_id]
+            if not _in_partitions(task['user_id'], partitions):
+                continue
+            for user, shared in self._get_recipients('one_time', task):
+                result.append({
+                    'task_id': task_id,
+                    'user_id': user['user_id'],
+                    'task_name': task['task_name'],
+                    'scheduled_datetime': task['scheduled_datetime'],
+                    'first_name': user['first_name'],
+                    'shared': shared
+                })
+        return result
+
+    def get_one_time_tasks_for_window(self, after: datetime.datetime, until: datetime.datetime,
+                                      partitions: Sequence[int] = None) -> List[Dict]:
+        result = []
+        minute = after + datetime.timedelta(minutes=1)
+        while minute <= until:
+            result.extend(self._get_one_time_tasks_for_time(minute, partitions))
+            minute += datetime.timedelta(minutes=1)
+        return result
+
+    # Общие задачи
+
+    def _get_recipients(self, task_type: str, task: Dict) -> List[Tuple[Dict, bool]]:
+        """Доступные получатели задачи: участники общей задачи или владелец"""
+        members = self.task_members.get((task_type, task['id']))
+        user_ids = members or (task['user_id'],)
+        return [
+            (self.users[user_id], bool(members))
+            for user_id in user_ids if self._is_reachable(user_id)
+        ]
+
+    def get_task(self, task_type: str, task_id: int) -> Optional[Dict]:
+        check_task_type(task_type)
+        if task_type == 'daily':
+            task = self.daily_tasks.get(task_id)
+            if not task or not task['is_active']:
+                return None
+            when = {'time': task['time']}
+        else:
+            task = self.one_time_tasks.get(task_id)
+            # Индекс пользователя хранит только активные и невыполненные задачи
+            if not task or task_id not in self.one_time_tasks_by_user.get(task['user_id'], ()):
+                return None
+            when = {'scheduled_datetime': task['scheduled_datetime']}
+        return {
+            'task_type': task_type,
+            'id': task_id,
+            'user_id': task['user_id'],
+            'task_name': task['task_name'],
+            **when
+        }
+
+    def add_task_member(self, task_type: str, task_id: int, user_id: int) -> bool:
+        check_task_type(task_type)
+        tasks = self.daily_tasks if task_type == 'daily' else self.one_time_tasks
+        task = tasks.get(task_id)
+        if not task:
+            return False
+        members = self.task_members.setdefault((task_type, task_id), {task['user_id']: None})
+        if user_id in members:
+            return False
+        members[user_id] = None
+        return True
+
+    def remove_task_member(self, task_type: str, task_id: int, user_id: int) -> bool:
+        check_task_type(task_type)
+        members = self.task_members.get((task_type, task_id))
+        if not members or user_id not in members:
+            return False
+        del members[user_id]
+        if len(members) == 1:
+            # Остался один владелец - задача снова личная
+            del self.task_members[(task_type, task_id)]
+        # Вышедший участник больше не получает повторы
+        superseded_at = clock.now().isoformat()
+        for reminder_id in self.open_reminders_by_task.pop((task_type, task_id, user_id), ()):
+            reminder = self.reminders[reminder_id]
+            if reminder['next_reminder'] is not None:
+                reminder['next_reminder'] = None
+                reminder['superseded_at'] = superseded_at
+        return True
+
+    def get_task_members(self, task_type: str, task_id: int) -> List[int]:
+        return list(self.task_members.get((task_type, task_id), ()))
+
+    def get_invite_token(self, task_type: str, task_id: int) -> str:
+        check_task_type(task_type)
+        token = self.invite_tokens.get((task_type, task_id))
+        if token is None:
+            token = new_invite_token()
+            self.invite_tokens[(task_type, task_id)] = token
+            self.task_invites[token] = (task_type, task_id)
+        return token
+
+    def get_task_by_invite(self, token: str) -> Optional[Dict]:
+        invite = self.task_invites.get(token)
+        return self.get_task(*invite) if invite else None
+
+    # История напоминаний
+
+    def add_reminder_history(self, user_id: int, task_type: str, task_id: int,
+                             reminder_time: datetime.datetime,
+                             next_reminder: datetime.datetime = None, conn=None) -> int:
+        reminder_id = self._next_id('reminder_history')
+        self.reminders[reminder_id] = {
+            'id': reminder_id,
+            'user_id': user_id,
+            'task_type': task_type,
+            'task_id': task_id,
+            'reminder_time': reminder_time.isoformat(),
+            'is_completed': False,
+            'next_reminder': next_reminder.isoformat() if next_reminder else None,
+            'reminder_count': 1,
+            'superseded_at': None
+        }
+        self.open_reminders_by_task.setdefault((task_type, task_id, user_id), set()).add(reminder_id)
+        self._count('reminder_chains')
+        self._count('reminder_chains', day=reminder_time.isoformat()[:10])
+        if next_reminder:
+            heapq.heappush(self.reminders_heap, (next_reminder.isoformat(), reminder_id))
+        return reminder_id
+
+    def update_reminder_history(self, reminder_id: int,
+                                next_reminder: datetime.datetime = None, conn=None):
+        reminder = self.reminders.get(reminder_id)
+        if not reminder:
+            return
+        reminder['reminder_count'] += 1
+        reminder['next_reminder'] = next_reminder.isoformat() if next_reminder else None
+        if next_reminder:
+            heapq.heappush(self.reminders_heap, (reminder['next_reminder'], reminder_id))
+
+    def complete_reminder(self, reminder_id: int, conn=None) -> int:
+        reminder = self.reminders.get(reminder_id)
+        if not reminder:
+            return 0
+        
+        task_key = (reminder['task_type'], reminder['task_id'], reminder['user_id'])
+        for open_id in self.open_reminders_by_task.pop(task_key, set()) | {reminder_id}:
+            if not self.reminders[open_id]['is_completed']:
+                self._count('reminder_chains_completed')
+                self._count('reminder_chains_completed',
+                            day=self.reminders[open_id]['reminder_time'][:10])
+            self.reminders[open_id]['is_completed'] = True
+            self.reminders[open_id]['next_reminder'] = None
+
+        return sum(
+            1
+            for member_id in self.task_members.get(task_key[:2], ())
+            for open_id in self.open_reminders_by_task.get(task_key[:2] + (member_id,), ())
+            if not self.reminders[open_id]['is_completed']
+            and self.reminders[open_id]['next_reminder'] is not None
+        )
+
+    def supersede_reminder_chains(self, task_keys: Sequence, max_reminders: int,
+                                  conn=None) -> Tuple[int, int]:
+        superseded_at = clock.now().isoformat()
+        chains = suppressed = 0
+
+        for task_key in set(task_keys):
+            # Закрытые цепочки больше не держим в индексе открытых
+            for reminder_id in self.open_reminders_by_task.pop(task_key, ()):
+                reminder = self.reminders[reminder_id]
+                if reminder['next_reminder'] is None:
+                    continue
+                reminder['next_reminder'] = None
+                reminder['superseded_at'] = superseded_at
+                chains += 1
+                suppressed += max(max_reminders - reminder['reminder_count'], 0)
+
+        return chains, suppressed
+
+    def get_pending_reminders(self, partitions: Sequence[int] = None) -> List[Dict]:
+        current_time = clock.now().isoformat()
+        due = []
+        seen = set()
+
+        while self.reminders_heap and self.reminders_heap[0][0] <= current_time:
+            entry = heapq.heappop(self.reminders_heap)
+            next_reminder, reminder_id = entry
+            reminder = self.reminders[reminder_id]
+
+            # Устаревшая запись кучи: напоминание выполнено или перенесено
+            if reminder['is_completed'] or reminder['next_reminder'] != next_reminder:
+                continue
+            if reminder_id in seen:
+                continue
+            seen.add(reminder_id)
+            due.append(entry)
+
+        # Напоминание остается в очереди, пока его не обновят или не выполнят
+        for entry in due:
+            heapq.heappush(self.reminders_heap, entry)
+
+        return [
+            {
+                'id': reminder_id,
+                'user_id': self.reminders[reminder_id]['user_id'],
+                'task_type': self.reminders[reminder_id]['task_type'],
+                'task_id': self.reminders[reminder_id]['task_id'],
+                'next_reminder': next_reminder,
+                'reminder_count': self.reminders[reminder_id]['reminder_count']
+            }
+            for next_reminder, reminder_id in due
+            if self._is_reachable(self.reminders[reminder_id]['user_id'])
+            and _in_partitions(self.reminders[reminder_id]['user_id'], partitions)
+        ]
+
+    def get_task_name(self, task_type: str, task_id: int) -> Optional[str]:
+        tasks = self.daily_tasks if task_type == 'daily' else self.one_time_tasks
+        task = tasks.get(task_id)
+        return task['task_name'] if task else None
+
+    # Outbox
+
+    def enqueue_message(self, chat_id: int, text: str, parse_mode: str = None,
+                        reply_markup: str = None, label: str = None,
+                        send_at: datetime.datetime = None, conn=None) -> int:
+        message_id = self._next_id('outbox')
+        next_attempt_at = (send_at or clock.now()).isoformat()
+        self.outbox[message_id] = {
+            'id': message_id,
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': parse_mode,
+            'reply_markup': reply_markup,
+            'label': label,
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': next_attempt_at,
+            'last_error': None,
+            'sent_at': None
+        }
+        heapq.heappush(self.outbox_heap, (next_attempt_at, message_id))
+        self._count('outbox_pending')
+        return message_id
+
+    def get_due_outbox_messages(self, limit: int, partitions: Sequence[int] = None,
+                                lookahead_seconds: float = 0) -> List[Dict]:
+        now = clock.now()
+        current_time = now.isoformat()
+        lookahead_time = (now + datetime.timedelta(seconds=lookahead_seconds)).isoformat()
+        popped = []
+        due_chats = set()
+
+        while self.outbox_heap and self.outbox_heap[0][0] <= lookahead_time:
+            entry = heapq.heappop(self.outbox_heap)
+            message = self.outbox.get(entry[1])
+
+            if (not message or message['status'] != 'pending'
+                    or message['next_attempt_at'] != entry[0]):
+                continue
+            popped.append(entry)
+            if entry[0] <= current_time and _in_partitions(message['chat_id'], partitions):
+                due_chats.add(message['chat_id'])
+
+        # Возвращаем записи в кучу: статус меняют mark_outbox_sent и reschedule
+        for entry in popped:
+            heapq.heappush(self.outbox_heap, entry)
+
+        return [
+            {
+                'id': message_id,
+                'chat_id': self.outbox[message_id]['chat_id'],
+                'text': self.outbox[message_id]['text'],
+                'parse_mode': self.outbox[message_id]['parse_mode'],
+                'reply_markup': self.outbox[message_id]['reply_markup'],
+                'label': self.outbox[message_id]['label'],
+                'attempts': self.outbox[message_id]['attempts']
+            }
+            for _, message_id in popped
+            if self.outbox[message_id]['chat_id'] in due_chats
+        ][:limit]
+
+    def mark_outbox_sent(self, message_ids: Sequence[int]):
+        sent_at = clock.now().isoformat()
+        for message_id in message_ids:
+            message = self.outbox.get(message_id)
+            if message:
+                if message['status'] == 'pending':
+                    self._count('outbox_pending', -1)
+                if message['status'] != 'sent':
+                    self._count('sends', day=sent_at[:10])
+                message['status'] = 'sent'
+                message['sent_at'] = sent_at
+                message['attempts'] += 1
+
+    def reschedule_outbox_messages(self, message_ids: Sequence[int],
+                                   next_attempt_at: datetime.datetime, error: str):
+        for message_id in message_ids:
+            message = self.outbox.get(message_id)
+            if message:
+                message['attempts'] += 1
+                message['next_attempt_at'] = next_attempt_at.isoformat()
+                message['last_error'] = error
+                heapq.heappush(self.outbox_heap, (message['next_attempt_at'], message_id))
+
+    def dead_letter_outbox_messages(self, message_ids: Sequence[int], error: str):
+        for message_id in message_ids:
+            message = self.outbox.get(message_id)
+            if message:
+                if message['status'] == 'pending':
+                    self._count('outbox_pending', -1)
+                message['status'] = 'dead'
+                message['attempts'] += 1
+                message['last_error'] = error
+
+    def get_outbox_send_histogram(self, start: datetime.datetime, end: datetime.datetime,
+                                  partitions: Sequence[int] = None) -> Dict[str, int]:
+        start_str = start.isoformat()
+        end_str = end.isoformat()
+        counts = defaultdict(int)
+        for message in self.outbox.values():
+            if (message['status'] == 'pending'
+                    and start_str <= message['next_attempt_at'] < end_str
+                    and _in_partitions(message['chat_id'], partitions)):
+                counts[message['next_attempt_at'][:19]] += 1
+        return dict(sorted(counts.items()))
+
+    def purge_sent_outbox_messages(self, before: datetime.datetime) -> int:
+        before_str = before.isoformat()
+        purged = [
+            message_id for message_id, message in self.outbox.items()
+            if message['status'] == 'sent' and message['sent_at'] < before_str
+        ]
+        for message_id in purged:
+            del self.outbox[message_id]
+        return len(purged)
+
+    def search_tasks(self, user_id: int, query: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
+        terms = get_search_terms(query)
+        if not terms:
+            return []
+        candidates = [
+            ('daily', self.daily_tasks[task_id])
+            for task_id in self.daily_tasks_by_user.get(user_id, ())
+        ] + [
+            ('one_time', self.one_time_tasks[task_id])
+            for task_id in self.one_time_tasks_by_user.get(user_id, ())
+        ]
+
+        scored = []
+        for task_type, task in candidates:
+            words = get_search_terms(task['task_name'])
+            matches = [sum(word.startswith(term) for word in words) for term in terms]
+            if all(matches):
+                # Как у bm25: больше совпадений в более коротком названии - выше
+                scored.append((-sum(matches) / len(words), task_type, task))
+        scored.sort(key=lambda item: (item[0], item[2]['id']))
+
+        result = []
+        for _, task_type, task in scored[:limit]:
+            found = {'task_type': task_type, 'id': task['id'], 'task_name': task['task_name']}
+            if task_type == 'daily':
+                found['time'] = task['time']
+            else:
+                found['scheduled_datetime'] = task['scheduled_datetime']
+            result.append(found)
+        return result
+
+    # Статистика
+
+    def get_stats(self, days: int = 7) -> Dict:
+        today = clock.now().date()
+        daily = {}
+        for offset in range(days - 1, -1, -1):
+            day = (today - datetime.timedelta(days=offset)).isoformat()
+            for name in DAILY_STATS:
+                if (day, name) in self.daily_stats:
+                    daily.setdefault(day, {})[name] = self.daily_stats[(day, name)]
+        return {'totals': dict(self.stats), 'daily': daily}
+
+    # Квоты внешних API
+
+    def add_api_calls(self, api: str, periods: Sequence[str], calls: int = 1):
+        for period in periods:
+            self.api_usage[(api, period)] += calls
+
+    def get_api_calls(self, api: str, periods: Sequence[str]) -> Dict[str, int]:
+        return {period: self.api_usage.get((api, period), 0) for period in periods}
+
+    # Партиции планировщика
+
+    def assign_partitions(self, assignments: Dict[int, int]):
+        self.partitions = dict(assignments)
+
+    def get_worker_partitions(self, worker_id: int) -> List[int]:
+        return sorted(
+            partition_id for partition_id, owner in self.partitions.items()
+            if owner == worker_id
+        )
+
+    def acquire_lease(self, name: str, holder: str, lease_seconds: float) -> bool:
+        now = clock.time()
+        current = self.leases.get(name)
+        if current and current[0] != holder and current[1] >= now:
+            return False
+        self.leases[name] = (holder, now + lease_seconds)
+        return True
+
+    def release_lease(self, name: str, holder: str):
+        if self.leases.get(name, (None,))[0] == holder:
+            del self.leases[name]
+
+    def get_scheduler_ticks(self, job: str,
+                            partitions: Sequence[int] = None) -> Dict[int, Optional[str]]:
+        if partitions is None:
+            partitions = range(PARTITION_COUNT)
+        return {
+            partition_id: self.scheduler_ticks.get((job, partition_id))
+            for partition_id in partitions
+        }
+
+    def set_scheduler_ticks(self, job: str, partitions: Optional[Sequence[int]],
+                            tick: datetime.datetime, conn=None):
+        if partitions is None:
+            partitions = range(PARTITION_COUNT)
+        tick_str = tick.strftime(TICK_FORMAT)
+        for partition_id in partitions:
+            self.scheduler_ticks[(job, partition_id)] = tick_str
+
+
+def create_storage(backend: str = 'sqlite', **kwargs) -> Storage:
+    """Создает хранилище по имени движка ('sqlite' или 'memory')"""
+    if backend == 'sqlite':
+        from database import Database
+        return Database(**kwargs)
+    if backend == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Неизвестный движок хранилища: {backend}")
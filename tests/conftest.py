@@ -0,0 +1,40 @@
+"""
+Общие фикстуры тестов
+
+storage - каждый тест контракта Storage проходит на обоих движках
+(MemoryStorage и Database на временном файле SQLite) с одинаковыми
+ожиданиями, так что расхождение движков сразу видно. Время - виртуальное.
+"""
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clock
+from database import Database
+from storage import MemoryStorage
+
+START = datetime.datetime(2025, 1, 6, 9, 0)
+
+
+@pytest.fixture
+def sim_clock():
+    previous = clock.get_clock()
+    simulated = clock.SimulatedClock(START)
+    clock.set_clock(simulated)
+    yield simulated
+    clock.set_clock(previous)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(request, tmp_path, sim_clock):
+    if request.param == 'memory':
+        yield MemoryStorage()
+        return
+    db = Database(str(tmp_path / 'butler_test.db'))
+    yield db
+    if db._writer is not None:
+        db._writer.close()
@@ -0,0 +1,133 @@
+"""Тесты потока-писателя GroupCommitWriter (group commit с SAVEPOINT на операцию)"""
+import sqlite3
+import threading
+
+import pytest
+
+from database import GroupCommitWriter
+from metrics import metrics
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'group_commit.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT NOT NULL)")
+    return path
+
+
+@pytest.fixture
+def writer(db_path):
+    writer = GroupCommitWriter(db_path)
+    yield writer
+    writer.close()
+
+
+def insert(value):
+    def work(conn):
+        return conn.execute("INSERT INTO items (value) VALUES (?)", (value,)).lastrowid
+    return work
+
+
+def insert_and_fail(value):
+    def work(conn):
+        conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+        raise RuntimeError(value)
+    return work
+
+
+def read_values(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT value FROM items ORDER BY id")]
+
+
+def hold_writer(writer):
+    """Занимает поток-писатель, пока не установлено событие: следующие операции копятся в одну пачку"""
+    started, release = threading.Event(), threading.Event()
+
+    def work(conn):
+        started.set()
+        release.wait(5)
+
+    future = writer.submit(work)
+    assert started.wait(5)
+    return future, release
+
+
+def test_future_resolves_after_commit(writer, db_path):
+    row_id = writer.submit(insert('a')).result(timeout=5)
+
+    assert row_id == 1
+    # Результат приходит после COMMIT: запись видна из другого соединения
+    assert read_values(db_path) == ['a']
+
+
+def test_failed_operation_rolls_back_only_its_savepoint(writer, db_path):
+    held, release = hold_writer(writer)
+    futures = [
+        writer.submit(insert('before')),
+        writer.submit(insert_and_fail('broken')),
+        writer.submit(insert('after')),
+    ]
+    release.set()
+    held.result(timeout=5)
+
+    assert futures[0].result(timeout=5) is not None
+    with pytest.raises(RuntimeError, match='broken'):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) is not None
+    assert read_values(db_path) == ['before', 'after']
+    # Все три операции ушли одной транзакцией
+    assert metrics.get('db.group_commit.last_batch_size') == 3
+
+
+def test_operations_apply_in_submission_order(writer, db_path):
+    held, release = hold_writer(writer)
+    futures = [writer.submit(insert(str(index))) for index in range(50)]
+    release.set()
+
+    row_ids = [future.result(timeout=5) for future in futures]
+    assert row_ids == sorted(row_ids)
+    assert read_values(db_path) == [str(index) for index in range(50)]
+
+
+def test_batch_is_limited_by_max_ops(db_path):
+    writer = GroupCommitWriter(db_path, max_ops=4)
+    try:
+        held, release = hold_writer(writer)
+        futures = [writer.submit(insert(str(index))) for index in range(10)]
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        assert metrics.get('db.group_commit.last_batch_size') <= 4
+    finally:
+        writer.close()
+    assert len(read_values(db_path)) == 10
+
+
+def test_close_flushes_queued_operations(db_path):
+    writer = GroupCommitWriter(db_path)
+    held, release = hold_writer(writer)
+    futures = [writer.submit(insert(str(index))) for index in range(5)]
+    release.set()
+    writer.close()
+
+    assert all(future.done() for future in futures)
+    assert read_values(db_path) == [str(index) for index in range(5)]
+
+
+def test_failed_begin_fails_every_future(writer, db_path):
+    # Чужая транзакция держит блокировку записи: BEGIN IMMEDIATE не проходит
+    blocker = sqlite3.connect(db_path, timeout=0, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        futures = [writer.submit(insert('a')), writer.submit(insert('b'))]
+        for future in futures:
+            with pytest.raises(sqlite3.OperationalError):
+                future.result(timeout=30)
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+
+    assert writer.submit(insert('c')).result(timeout=5) is not None
+    assert read_values(db_path) == ['c']
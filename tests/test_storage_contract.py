@@ -0,0 +1,146 @@
+"""
+Контракт Storage, общий для обоих движков
+
+Каждый тест идет на MemoryStorage и на Database (фикстура storage)
+с одними и теми же ожиданиями.
+"""
+import datetime
+import types
+
+import pytest
+
+import clock
+import main as bot_main
+
+OWNER, MEMBER = 1, 2
+
+
+@pytest.fixture
+def users(storage):
+    for user_id in (OWNER, MEMBER):
+        storage.add_user(user_id, f"user{user_id}", f"User {user_id}")
+
+
+@pytest.fixture
+def services(storage, monkeypatch):
+    """Обработчики main работают с тестовым хранилищем"""
+    monkeypatch.setattr(bot_main, 'services', types.SimpleNamespace(db=storage))
+
+
+def add_one_time_task(storage, user_id=OWNER):
+    return storage.add_one_time_task(user_id, "Отчет", clock.now() + datetime.timedelta(hours=1))
+
+
+def add_due_chain(storage, user_id, task_type, task_id):
+    """Открытая цепочка напоминаний, повтор которой уже наступил"""
+    now = clock.now()
+    return storage.add_reminder_history(user_id, task_type, task_id, now,
+                                        now - datetime.timedelta(minutes=1))
+
+
+def pending_users(storage):
+    return sorted(reminder['user_id'] for reminder in storage.get_pending_reminders())
+
+
+def complete(storage, task_type, task_id, reminder_id):
+    """То же, что нажатие "Уже сделал" в handle_callback"""
+    return storage.submit_write(
+        bot_main.make_complete_reminder_write(task_type, task_id, reminder_id)
+    ).result(timeout=5)
+
+
+def test_submit_write_resolves_with_result(storage, users):
+    future = storage.submit_write(lambda conn: storage.add_reminder_history(
+        OWNER, 'daily', 1, clock.now(), conn=conn
+    ))
+    assert future.result(timeout=5) >= 1
+
+
+def test_personal_task_completion_closes_task(storage, users, services):
+    task_id = add_one_time_task(storage)
+    reminder_id = add_due_chain(storage, OWNER, 'one_time', task_id)
+
+    assert complete(storage, 'one_time', task_id, reminder_id) == 0
+    assert storage.get_task('one_time', task_id) is None
+    assert pending_users(storage) == []
+
+
+def test_shared_task_closes_after_every_member_completes(storage, users, services):
+    task_id = add_one_time_task(storage)
+    assert storage.add_task_member('one_time', task_id, MEMBER)
+    owner_chain = add_due_chain(storage, OWNER, 'one_time', task_id)
+    member_chain = add_due_chain(storage, MEMBER, 'one_time', task_id)
+
+    assert complete(storage, 'one_time', task_id, owner_chain) == 1
+    assert storage.get_task('one_time', task_id) is not None
+    assert pending_users(storage) == [MEMBER]
+
+    assert complete(storage, 'one_time', task_id, member_chain) == 0
+    assert storage.get_task('one_time', task_id) is None
+
+
+def test_leaving_closes_member_chains(storage, users, services):
+    task_id = add_one_time_task(storage)
+    storage.add_task_member('one_time', task_id, MEMBER)
+    owner_chain = add_due_chain(storage, OWNER, 'one_time', task_id)
+    add_due_chain(storage, MEMBER, 'one_time', task_id)
+
+    assert storage.remove_task_member('one_time', task_id, MEMBER)
+    assert pending_users(storage) == [OWNER]
+    # Остался один владелец: задача снова личная
+    assert storage.get_task_members('one_time', task_id) == []
+
+    assert complete(storage, 'one_time', task_id, owner_chain) == 0
+    assert storage.get_task('one_time', task_id) is None
+
+
+def test_remove_non_member(storage, users):
+    task_id = add_one_time_task(storage)
+    assert not storage.remove_task_member('one_time', task_id, MEMBER)
+
+
+def test_add_task_member_makes_owner_a_member(storage, users):
+    task_id = storage.add_daily_task(OWNER, "Планерка", "10:00")
+
+    assert storage.add_task_member('daily', task_id, MEMBER)
+    assert not storage.add_task_member('daily', task_id, MEMBER)
+    assert storage.get_task_members('daily', task_id) == [OWNER, MEMBER]
+
+
+def test_invite_token(storage, users):
+    task_id = storage.add_daily_task(OWNER, "Планерка", "10:00")
+    token = storage.get_invite_token('daily', task_id)
+
+    assert token == storage.get_invite_token('daily', task_id)
+    assert token != storage.get_invite_token('one_time', add_one_time_task(storage))
+    assert storage.get_task_by_invite(token)['id'] == task_id
+    assert storage.get_task_by_invite(f"{task_id}") is None
+
+    storage.delete_daily_task(task_id)
+    assert storage.get_task_by_invite(token) is None
+
+
+@pytest.mark.parametrize('method, args', [
+    ('get_task', (1,)),
+    ('add_task_member', (1, MEMBER)),
+    ('remove_task_member', (1, MEMBER)),
+    ('get_invite_token', (1,)),
+])
+def test_unknown_task_type_is_rejected(storage, users, method, args):
+    add_one_time_task(storage)
+    with pytest.raises(ValueError):
+        getattr(storage, method)('bogus', *args)
+    assert storage.get_task_members('bogus', 1) == []
+
+
+def test_api_calls(storage):
+    assert storage.get_api_calls('weatherapi', ('2025-01-06', '2025-01')) == {
+        '2025-01-06': 0, '2025-01': 0
+    }
+    storage.add_api_calls('weatherapi', ('2025-01-06', '2025-01'))
+    storage.add_api_calls('weatherapi', ('2025-01',), 2)
+    storage.add_api_calls('other', ('2025-01',))
+
+    assert storage.get_api_calls('weatherapi', ('2025-01-06', '2025-01')) == {
+        '2025-01-06': 1, '2025-01': 3
+    }
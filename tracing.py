@@ -0,0 +1,235 @@
+"""
+Модуль легковесной трассировки обновлений и задач планировщика
+
+Когда нажатие кнопки отвечает медленно, трасса показывает, куда ушло время:
+в SQLite, WeatherAPI или Bot API.
+- каждое обновление (lanes.UserLaneProcessor) и каждый запуск задачи
+  планировщика (trace_job) получает свой trace_id
+- внутри трассы пишутся вложенные спаны: методы Database (trace_methods),
+  WeatherService.get_weather_data и запросы к Bot API (ratelimit)
+- текущие трасса и спан хранятся в contextvars, поэтому спаны правильно
+  вкладываются и в параллельных задачах asyncio, и в asyncio.to_thread
+- завершенная трасса выгружается строкой JSON в ротируемый файл через
+  очередь и фоновый поток, если она попала в выборку TRACE_SAMPLE_RATE
+  или длилась дольше TRACE_SLOW_MS
+- после setup_tracing записи лога внутри трассы получают поле trace_id,
+  так что по трассе из файла находятся ее строки в логах
+
+Спаны пишутся только внутри трассы, вне трассы обертки почти ничего не стоят.
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from logs import DroppingQueueHandler
+from metrics import metrics
+
+# Константы
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '1000'))
+TRACE_MAX_SPANS = 200  # спанов в одной трассе
+TRACE_FILE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_FILE_BACKUPS = 5
+TRACE_QUEUE_SIZE = 1000  # трасс
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+_current_span = contextvars.ContextVar('span', default=None)
+
+_export_logger = logging.getLogger('tracing.export')
+_export_logger.propagate = False
+_listener = None
+
+
+class Trace:
+    def __init__(self, name: str, attrs: dict):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.sampled = random.random() < TRACE_SAMPLE_RATE
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.dropped_spans = 0
+        # Номера спанов выдаются при входе: дочерние спаны могут идти параллельно
+        self.span_ids = itertools.count(1)
+
+    def to_json(self, duration_ms: float, error: str = None) -> str:
+        return json.dumps({
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'start': self.started_at,
+            'duration_ms': round(duration_ms, 3),
+            'sampled': self.sampled,
+            'error': error,
+            'attrs': self.attrs,
+            'spans': self.spans,
+            'dropped_spans': self.dropped_spans,
+        }, ensure_ascii=False, default=str)
+
+
+def get_trace_id() -> Optional[str]:
+    """trace_id текущей трассы (None - вне трассы)"""
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def _make_record_factory(base_factory):
+    """
+    Фабрика записей лога, добавляющая trace_id текущей трассы
+
+    Запись создается в потоке вызывающего кода, где видны contextvars;
+    JsonFormatter в фоновом потоке логов выводит trace_id как поле extra.
+    """
+    def factory(*args, **kwargs) -> logging.LogRecord:
+        record = base_factory(*args, **kwargs)
+        trace_id = get_trace_id()
+        if trace_id is not None:
+            record.trace_id = trace_id
+        return record
+    return factory
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """Начинает новую трассу; по завершении она выгружается, если нужна"""
+    trace = Trace(name, attrs)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    error = None
+    try:
+        yield trace
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        duration_ms = (time.perf_counter() - trace.started) * 1000
+        metrics.increment('tracing.traces')
+        if trace.sampled or duration_ms >= TRACE_SLOW_MS:
+            _export(trace, duration_ms, error)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Вложенный спан текущей трассы (вне трассы ничего не делает)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    span_id = next(trace.span_ids)
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        if len(trace.spans) >= TRACE_MAX_SPANS:
+            trace.dropped_spans += 1
+        else:
+            trace.spans.append({
+                'id': span_id,
+                'parent': parent_id,
+                'name': name,
+                'offset_ms': round((started - trace.started) * 1000, 3),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'error': error,
+                **attrs,
+            })
+
+
+def traced(name: str):
+    """Декоратор: выполняет функцию (обычную или async) внутри спана"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(prefix: str, exclude=()):
+    """Декоратор класса: оборачивает в спаны его публичные методы"""
+    def decorator(cls):
+        for attr_name, value in list(vars(cls).items()):
+            if (attr_name.startswith('_') or attr_name in exclude
+                    or not inspect.isfunction(value)):
+                continue
+            setattr(cls, attr_name, traced(f"{prefix}.{attr_name}")(value))
+        return cls
+    return decorator
+
+
+def trace_job(callback):
+    """Оборачивает задачу JobQueue: каждый запуск - отдельная трасса"""
+    @functools.wraps(callback)
+    async def wrapper(context):
+        with start_trace(f"job.{callback.__name__}",
+                         job=context.job.name if context.job else None):
+            return await callback(context)
+    return wrapper
+
+
+def _export(trace: Trace, duration_ms: float, error: str):
+    if _listener is None:
+        return
+    metrics.increment('tracing.exported')
+    _export_logger.info(trace.to_json(duration_ms, error))
+
+
+def setup_tracing(path: str, max_bytes: int = TRACE_FILE_MAX_BYTES,
+                  backups: int = TRACE_FILE_BACKUPS):
+    """Включает выгрузку трасс в ротируемый JSONL файл (один раз на процесс)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+    )
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+    queue_handler = DroppingQueueHandler(queue.Queue(TRACE_QUEUE_SIZE))
+
+    _export_logger.handlers[:] = [queue_handler]
+    _export_logger.setLevel(logging.INFO)
+    # trace_id в логах ставится только при включенной трассировке, импорт модуля logging не трогает
+    logging.setLogRecordFactory(_make_record_factory(logging.getLogRecordFactory()))
+    _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler)
+    _listener.start()
+    atexit.register(stop_tracing)
+
+
+def stop_tracing():
+    """Дописывает оставшиеся трассы и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
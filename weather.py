@@ -7,14 +7,27 @@
 - Скорости и направления ветра  
 - Погодных условий и осадков
 - Влажности воздуха
+- Почасового прогноза на оставшуюся часть дня (из того же ответа API)
+
+Ответ API кэшируется: обновление не чаще WEATHER_REFRESH_INTERVAL,
+а с бюджетом квоты (quota.WeatherQuota) - с интервалом, который он задает.
+Когда бюджет исчерпан или API недоступен, сообщение строится по последним
+данным с указанием их возраста.
 
 Координаты: Нижний Новгород (56.313398, 44.051441)
 """
-import requests
+import logging
 import os
-from dotenv import load_dotenv
+import threading
+
+import requests
+
+import clock
+from metrics import metrics
+from quota import WEATHER_REFRESH_INTERVAL
+from tracing import traced
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Константы
 NIZHNY_NOVGOROD_COORDS = "56.313398,44.051441"
@@ -36,12 +49,115 @@ WIND_THRESHOLDS = {
     'MODERATE': 10
 }
 
+# Вероятность дождя (%), начиная с которой час попадает в окно дождя
+RAIN_CHANCE_THRESHOLD = 50
+
+# Перепад температуры за день, при котором советуем одеваться слоями
+TEMP_SPREAD_THRESHOLD = 8
+
+# Пауза перед повторным запросом после ошибки API (секунды)
+WEATHER_RETRY_INTERVAL = 60
+# Возраст данных, начиная с которого сообщение показывает, когда они получены
+WEATHER_STALE_AGE = 3600  # секунды
+
+
+def format_age(seconds: float) -> str:
+    """Возраст данных: '40 мин' или '3 ч 5 мин'"""
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60} мин"
+
+def analyze_forecast(weather_data, from_epoch=None):
+    """
+    Сводка почасового прогноза на оставшуюся часть дня за один проход
+
+    Берет часы из forecast.forecastday[0].hour начиная с текущего часа
+    (по current.last_updated_epoch, если from_epoch не задан) и считает
+    минимум/максимум температуры, пик ветра и окна вероятного дождя.
+    Возвращает None, если в ответе нет почасового прогноза.
+    """
+    try:
+        hours = weather_data['forecast']['forecastday'][0]['hour']
+    except (KeyError, IndexError, TypeError):
+        return None
+    
+    if from_epoch is None:
+        from_epoch = weather_data.get('current', {}).get('last_updated_epoch', 0)
+    start_epoch = from_epoch - from_epoch % 3600
+    
+    summary = None
+    window = None
+    
+    for hour in hours:
+        if hour['time_epoch'] < start_epoch:
+            continue
+        
+        time_str = hour['time'][-5:]
+        temp_c = hour['temp_c']
+        feels_like_c = hour['feelslike_c']
+        wind_kph = hour['wind_kph']
+        gust_kph = hour.get('gust_kph', wind_kph)
+        chance_of_rain = hour.get('chance_of_rain', 0)
+        
+        if summary is None:
+            summary = {
+                'min_temp_c': temp_c,
+                'max_temp_c': temp_c,
+                'min_feels_like_c': feels_like_c,
+                'max_wind_kph': wind_kph,
+                'max_wind_time': time_str,
+                'max_gust_kph': gust_kph,
+                'max_chance_of_rain': chance_of_rain,
+                'rain_windows': [],
+                'hours': 0
+            }
+        else:
+            if temp_c < summary['min_temp_c']:
+                summary['min_temp_c'] = temp_c
+            if temp_c > summary['max_temp_c']:
+                summary['max_temp_c'] = temp_c
+            if feels_like_c < summary['min_feels_like_c']:
+                summary['min_feels_like_c'] = feels_like_c
+            if wind_kph > summary['max_wind_kph']:
+                summary['max_wind_kph'] = wind_kph
+                summary['max_wind_time'] = time_str
+            if gust_kph > summary['max_gust_kph']:
+                summary['max_gust_kph'] = gust_kph
+            if chance_of_rain > summary['max_chance_of_rain']:
+                summary['max_chance_of_rain'] = chance_of_rain
+        
+        summary['hours'] += 1
+        
+        # Окна дождя: подряд идущие часы с вероятностью выше порога
+        if chance_of_rain >= RAIN_CHANCE_THRESHOLD:
+            hour_end_str = f"{(int(time_str[:2]) + 1) % 24:02d}:00"
+            if window is None:
+                window = {'start': time_str, 'end': hour_end_str, 'max_chance': chance_of_rain}
+                summary['rain_windows'].append(window)
+            else:
+                window['end'] = hour_end_str
+                window['max_chance'] = max(window['max_chance'], chance_of_rain)
+        else:
+            window = None
+    
+    return summary
+
 class WeatherService:
-    def __init__(self):
+    def __init__(self, quota=None, refresh_interval: float = WEATHER_REFRESH_INTERVAL):
         self.api_key = os.environ.get('WEATHER_API_TOKEN')
         self.base_url = API_BASE_URL
         self.location = NIZHNY_NOVGOROD_COORDS
+        # Бюджет запросов (quota.WeatherQuota); без него - обновление раз в refresh_interval
+        self.quota = quota
+        self.refresh_interval = refresh_interval
+        # Кэш последнего ответа API и время его получения (clock.time())
+        self._lock = threading.Lock()
+        self._data = None
+        self._fetched_at = None
+        self._failed_at = None
     
+    @traced('weather.get_weather_data')
     def get_weather_data(self):
         """Получает данные о погоде"""
         try:
@@ -56,13 +172,54 @@ class WeatherService:
             response.raise_for_status()
             return response.json()
         except Exception as e:
-            print(f"Ошибка получения погоды: {e}")
+            logger.error("Ошибка получения погоды: %s", e, extra={'sample_key': 'weather.fetch'})
             return None
     
-    def get_clothing_recommendation(self, temp_c, feels_like_c, wind_kph, condition):
-        """Рекомендует одежду в зависимости от погоды"""
+    def get_cached_weather_data(self):
+        """
+        Данные о погоде из кэша, при необходимости обновленные
+
+        Возвращает (данные, возраст в секундах) или (None, None), если данных
+        нет. Бюджет квоты спрашивается только когда кэш старше refresh_interval,
+        так что свежий кэш не стоит ни запроса к API, ни запроса к хранилищу.
+        """
+        with self._lock:
+            now = clock.time()
+            age = now - self._fetched_at if self._data is not None else None
+            if age is not None and age < self.refresh_interval:
+                metrics.increment('weather.cache_hits')
+                return self._data, age
+            
+            interval = self.quota.get_refresh_interval() if self.quota else self.refresh_interval
+            if interval is None:
+                # Бюджет на сутки исчерпан: только последние данные
+                metrics.increment('weather.quota.exhausted')
+                return self._data, age
+            if age is not None and age < interval:
+                metrics.increment('weather.cache_hits')
+                return self._data, age
+            if self._failed_at is not None and now - self._failed_at < WEATHER_RETRY_INTERVAL:
+                return self._data, age
+            
+            if self.quota:
+                self.quota.record_call()
+            data = self.get_weather_data()
+            if not data:
+                self._failed_at = now
+                return self._data, age
+            
+            self._data, self._fetched_at, self._failed_at = data, now, None
+            return data, 0
+    
+    def get_clothing_recommendation(self, temp_c, feels_like_c, wind_kph, condition, forecast=None):
+        """Рекомендует одежду в зависимости от погоды (и прогноза на день, если есть)"""
         clothing = []
         
+        # С прогнозом одеваемся по самому холодному и ветреному часу дня
+        if forecast:
+            feels_like_c = min(feels_like_c, forecast['min_feels_like_c'])
+            wind_kph = max(wind_kph, forecast['max_wind_kph'])
+        
         # Базовая одежда по температуре ощущения
         if feels_like_c >= TEMP_THRESHOLDS['HOT']:
             clothing.append("👕 футболка")
@@ -90,18 +247,44 @@ class WeatherService:
         rain_keywords = ['дождь', 'ливень', 'морось', 'дождливо']
         snow_keywords = ['снег', 'метель', 'вьюга', 'снежно']
         
-        if any(word in condition_lower for word in rain_keywords):
+        rain_expected = bool(forecast and forecast['rain_windows'])
+        
+        if any(word in condition_lower for word in rain_keywords) or rain_expected:
             clothing.append("☂️ зонт или дождевик")
         elif any(word in condition_lower for word in snow_keywords):
             clothing.append("❄️ теплая зимняя одежда с капюшоном")
         
+        # Большой перепад температуры за день
+        if forecast and forecast['max_temp_c'] - forecast['min_temp_c'] >= TEMP_SPREAD_THRESHOLD:
+            clothing.append("🧣 одежда слоями - днём будет заметно теплее/холоднее")
+        
         return clothing
     
+    def format_forecast_summary(self, forecast):
+        """Форматирует сводку прогноза на оставшуюся часть дня"""
+        lines = [
+            f"🌡️ от {forecast['min_temp_c']}°C до {forecast['max_temp_c']}°C",
+            f"💨 ветер до {forecast['max_wind_kph']} км/ч (около {forecast['max_wind_time']})"
+        ]
+        
+        if forecast['rain_windows']:
+            windows = ", ".join(
+                f"{window['start']}–{window['end']} ({window['max_chance']}%)"
+                for window in forecast['rain_windows']
+            )
+            lines.append(f"☔ дождь вероятен: {windows}")
+        else:
+            lines.append(f"☀️ без дождя (вероятность до {forecast['max_chance_of_rain']}%)")
+        
+        return chr(10).join(lines)
+    
     def format_weather_message(self):
         """Форматирует сообщение о погоде"""
-        weather_data = self.get_weather_data()
+        weather_data, age = self.get_cached_weather_data()
         
         if not weather_data:
+            if self.quota and self.quota.get_refresh_interval() is None:
+                return "❌ Лимит запросов к сервису погоды на сегодня исчерпан, попробуйте завтра"
             return "❌ Не удалось получить данные о погоде"
         
         try:
@@ -114,17 +297,37 @@ class WeatherService:
             wind_kph = current['wind_kph']
             wind_dir = current['wind_dir']
             
+            # Прогноз на день из того же ответа API (с текущего часа, даже если данные из кэша)
+            forecast = analyze_forecast(
+                weather_data, current.get('last_updated_epoch', 0) + int(age)
+            )
+            
             # Получаем рекомендации по одежде
-            clothing = self.get_clothing_recommendation(temp_c, feels_like_c, wind_kph, condition)
+            clothing = self.get_clothing_recommendation(
+                temp_c, feels_like_c, wind_kph, condition, forecast
+            )
             
             message = f"""🌤️ *Погода в {location['name']}*
 
 🌡️ *Температура:* {temp_c}°C (ощущается как {feels_like_c}°C)
 ☁️ *Погода:* {condition}
 💨 *Ветер:* {wind_kph} км/ч, {wind_dir}
-
+"""
+            
+            if forecast:
+                message += f"""
+📈 *Прогноз до конца дня:*
+{self.format_forecast_summary(forecast)}
+"""
+            
+            message += f"""
 👔 *Рекомендации по одежде:*
 {chr(10).join([f"• {item}" for item in clothing])}
+"""
+            
+            if age >= WEATHER_STALE_AGE:
+                message += f"""
+🕒 _Данные получены {format_age(age)} назад_
 """
             
             return message